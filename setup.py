@@ -13,6 +13,7 @@ setup(
            'geo_sac_compact  = geometric_saccade_detector.conversions.compact_data:main',
            'geo_sac_to_flydradb  = geometric_saccade_detector.conversions.to_flydra_db:main',
            'geo_sac_detect_flydra  = geometric_saccade_detector.main_flydra_db_detect:main',
+           'geo_sac_benchmark  = geometric_saccade_detector.benchmark:main',
         ]
       },
       
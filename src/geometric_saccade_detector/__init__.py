@@ -12,4 +12,10 @@ logger.setLevel(logging.DEBUG)
 from .well_formed_saccade import *
 from .structures import *
 from .math_utils import * 
+from .circular import *
+from .geometry import *
+from .suppression import *
+from .segmentation import *
+from .cache import *
+from .profiling import *
 from .well_formed_saccade import *
@@ -1,9 +1,24 @@
-from . import (check_saccade_is_well_formed, merge_fields, compute_derivative,
-    find_indices_in_bounds, get_orientation_and_dispersion, normalize_pi, smooth1d,
-    normalize_180, saccade_dtype, annotation_dtype, np, saccade_description)
+from . import (validate_saccades, merged_array, compute_derivative,
+    find_branch_windows, get_branch_geometry, suppress_non_maxima,
+    count_nearby, find_segments, normalize_pi, smooth1d, cached_stage,
+    normalize_180, saccade_dtype, annotation_dtype, np, saccade_description,
+    DEFAULT_DISPERSION_ESTIMATOR, get_profile, get_window_bounds,
+    has_enough_points)
+from functools import reduce
+
+# Segments shorter than this are skipped by the detector.
+MINIMUM_SEGMENT_LENGTH = 6
+
+# Minimum angular velocity (deg/s) for a saccade candidate.
+MIN_ANGULAR_VELOCITY_DEG = 100
+
+# Thresholds checked by get_kinematic_candidates().
+KINEMATIC_THRESHOLDS = ['min_linear_velocity', 'max_linear_acceleration',
+                        'max_angular_velocity']
 
                                                     
-def geometric_saccade_detect(rows, params):
+def geometric_saccade_detect(rows, params, cache=None, annotate=True,
+                             profile=None):
     ''' 
         Detects saccades in a log fragment. 
     
@@ -19,12 +34,46 @@ def geometric_saccade_detect(rows, params):
           ``minimum_interval_sec``,
           ``max_linear_acceleration``,
           ``max_angular_velocity``.
+          
+        Optionally, it can contain:
+          ``uniform_fast_path`` (default: True): if the frames are 
+          consecutive and the windows are constant offsets (evenly 
+          spaced timestamps), they are not stored, and the geometry is
+          computed using strided views of the data. 
+          ``max_gap_sec`` (default: ``deltaT_outer_sec``): the rows are
+          split in segments with the same obj_id and no gaps larger 
+          than this, which are processed independently. The rows of
+          each segment must be consecutive (ValueError otherwise).
+          ``dispersion_estimator`` (default: 'wrapped_std'): how the 
+          dispersion of each branch is computed; 'circular_std' is 
+          faster (see DISPERSION_ESTIMATORS in geometry.py).
+          ``lazy_geometry`` (default: True): the geometry is computed 
+          only for the points that satisfy the criteria on velocity, 
+          acceleration, and angular velocity, unless the annotations 
+          are requested. The saccades found are the same.
+          ``coarse_step`` (default: None): if given, the approximate,
+          coarse-to-fine mode of detect_in_segment_approx() (in 
+          approximate.py) is used, with its parameters
+          ``coarse_tolerance_deg`` (default: None, which gives the 
+          same saccades as the exact detection) and 
+          ``refinement_margin_sec`` (default: ``minimum_interval_sec``).
+          In this mode ``annotate`` must be False, and the cache is 
+          not used.
+        
+        If cache (a StageCache) is given, the intermediate stages 
+        that do not depend on the thresholds are memoized on disk.
+        
+        If profile (a StageProfile) is given, the time spent in each 
+        stage and some counters are recorded in it.
         
         Returns a tuple of two np arrays. 
         The first is the saccade array (using saccade_dtype),
         the other is a copy of rows with additional fields
-        describing the intermediate computation, useful for debug
-        purposes.
+        (annotation_dtype) describing the intermediate computation, 
+        useful for debug purposes; if rows already has some of these
+        fields, they are replaced. If ``annotate`` is False, the annotations are not
+        computed and the second element is None; this uses much less 
+        memory. 
     '''
     minimum_acceptable_length = 30
     
@@ -32,13 +81,110 @@ def geometric_saccade_detect(rows, params):
     if not isinstance(rows, np.ndarray):
         raise ValueError('Expected ndarray, not %s' % rows.__class__.__name__)
     
+    if len(rows) <= minimum_acceptable_length:
+        raise ValueError('I cannot do much with only %s entries.' % len(rows))
+    
+    if annotate:
+        # Allocate the result once; the annotations are written 
+        # directly into its fields.
+        annotated_rows, annotations = merged_array(rows, annotation_dtype,
+                                                   ignore_duplicates=True)
+    else:
+        annotated_rows, annotations = None, None
+    
+    saccades, _ = geometric_saccade_detect_raw(rows, params, cache=cache,
+                                               annotate=annotate,
+                                               annotations=annotations,
+                                               profile=profile)
+    
+    with get_profile(profile).stage('assembly'):
+        saccades_array = assemble_saccades(saccades)
+
+    return saccades_array, annotated_rows
+
+
+def geometric_saccade_detect_raw(rows, params, cache=None, annotate=True,
+                                 annotations=None, profile=None):
+    ''' 
+        Same as geometric_saccade_detect(), but returns the array of
+        saccades found before the final assembly done by 
+        assemble_saccades() (sorting, computing time_passed, 
+        discarding the first saccade), together with the annotations 
+        (without the fields of rows), or None if ``annotate`` is False.
+        
+        If ``annotations`` is given (an array with the same shape as
+        rows and the fields of annotation_dtype set to zero, possibly 
+        a view returned by merged_array()), it is filled in instead of
+        allocating a new one.
+        
+        This allows to detect saccades in separate pieces of the data
+        and merge the results as if they were detected together.
+    '''
+    # segments shorter than this are skipped (we need more
+    # points than the smoothing window)
+    minimum_segment_length = MINIMUM_SEGMENT_LENGTH
+    profile = get_profile(profile)
+    approximate = params.get('coarse_step', None) is not None
+    if approximate and (annotate or annotations is not None):
+        raise ValueError('The annotations are not available with '
+                         'coarse_step; use annotate=False.')
+    if approximate:
+        # (imported here, because approximate.py imports this module)
+        from .approximate import detect_in_segment_approx
+    
+    with profile.stage('validation'):
+        check_rows(rows)
+    
+        # Split the rows in segments with the same obj_id and no large 
+        # gaps; this also checks that timestamp is increasing and 
+        # reasonably spaced.
+        max_gap_sec = params.get('max_gap_sec', params['deltaT_outer_sec'])
+        segments = find_segments(rows['obj_id'], rows['timestamp'],
+                                 max_gap_sec)
+    profile.count('rows', len(rows))
+    profile.count('segments', len(segments))
+      
+    if annotations is None and annotate:
+        annotations = np.zeros(dtype=annotation_dtype, shape=rows.shape)
+    
+    # Each segment is processed independently.
+    saccades = [np.zeros(dtype=saccade_dtype, shape=(0,))]
+    for start, stop in segments:
+        if stop - start < minimum_segment_length:
+            profile.count('segments_too_short')
+            continue
+        if annotations is not None:
+            segment_annotations = annotations[start:stop]
+        else:
+            segment_annotations = None
+        if approximate:
+            saccades.append(detect_in_segment_approx(rows[start:stop],
+                                                     params, profile))
+        else:
+            saccades.append(detect_in_segment(rows[start:stop], params,
+                                              segment_annotations,
+                                              cache=cache, profile=profile))
+
+    if annotations is not None:
+        # like -inf, but nicer in the plots
+        annotations['preference'][annotations['candidate'] == 0] = -15 
+    
+    return np.concatenate(saccades), annotations
+
+
+def check_rows(rows):
+    ''' 
+        Checks that rows is a unidimensional ndarray with the fields
+        needed by the detector, and that they contain valid values.
+        Raises ValueError otherwise.
+    '''
+    if not isinstance(rows, np.ndarray):
+        raise ValueError('Expected ndarray, not %s' % rows.__class__.__name__)
+    
     if len(rows.shape) != 1:
         raise ValueError('Expected unidimensional ndarray, got shape %s.' % 
                          str(rows.shape))
     
-    if len(rows) <= minimum_acceptable_length:
-        raise ValueError('I cannot do much with only %s entries.' % len(rows))
-    
     required_fields = ['obj_id', 'frame', 'timestamp',
                        'x', 'y', 'xvel', 'yvel']
     for field in required_fields:
@@ -52,275 +198,429 @@ def geometric_saccade_detect(rows, params):
             raise ValueError('Found invalid data for field "%s": '
                              'nan %d inf %d (len %d)' % \
                              (field, num_nan, num_inf, len(rows)))
-    
-    # check that timestamp is increasing and reasonably spaced
-    # (we allow "missing" parts from the data, but it should be
-    #  at most a few seconds)
-    timestamp = rows['timestamp']
-    obj_id = rows['obj_id'] 
-    
-    # check each consecutive pair of rows that have the same obj_id
-    for i in range(len(rows) - 1):
-        if obj_id[i] != obj_id[i + 1]:
-            continue
+
+
+def detect_in_segment(rows, params, annotations=None, cache=None,
+                      profile=None):
+    ''' 
+        Detects saccades in a segment of rows with the same obj_id and
+        no large gaps, and returns an array of saccades. If annotations
+        is not None, it fills in the annotations for these rows.  
         
-        if not timestamp[i] < timestamp[i + 1]:
-            msg = ('Invalid timestamp sequence %.3f %.3f at index %d/%d: ' % 
-                    (timestamp[i], timestamp[i + 1], i, len(timestamp)) + 
-                             str(rows[i]), str(rows[i + 1]))
-            raise ValueError(msg)
-        dt = timestamp[i + 1] - timestamp[i]
-        # print dt, 'fps', int(1 / dt)
-        maximum_dt_allowed = 60
-        if dt > maximum_dt_allowed:
-            raise ValueError('Detected dt %.3f > %.3f at index %d/%d' % 
-                             (dt, maximum_dt_allowed, i, len(rows)))
-      
-    annotations = np.zeros(dtype=annotation_dtype, shape=rows.shape)
-    
+        If cache (a StageCache) is given, the kinematics and the 
+        geometry are memoized on disk (the stages found in the cache
+        are not timed or counted in profile).
+    '''
+    profile = get_profile(profile)
+    timestamp = rows['timestamp']
+
     # Get parameters for detection
-    
     deltaT_inner_sec = params['deltaT_inner_sec']
-    min_amplitude_deg = params['min_amplitude_deg']
-    max_orientation_dispersion_deg = params['max_orientation_dispersion_deg']
     deltaT_outer_sec = params['deltaT_outer_sec']
     minimum_interval_sec = params['minimum_interval_sec']
-    min_linear_velocity = params['min_linear_velocity']
-    max_linear_acceleration = params['max_linear_acceleration']
-    max_angular_velocity = params['max_angular_velocity']
+    uniform_fast_path = params.get('uniform_fast_path', True)
+    estimator = params.get('dispersion_estimator',
+                           DEFAULT_DISPERSION_ESTIMATOR)
+    # the annotations need the geometry of all the points
+    lazy = params.get('lazy_geometry', True) and annotations is None
     
     assert deltaT_inner_sec < deltaT_outer_sec
     
-    xvel, yvel = rows['xvel'], rows['yvel']
-    
-    # compute velocity and acceleration
-    annotations['linear_velocity_modulus'] = np.sqrt(xvel ** 2 + yvel ** 2)
+    kinematics = cached_stage(cache, 'kinematics',
+                    [timestamp, rows['xvel'], rows['yvel']], {},
+                    lambda: compute_kinematics(timestamp,
+                                               rows['xvel'], rows['yvel'],
+                                               profile=profile))
     
-    xacc = compute_derivative(rows['xvel'], timestamp)
-    yacc = compute_derivative(rows['yvel'], timestamp)
-    annotations['linear_acceleration_modulus'] = np.sqrt(xacc ** 2 + yacc ** 2)
-    
-    # smooth both to compute angular velocity
-    annotations['linear_velocity_modulus_smooth'] = \
-        smooth1d(annotations['linear_velocity_modulus'],
-                 window_len=5, window='hanning')
-    annotations['linear_acceleration_modulus_smooth'] = \
-        smooth1d(annotations['linear_acceleration_modulus'],
-                 window_len=5, window='hanning')
+    geometry_params = {'deltaT_inner_sec': deltaT_inner_sec,
+                       'deltaT_outer_sec': deltaT_outer_sec,
+                       'uniform_fast_path': uniform_fast_path,
+                       'dispersion_estimator': estimator}
+    if lazy:
+        # the centers computed depend on these thresholds
+        prefilter = dict((k, params[k]) for k in KINEMATIC_THRESHOLDS)
+        geometry_params['prefilter'] = sorted(prefilter.items())
+    else:
+        prefilter = None
+    geometry = cached_stage(cache, 'geometry',
+                    [timestamp, rows['frame'], rows['x'], rows['y'],
+                     rows['xvel'], rows['yvel']],
+                    geometry_params,
+                    lambda: get_segment_geometry(rows, kinematics,
+                                                 deltaT_inner_sec,
+                                                 deltaT_outer_sec,
+                                                 uniform_fast_path,
+                                                 estimator, prefilter,
+                                                 profile))
+    c = geometry.pop('center')
     
-    #annotations['angular_velocity_modulus'] = \
-    #   annotations['linear_acceleration_modulus'] / 
-    #   annotations['linear_velocity_modulus']
+    with profile.stage('candidates'):
+        criteria = get_candidate_criteria(kinematics, geometry, c, params)
+        candidate = _all_criteria(criteria)
+    if profile.enabled:
+        count_rejections(profile, criteria)
+        profile.count('candidates', np.count_nonzero(candidate))
+
+    # visit the candidates in order of preference, skipping those 
+    # that are too close to a saccade already found 
+    # (here we work with the indices in c)
+    with profile.stage('suppression'):
+        accepted = suppress_non_maxima(timestamp[c], geometry['preference'],
+                                       np.nonzero(candidate)[0],
+                                       minimum_interval_sec)
+    profile.count('accepted', len(accepted))
     
-#    annotations['angular_velocity_modulus'] = \
-#        annotations['linear_acceleration_modulus_smooth'] / \
-#        annotations['linear_velocity_modulus_smooth']
-#        
-    for i in range(len(rows)):
+    if annotations is not None:
+        for field, values in kinematics.items():
+            annotations[field] = values
+        annotations['considered'][c] = 1
+        for field, values in geometry.items():
+            annotations[field][c] = values
+        annotations['candidate'][c] = candidate
+        # mark the nearby indices as used by each saccade
+        with profile.stage('annotations'):
+            annotations['marked_as_used'] = count_nearby(timestamp,
+                                            c[accepted], minimum_interval_sec)
+
+    with profile.stage('saccades'):
+        return make_saccades(rows, kinematics, geometry, c, accepted,
+                             deltaT_outer_sec)
+
+
+def get_segment_geometry(rows, kinematics, deltaT_inner_sec, deltaT_outer_sec,
+                         uniform_fast_path=True,
+                         estimator=DEFAULT_DISPERSION_ESTIMATOR,
+                         prefilter=None, profile=None):
+    ''' 
+        Finds the points of the segment that can be considered as
+        saccade centers, and computes their geometry.
         
-        if annotations['linear_acceleration_modulus_smooth'][i] > 0:
-            annotations['angular_velocity_modulus'][i] = \
-                annotations['linear_acceleration_modulus_smooth'][i] / \
-                annotations['linear_velocity_modulus_smooth'][i]
-        else:
-            annotations['angular_velocity_modulus'][i] = np.NaN  
-            annotations['considered'][i] = 0
-            annotations['candidate'][i] = 0 
-            continue
+        If prefilter (a dict with the KINEMATIC_THRESHOLDS) is given,
+        only the points that satisfy get_kinematic_candidates() are 
+        considered.
+        
+        Returns the dict returned by get_center_geometry(), plus the
+        indices of the points in 'center'.
+    '''
+    profile = get_profile(profile)
+    timestamp = rows['timestamp']
     
+    with profile.stage('windows'):
         # make sure we have enough log before and after
-        if (timestamp[i] - timestamp[0] < deltaT_outer_sec) or \
-           (timestamp[-1] - timestamp[i] < deltaT_inner_sec):
-            continue
+        enough_log = np.logical_and(
+                        timestamp - timestamp[0] >= deltaT_outer_sec,
+                        timestamp[-1] - timestamp >= deltaT_inner_sec)
         
-        # find the indices j such that
-        # timestamp[i] - params.DeltaTOuter <  
-        # timestamp[j]  < timestamp[i] - params.DeltaTInner
-
-        before = find_indices_in_bounds(timestamp,
-                    lower_bound=timestamp[i] - deltaT_outer_sec,
-                    upper_bound=timestamp[i] - deltaT_inner_sec)
-        after = find_indices_in_bounds(timestamp,
-                    lower_bound=timestamp[i] + deltaT_inner_sec,
-                    upper_bound=timestamp[i] + deltaT_outer_sec)
-      
-        # TODO: check obj_id as well
+        # Find, for all points at once, the indices j such that
+        #   timestamp[i] - params.DeltaTOuter <=  
+        #   timestamp[j]  <= timestamp[i] - params.DeltaTInner
+        # (and symmetrically for the "after" window).
+        windows = find_branch_windows(timestamp, rows['frame'],
+                                      deltaT_inner_sec, deltaT_outer_sec,
+                                      uniform_fast_path=uniform_fast_path)
         
-        if len(before) < 2 or len(after) < 2:
-            annotations['considered'][i] = 0
-            annotations['candidate'][i] = 0 
-            continue
+        considered = np.logical_and(enough_log,
+                                    get_considered(kinematics, windows))
+        c, = np.nonzero(considered)
+    profile.count('considered', len(c))
+    
+    if prefilter is not None:
+        with profile.stage('prefilter'):
+            criteria = get_kinematic_criteria(kinematics, c, prefilter)
+            c = c[_all_criteria(criteria)]
+        if profile.enabled:
+            count_rejections(profile, criteria)
+    
+    with profile.stage('geometry'):
+        geometry = get_center_geometry(rows, windows, c, estimator)
+    profile.count('windows_evaluated', 2 * len(c))
+    geometry['center'] = c
+    return geometry
 
-        # these are orientation and dispersion of each branch
-        before_orientation_inverted, before_dispersion = \
-            get_orientation_and_dispersion(rows, center=i, indices=before)
-            
-        orientation_start = before_orientation_inverted + np.pi
- 
-        orientation_stop, after_dispersion = \
-            get_orientation_and_dispersion(rows, center=i, indices=after)
 
-        # the net angle is estimated as  before_orientation - after_orientation
-        turning_angle = normalize_pi(orientation_stop - orientation_start) 
-        amplitude = abs(turning_angle)
+def compute_kinematics(timestamp, xvel, yvel, dt=None, profile=None):
+    ''' 
+        Computes the modulus of linear velocity and acceleration,
+        their smoothed versions, and the angular velocity. 
         
-        candidate = (
-            (before_dispersion 
-             <= np.radians(max_orientation_dispersion_deg)) and 
-            (after_dispersion 
-             <= np.radians(max_orientation_dispersion_deg)) and 
-            (amplitude >= np.radians(min_amplitude_deg)) and 
-            (annotations['linear_velocity_modulus'][i] 
-             >= min_linear_velocity) and 
-            (annotations['linear_acceleration_modulus'][i] 
-             <= max_linear_acceleration) and 
-            (annotations['angular_velocity_modulus'][i] 
-             <= np.radians(max_angular_velocity)) and 
-            (annotations['angular_velocity_modulus'][i] 
-             >= np.radians(100)) 
-        )
-
-        preference = (amplitude 
-                      - 0.5 * before_dispersion 
-                      - 0.5 * after_dispersion)
-    
-        annotations['considered'][i] = 1
-        annotations['orientation_start'][i] = orientation_start
-        annotations['orientation_stop'][i] = orientation_stop
-        annotations['before_dispersion'][i] = before_dispersion
-        annotations['after_dispersion'][i] = after_dispersion
-        annotations['turning_angle'][i] = turning_angle
-        annotations['amplitude'][i] = amplitude  
-        annotations['preference'][i] = preference
-        annotations['sign'][i] = np.sign(turning_angle)
-        annotations['num_samples_used_before'][i] = len(before)
-        annotations['num_samples_used_after'][i] = len(after)
-
-        annotations['candidate'][i] = candidate
-            
-    preferences = annotations['preference']
-    for i in range(len(rows)):
-        if not annotations['considered'][i] or not annotations['candidate'][i]:
-            # like -inf, but nicer in the plots
-            preferences[i] = -15 
-            
-    ordered_indices = np.argsort(-preferences)
-    # make sure we are sorting from big to small
-    if not(preferences[ordered_indices[0]] 
-           >= preferences[ordered_indices[-1]]):
-        msg = ("Strange: not %s >= %s" % (preferences[ordered_indices[0]],
-                                       preferences[ordered_indices[-1]]))
-        raise ValueError(msg)
-    
-    saccades = []
-    # while looking for saccades, mark as used 
-    annotations['marked_as_used'] = 0
-    
-    # visit each point in order of preference 
-    for i in ordered_indices:
-        # skip if it is already part of a saccade
-        if annotations['marked_as_used'][i]:
-            continue
-        # skip if it does not pass the minimum requirements
-        if not annotations['candidate'][i]:
-            continue
+        Returns a dict whose keys are the corresponding fields 
+        of annotation_dtype. 
         
-        # print "found saccade at %d, time %.2f" % 
-        #       (i, timestamp[i] - timestamp[0])
-        top_velocity = annotations['angular_velocity_modulus'][i]
-       
-        duration = annotations['amplitude'][i] / top_velocity
+        If not given, dt is the first interval of timestamp.
+    '''
+    profile = get_profile(profile)
+    kinematics = {}
+    with profile.stage('derivatives'):
+        # compute velocity and acceleration
+        kinematics['linear_velocity_modulus'] = np.sqrt(xvel ** 2 + 
+                                                        yvel ** 2)
         
-        # ok, let's mark this point as a saccade 
-        saccade = np.ndarray(dtype=saccade_dtype, shape=())
-        saccade['top_velocity'] = np.NaN
-        saccade['time_start'] = timestamp[i] - deltaT_outer_sec
-        saccade['time_middle'] = timestamp[i]
-        saccade['linear_velocity_modulus'] = \
-            annotations['linear_velocity_modulus'][i]  
-        saccade['linear_acceleration_modulus'] = \
-            annotations['linear_acceleration_modulus'][i]
-        saccade['time_stop'] = timestamp[i] + deltaT_outer_sec
-        saccade['amplitude'] = np.degrees(annotations['amplitude'][i])
-        saccade['sign'] = annotations['sign'][i]
-        saccade['orientation_start'] = \
-            np.degrees(annotations['orientation_start'][i])
-        saccade['orientation_stop'] = \
-            np.degrees(annotations['orientation_stop'][i])
-        saccade['num_samples_used_after'] = \
-            annotations['num_samples_used_after'][i]
-        saccade['num_samples_used_before'] = \
-            annotations['num_samples_used_before'][i]
-        saccade['top_velocity'] = np.degrees(top_velocity)
-        saccade['duration'] = duration
-        # mamarama data
-        saccade['position'] = np.array([rows['x'][i],
-                                        rows['y'][i],
-                                        rows['z'][i]])
-        saccade['linear_velocity_world'] = \
-            np.array([rows['xvel'][i], rows['yvel'][i], rows['zvel'][i]])
-        saccade['frame'] = rows['frame'][i]
-        saccade['obj_id'] = rows['obj_id'][i]
+        xacc = compute_derivative(xvel, timestamp, dt=dt)
+        yacc = compute_derivative(yvel, timestamp, dt=dt)
+        kinematics['linear_acceleration_modulus'] = np.sqrt(xacc ** 2 + 
+                                                            yacc ** 2)
+    
+    with profile.stage('smoothing'):
+        # smooth both to compute angular velocity
+        vel_smooth = smooth1d(kinematics['linear_velocity_modulus'],
+                              window_len=5, window='hanning')
+        acc_smooth = smooth1d(kinematics['linear_acceleration_modulus'],
+                              window_len=5, window='hanning')
+    kinematics['linear_velocity_modulus_smooth'] = vel_smooth
+    kinematics['linear_acceleration_modulus_smooth'] = acc_smooth
+    
+    #annotations['angular_velocity_modulus'] = \
+    #   annotations['linear_acceleration_modulus'] / 
+    #   annotations['linear_velocity_modulus']
+    
+    # angular velocity is only defined where the acceleration is positive
+    has_angular_velocity = acc_smooth > 0
+    angular_velocity = np.divide(acc_smooth, vel_smooth,
+                                 out=np.empty(len(timestamp)),
+                                 where=has_angular_velocity)
+    angular_velocity[np.logical_not(has_angular_velocity)] = np.NaN
+    kinematics['angular_velocity_modulus'] = angular_velocity
+    return kinematics
+
+
+def get_considered(kinematics, windows):
+    ''' 
+        Returns a boolean array that is true for the points that have 
+        a defined angular velocity, and at least 2 points in each window.
+        (The caller must also check there is enough log before and after.)
+    '''
+    has_angular_velocity = kinematics['linear_acceleration_modulus_smooth'] > 0
+    return has_angular_velocity & has_enough_points(windows, 2)
+    
+
+def evaluate_centers(rows, kinematics, windows, centers, params):
+    ''' 
+        Computes the geometry of the turn at each of the given centers,
+        and checks the criteria for being a saccade candidate.
         
-        saccades.append(saccade)
+        Returns a dict whose keys are fields of annotation_dtype and 
+        the values are arrays with one element per center.
+    '''
+    estimator = params.get('dispersion_estimator',
+                           DEFAULT_DISPERSION_ESTIMATOR)
+    evaluation = get_center_geometry(rows, windows, centers, estimator)
+    candidate = get_candidates(kinematics, evaluation, centers, params)
+    evaluation['candidate'] = candidate.astype('uint8')
+    return evaluation
+
+
+def get_center_geometry(rows, windows, centers,
+                        estimator=DEFAULT_DISPERSION_ESTIMATOR):
+    ''' 
+        Computes the geometry of the turn at each of the given centers
+        (orientation and dispersion of each branch, amplitude, ...). 
+        This depends only on the windows (and the dispersion 
+        estimator), not on the thresholds.
         
-        # mark the nearby indices as used by this saccade
-        nearby_indices = find_indices_in_bounds(timestamp,
-                    lower_bound=timestamp[i] - minimum_interval_sec,
-                    upper_bound=timestamp[i] + minimum_interval_sec)
+        Returns a dict whose keys are fields of annotation_dtype and 
+        the values are arrays with one element per center.
+    '''
+    c = centers
+    before_start, before_stop, after_start, after_stop = \
+        get_window_bounds(windows, c)
+    
+    # these are orientation and dispersion of each branch
+    (before_orientation_inverted, before_dispersion,
+     orientation_stop, after_dispersion) = \
+        get_branch_geometry(windows, rows['x'], rows['y'], c,
+                            estimator=estimator)
         
-        annotations['marked_as_used'][nearby_indices] += 1
+    orientation_start = before_orientation_inverted + np.pi
+
+    # the net angle is estimated as  before_orientation - after_orientation
+    turning_angle = normalize_pi(orientation_stop - orientation_start) 
+    amplitude = np.abs(turning_angle)
     
-    saccades_array = saccade_list_to_array(saccades)
-    annotated_rows = merge_fields(rows, annotations,
-                                  ignore_duplicates=True)
+    preference = (amplitude 
+                  - 0.5 * before_dispersion 
+                  - 0.5 * after_dispersion)
 
-    return saccades_array, annotated_rows
+    return {
+        'orientation_start': orientation_start,
+        'orientation_stop': orientation_stop,
+        'before_dispersion': before_dispersion,
+        'after_dispersion': after_dispersion,
+        'turning_angle': turning_angle,
+        'amplitude': amplitude,
+        'preference': preference,
+        'sign': np.sign(turning_angle),
+        'num_samples_used_before': before_stop - before_start,
+        'num_samples_used_after': after_stop - after_start,
+    }
+
+
+def get_candidates(kinematics, geometry, centers, params):
+    ''' 
+        Checks the criteria for being a saccade candidate at each of
+        the given centers; returns a boolean array.
+        
+        The thresholds in params can also be arrays of shape (P, 1), 
+        for checking P parameter sets at once; in that case, the 
+        result has shape (P, len(centers)).
+    '''
+    return _all_criteria(get_candidate_criteria(kinematics, geometry,
+                                                centers, params))
+
+
+def get_kinematic_candidates(kinematics, centers, params):
+    ''' 
+        Checks the criteria for being a saccade candidate that depend 
+        only on the kinematics (velocity, acceleration, angular velocity)
+        at each of the given centers; returns a boolean array 
+        (see get_candidates()). These are cheap to check, and can be
+        used to skip the geometry of the points that fail them.
+    '''
+    return _all_criteria(get_kinematic_criteria(kinematics, centers, params))
+
+
+def get_candidate_criteria(kinematics, geometry, centers, params):
+    ''' 
+        Returns a list of tuples (name, mask), one for each criterion
+        checked by get_candidates().
+    '''
+    min_amplitude_deg = params['min_amplitude_deg']
+    max_orientation_dispersion_deg = params['max_orientation_dispersion_deg']
+    
+    return [
+        ('before_dispersion', geometry['before_dispersion'] 
+         <= np.radians(max_orientation_dispersion_deg)), 
+        ('after_dispersion', geometry['after_dispersion'] 
+         <= np.radians(max_orientation_dispersion_deg)), 
+        ('amplitude', geometry['amplitude'] >= np.radians(min_amplitude_deg)),
+    ] + get_kinematic_criteria(kinematics, centers, params)
+
+
+def get_kinematic_criteria(kinematics, centers, params):
+    ''' 
+        Returns a list of tuples (name, mask), one for each criterion
+        checked by get_kinematic_candidates().
+    '''
+    min_linear_velocity = params['min_linear_velocity']
+    max_linear_acceleration = params['max_linear_acceleration']
+    max_angular_velocity = params['max_angular_velocity']
+    
+    c = centers
+    angular_velocity = kinematics['angular_velocity_modulus'][c]
+    return [
+        ('linear_velocity', kinematics['linear_velocity_modulus'][c] 
+         >= min_linear_velocity), 
+        ('linear_acceleration', kinematics['linear_acceleration_modulus'][c] 
+         <= max_linear_acceleration), 
+        ('max_angular_velocity', 
+         angular_velocity <= np.radians(max_angular_velocity)), 
+        ('min_angular_velocity', 
+         angular_velocity >= np.radians(MIN_ANGULAR_VELOCITY_DEG)),
+    ]
+
+
+def count_rejections(profile, criteria):
+    ''' Counts in profile, for each criterion, the number of points
+        that do not satisfy it (as "rejected_<name>"). '''
+    for name, mask in criteria:
+        profile.count('rejected_' + name, mask.size - np.count_nonzero(mask))
+
+
+def _all_criteria(criteria):
+    return reduce(np.logical_and, [mask for _, mask in criteria])
+
+
+def make_saccades(rows, kinematics, geometry, centers, selected,
+                  deltaT_outer_sec):
+    ''' 
+        Creates the array of saccades (with saccade_dtype) for the 
+        centers[selected]; geometry has one value per center, 
+        kinematics one value per row.
+        
+        time_passed and smooth_displacement are computed later
+        by assemble_saccades().
+    '''
+    i = centers[selected]
+    timestamp = rows['timestamp'][i]
+    amplitude = geometry['amplitude'][selected]
+    top_velocity = kinematics['angular_velocity_modulus'][i]
+    
+    saccades = np.zeros(dtype=saccade_dtype, shape=(len(i),))
+    saccades['time_start'] = timestamp - deltaT_outer_sec
+    saccades['time_middle'] = timestamp
+    saccades['time_stop'] = timestamp + deltaT_outer_sec
+    saccades['linear_velocity_modulus'] = \
+        kinematics['linear_velocity_modulus'][i]
+    saccades['linear_acceleration_modulus'] = \
+        kinematics['linear_acceleration_modulus'][i]
+    saccades['amplitude'] = np.degrees(amplitude)
+    saccades['sign'] = geometry['sign'][selected]
+    saccades['orientation_start'] = \
+        np.degrees(geometry['orientation_start'][selected])
+    saccades['orientation_stop'] = \
+        np.degrees(geometry['orientation_stop'][selected])
+    saccades['num_samples_used_after'] = \
+        geometry['num_samples_used_after'][selected]
+    saccades['num_samples_used_before'] = \
+        geometry['num_samples_used_before'][selected]
+    saccades['top_velocity'] = np.degrees(top_velocity)
+    saccades['duration'] = amplitude / top_velocity
+    # mamarama data
+    for k, field in enumerate(['x', 'y', 'z']):
+        saccades['position'][:, k] = rows[field][i]
+    for k, field in enumerate(['xvel', 'yvel', 'zvel']):
+        saccades['linear_velocity_world'][:, k] = rows[field][i]
+    saccades['frame'] = rows['frame'][i]
+    saccades['obj_id'] = rows['obj_id'][i]
+    return saccades
  
 
 def saccade_list_to_array(saccades):
     ''' 
-        Converts an array of saccades to a big array.
-        It computes time_passed, smooth_displacement, discards first saccade. 
+        Converts a list of saccades to a big array, 
+        using assemble_saccades(). 
+    '''
+    saccades_array = np.zeros(dtype=saccade_dtype, shape=(len(saccades),))
+    for i, saccade in enumerate(saccades):
+        saccades_array[i] = saccade
+    return assemble_saccades(saccades_array)
+
+
+def assemble_saccades(saccades):
+    ''' 
+        Sorts an array of saccades chronologically, computes 
+        time_passed and smooth_displacement, and discards the first
+        saccade (for which we cannot compute time_passed).
     '''
-    
     if len(saccades) == 0:
         return np.zeros(dtype=saccade_dtype, shape=(0,))
     
-    # sort the saccades chronologically
-    saccades.sort(key=lambda x:x['time_start'])
+    # sort the saccades chronologically (stable, so that simultaneous 
+    # saccades of different tracks keep their order)
+    order = np.argsort(saccades['time_start'], kind='mergesort')
+    saccades = saccades[order]
     
-    # make sure it is sorted
-    if len(saccades) > 1:
-        assert saccades[0]['time_start'] < saccades[1]['time_start']
-        
     # now compute time_passed; discarding one first saccade
-    for i in range(1, len(saccades)):
-        time_passed = saccades[i]['time_start'] - saccades[i - 1]['time_start']
-        if time_passed <= 0:
-            msg = ('Invalid value of time_passed computed.\n%s\n%s' 
-                   % (saccade_description(saccades[i - 1]),
-                      saccade_description(saccades[i])))
-            
-            raise Exception(msg)
-        saccades[i]['time_passed'] = time_passed
-        saccades[i]['smooth_displacement'] = \
-            normalize_180(saccades[i]['orientation_start'] - 
-                          saccades[i - 1]['orientation_stop'])
-        
-        
+    time_passed = np.diff(saccades['time_start'])
+    # Saccades of different tracks (obj_id) are detected independently,
+    # so they can happen at the same time.
+    same_track = saccades['obj_id'][1:] == saccades['obj_id'][:-1]
+    invalid, = np.nonzero(np.logical_or(time_passed < 0,
+                            np.logical_and(time_passed == 0, same_track)))
+    if len(invalid) > 0:
+        i = invalid[0] + 1
+        msg = ('Invalid value of time_passed computed.\n%s\n%s' 
+               % (saccade_description(saccades[i - 1]),
+                  saccade_description(saccades[i])))
+        raise Exception(msg)
+    
+    smooth_displacement = normalize_180(saccades['orientation_start'][1:] - 
+                                        saccades['orientation_stop'][:-1])
+    
     # remove first saccade (cannot compute time_passed)
-    saccades.pop(0)
-    
-    # convert to a big np array 
-    if len(saccades) > 0:
-        n = len(saccades)
-        saccades_array = np.zeros(shape=(n,), dtype=saccade_dtype)
-        for i in range(n):
-            check_saccade_is_well_formed(saccades[i])
-            saccades_array[i] = saccades[i]
-            check_saccade_is_well_formed(saccades_array[i])
-    else:
-        saccades_array = np.zeros(dtype=saccade_dtype, shape=(0,))
+    saccades = saccades[1:]
+    saccades['time_passed'] = time_passed
+    saccades['smooth_displacement'] = smooth_displacement
+    
+    validate_saccades(saccades, strict=True)
 
-    return saccades_array
+    return saccades
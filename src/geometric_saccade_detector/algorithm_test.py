@@ -0,0 +1,83 @@
+from .algorithm import (assemble_saccades, saccade_list_to_array,
+    geometric_saccade_detect)
+from .streaming_test import synthetic_track, params
+from .structures import saccade_dtype
+from . import np
+
+
+def random_saccades(n, seed=0):
+    rng = np.random.RandomState(seed)
+    saccades = np.zeros(dtype=saccade_dtype, shape=(n,))
+    saccades['time_start'] = rng.permutation(n) * 0.5
+    saccades['time_stop'] = saccades['time_start'] + 0.1
+    saccades['orientation_start'] = rng.uniform(-180, 180, n)
+    saccades['orientation_stop'] = rng.uniform(-180, 180, n)
+    saccades['sign'] = 1
+    saccades['obj_id'] = 1
+    return saccades
+
+
+def assemble_saccades_test():
+    saccades = random_saccades(20)
+    result = assemble_saccades(saccades)
+    # the first one is discarded
+    assert len(result) == 19
+    assert np.all(result['time_start'] == np.arange(1, 20) * 0.5)
+    assert np.allclose(result['time_passed'], 0.5)
+    ordered = np.sort(saccades, order='time_start')
+    d = ordered['orientation_start'][1:] - ordered['orientation_stop'][:-1]
+    d = (d + 180) % 360 - 180
+    assert np.allclose(result['smooth_displacement'], d)
+
+    # same as converting a list of single saccades
+    as_list = [np.array(s, dtype=saccade_dtype) for s in saccades]
+    assert np.all(saccade_list_to_array(as_list) == result)
+    
+    assert len(assemble_saccades(saccades[:1])) == 0
+    assert len(assemble_saccades(saccades[:0])) == 0
+
+
+def assemble_saccades_invalid_test():
+    saccades = random_saccades(5)
+    saccades['time_start'][3] = saccades['time_start'][2]
+    try:
+        assemble_saccades(saccades)
+    except Exception:
+        pass
+    else:
+        raise Exception('Expected an error for simultaneous saccades.')
+    # ok if they are from different tracks
+    saccades['obj_id'][3] = 2
+    assert len(assemble_saccades(saccades)) == 4
+
+
+def lazy_geometry_test():
+    rows = np.concatenate([synthetic_track(600, 1, 0, 1),
+                           synthetic_track(600, 2, 0, 2)])
+    _, annotated = geometric_saccade_detect(rows,
+                                dict(params, lazy_geometry=False))
+    # the prefilter only skips points that cannot be candidates
+    lean_params = dict(params, max_angular_velocity=3000)
+    for p in [params, lean_params]:
+        expected, _ = geometric_saccade_detect(rows,
+                                dict(p, lazy_geometry=False), annotate=False)
+        lazy, _ = geometric_saccade_detect(rows, p, annotate=False)
+        assert len(lazy) > 5
+        for field in expected.dtype.names:
+            assert np.all(lazy[field] == expected[field])
+    # with annotations, the geometry of all points is computed
+    _, lazy_annotated = geometric_saccade_detect(rows, params)
+    assert np.all(lazy_annotated['considered'] == annotated['considered'])
+    assert np.array_equal(lazy_annotated['amplitude'], annotated['amplitude'])
+
+
+def lean_test():
+    ''' With annotate=False, no annotations and the same saccades. '''
+    rows = np.concatenate([synthetic_track(600, 1, 0, 1),
+                           synthetic_track(400, 2, 0, 2)])
+    expected, annotated = geometric_saccade_detect(rows, params, annotate=True)
+    assert annotated is not None and len(annotated) == len(rows)
+    saccades, annotated = geometric_saccade_detect(rows, params,
+                                                   annotate=False)
+    assert annotated is None
+    assert np.array_equal(saccades, expected)
@@ -1,125 +1,248 @@
-from . import np
-from reprep import Report
-from reprep.plot_utils.axes import y_axis_set, x_axis_set
+from . import np, logger
 from geometric_saccade_detector.structures import saccade_dtype, UNKNOWN
-from geometric_saccade_detector.algorithm import saccade_list_to_array
+from geometric_saccade_detector.algorithm import assemble_saccades
+from geometric_saccade_detector.suppression import suppress_non_maxima
+from geometric_saccade_detector.profiling import get_profile
 import warnings
 
 
 def angvel_saccade_detect(rows,
                           angular_velocity_threshold_deg=300,
                           min_dt=1 / 60.0,
-                          max_dt=1):
+                          max_dt=1,
+                          minimum_interval_sec=None,
+                          frame_rate=60.0,
+                          profile=None):
     ''' 
         Returns a saccade table, and an annotation table. 
         
+        If ``minimum_interval_sec`` is given, saccades whose peaks are 
+        closer than that are suppressed, keeping the one with the
+        highest peak angular velocity.
         
+        The timestamps are computed as ``frame / frame_rate``.
+        
+        If profile (a StageProfile) is given, the time spent in each 
+        stage and some counters are recorded in it.
     '''
+    profile = get_profile(profile)
+    profile.count('rows', len(rows))
+    
     # Find points where the angular velocity is higher than a 
     # threhsold
     angular_velocity_deg = np.rad2deg(rows['reduced_angular_velocity'])
     orientation_deg = np.degrees(rows['reduced_angular_orientation'])
-    obj_id = rows['obj_id']
+    avel = np.abs(angular_velocity_deg)
     
-    # Fix for irregular time stamps
-    timestamp = rows['frame'] / 60.0
-    warnings.warn('Fixing irregular timestamps')
+    with profile.stage('validation'):
+        timestamp, regular = get_regular_timestamps(rows, frame_rate)
+    profile.count('irregular', len(regular) - np.count_nonzero(regular))
+    
+    with profile.stage('thresholding'):
+        fast_enough = avel >= angular_velocity_threshold_deg
+        level = get_threshold_levels(avel, regular,
+                                     [angular_velocity_threshold_deg])
+    profile.count('fast_enough', np.count_nonzero(fast_enough))
     
-    regular = np.zeros(shape=timestamp.shape, dtype='bool')
-    max_so_far = timestamp[0] - 1
-    for i in range(len(timestamp)):
-        if timestamp[i] <= max_so_far:
-            print('Irregular at %d: %s' % (i, ''))
-            regular[i] = False
-        else:
-            regular[i] = True
-        max_so_far = max(max_so_far, timestamp[i])
-        
-    fast_enough = (np.abs(angular_velocity_deg) 
-                   >= angular_velocity_threshold_deg)
-    candidates = np.logical_and(fast_enough, regular)
-    
-    saccades = []
-    # Find sequences
-    for start, stop in find_sequences(candidates):
-        
-        # Do not consider joining multiple tracks
-        if obj_id[start] != obj_id[stop - 1]:
-            continue
-        
-        stop -= 1
-        time_start = timestamp[start]
-        time_stop = timestamp[stop]
-        duration = time_stop - time_start 
-        
-        if duration < min_dt or duration > max_dt:
-            continue
-        
-        # Find the fastest point in the saccade   
-        #print((stop + 1) - start)
-        avel = np.abs(angular_velocity_deg)
-        avel[:start] = 0  # zero other
-        avel[stop:] = 0
-        middle = np.argmax(avel)
-        top_velocity_deg = angular_velocity_deg[middle]
-        
-        time_middle = timestamp[middle]
-        assert time_middle >= time_start and time_middle <= time_stop
-        orientation_start = orientation_deg[start]
-        orientation_stop = orientation_deg[stop]
-        amplitude_deg = orientation_stop - orientation_start
-        sign = np.sign(amplitude_deg)
-        
-        i = start
-        saccade = np.ndarray(dtype=saccade_dtype, shape=())
-        saccade['top_velocity'] = top_velocity_deg
-        saccade['time_start'] = time_start
-        saccade['time_middle'] = time_middle
-#        saccade['linear_velocity_modulus'] = \
-#            annotations['linear_velocity_modulus'][i]  
-#        saccade['linear_acceleration_modulus'] = \
-#            annotations['linear_acceleration_modulus'][i]
-        saccade['time_stop'] = time_stop
-        saccade['amplitude'] = amplitude_deg
-        saccade['sign'] = sign
-        saccade['orientation_start'] = orientation_start
-        saccade['orientation_stop'] = orientation_stop
-        saccade['top_velocity'] = top_velocity_deg
-        saccade['duration'] = duration
-        # mamarama data
-        saccade['position'] = np.array([rows['x'][i],
-                                        rows['y'][i],
-                                        rows['z'][i]])
-        saccade['linear_velocity_world'] = \
-            np.array([rows['xvel'][i], rows['yvel'][i], rows['zvel'][i]])
-        saccade['frame'] = rows['frame'][i]
-        saccade['obj_id'] = rows['obj_id'][i]
-        
-        # TODO: who should be setting this?
-        saccade['species'] = UNKNOWN
-        saccade['stimulus'] = UNKNOWN
-        saccade['sample'] = UNKNOWN
-        saccade['sample_num'] = -1  # will be filled in by someone else
-        saccade['processed'] = UNKNOWN 
-        
-        saccades.append(saccade)
+    with profile.stage('sequences'):
+        sequences = find_angvel_sequences(level, 1, rows['obj_id'],
+                                          timestamp, avel, min_dt, max_dt)
+        starts = sequences['starts']
+        stops = sequences['stops']
+        middles = sequences['middles']
+    for name in ['sequences', 'rejected_obj_id', 'rejected_duration']:
+        profile.count(name, sequences[name][0])
+    profile.count('candidates', len(starts))
+        
+    if minimum_interval_sec is not None:
+        with profile.stage('suppression'):
+            starts, stops, middles = suppress_sequences(timestamp, avel,
+                                        starts, stops, middles,
+                                        minimum_interval_sec)
+    profile.count('accepted', len(starts))
    
-    saccades = saccade_list_to_array(saccades)
+    with profile.stage('assembly'):
+        saccades = make_angvel_saccades(rows, timestamp, angular_velocity_deg,
+                                        orientation_deg, starts, stops,
+                                        middles)
+        saccades = assemble_saccades(saccades)
     
     return dict(
         angular_velocity_deg=angular_velocity_deg,
         fast_enough=fast_enough,
         angular_velocity_threshold_deg=angular_velocity_threshold_deg,
+        frame_rate=frame_rate,
         saccades=saccades
     )
 
 
-def plot_angvel_saccade_detect_results(rows):
-    ''' Return a Report. '''
+def get_regular_timestamps(rows, frame_rate):
+    ''' 
+        Returns the timestamps (``frame / frame_rate``) and a boolean
+        array that is False for the samples whose timestamp is not
+        larger than all the previous ones; these are not considered.
+        Logs how many there are.
+    '''
+    # Fix for irregular time stamps
+    timestamp = rows['frame'] / frame_rate
+    warnings.warn('Fixing irregular timestamps')
+    
+    regular = find_regular(timestamp)
+    num_irregular = len(regular) - np.count_nonzero(regular)
+    if num_irregular:
+        logger.warning('Ignoring %d samples with irregular timestamps '
+                       '(of %d).' % (num_irregular, len(regular)))
+    return timestamp, regular
+
+
+def get_threshold_levels(avel, regular, thresholds):
+    ''' 
+        Returns the number of thresholds (sorted) that each value of
+        avel reaches; 0 for the samples not regular or NaN.
+    '''
+    level = np.searchsorted(thresholds, avel, side='right')
+    level[~regular | np.isnan(avel)] = 0
+    return level
+
+
+def find_angvel_sequences(level, num_levels, obj_id, timestamp, avel,
+                          min_dt, max_dt):
+    ''' 
+        Finds the sequences of samples where level > k, for each k in
+        0..num_levels-1, discards those whose first and last point 
+        have different obj_id or whose duration is not between min_dt
+        and max_dt, and finds the fastest point of the others (the 
+        last point is not considered).
+        
+        Returns a dict with the fields:
+        
+        - ``rank``, ``starts``, ``stops``, ``middles``: the k and the
+          index of the first, last and fastest point of the sequences
+          kept, sorted by k and then by position;
+        - ``sequences``, ``rejected_obj_id``, ``rejected_duration``:
+          arrays with the number of sequences for each k, and of 
+          those discarded.
+    '''
+    rank, starts, stops = find_nested_runs(level, num_levels)
+    stops -= 1
+    
+    # Do not consider joining multiple tracks
+    same_track = obj_id[starts] == obj_id[stops]
+    duration = timestamp[stops] - timestamp[starts]
+    right_duration = (duration >= min_dt) & (duration <= max_dt)
+    keep = same_track & right_duration
+    
+    def count(selected):
+        return np.bincount(rank[selected], minlength=num_levels)
+    
+    starts = starts[keep]
+    stops = stops[keep]
+    return dict(rank=rank[keep], starts=starts, stops=stops,
+                # Find the fastest point in the saccades (the last point 
+                # is not considered)
+                middles=find_peaks(avel, starts, stops),
+                sequences=count(slice(None)),
+                rejected_obj_id=count(~same_track),
+                rejected_duration=count(same_track & ~right_duration))
+
+
+def suppress_sequences(timestamp, avel, starts, stops, middles,
+                       minimum_interval_sec):
+    ''' 
+        Keeps only the sequences whose fastest point is accepted by
+        suppress_non_maxima(); returns the filtered starts, stops, 
+        middles.
+    '''
+    accepted = suppress_non_maxima(timestamp, avel, middles,
+                                   minimum_interval_sec)
+    is_accepted = np.zeros(len(timestamp), dtype='bool')
+    is_accepted[accepted] = True
+    keep = is_accepted[middles]
+    return starts[keep], stops[keep], middles[keep]
+
+
+def make_angvel_saccades(rows, timestamp, angular_velocity_deg,
+                         orientation_deg, starts, stops, middles):
+    ''' 
+        Creates the array of saccades (with saccade_dtype) given the
+        indices of their first, last and fastest points.
+    '''
+    time_start = timestamp[starts]
+    time_middle = timestamp[middles]
+    time_stop = timestamp[stops]
+    assert np.all((time_middle >= time_start) & (time_middle <= time_stop))
+    orientation_start = orientation_deg[starts]
+    orientation_stop = orientation_deg[stops]
+    amplitude_deg = orientation_stop - orientation_start
+    
+    saccades = np.zeros(dtype=saccade_dtype, shape=(len(starts),))
+    saccades['top_velocity'] = angular_velocity_deg[middles]
+    saccades['time_start'] = time_start
+    saccades['time_middle'] = time_middle
+    saccades['time_stop'] = time_stop
+    saccades['amplitude'] = amplitude_deg
+    saccades['sign'] = np.sign(amplitude_deg)
+    saccades['orientation_start'] = orientation_start
+    saccades['orientation_stop'] = orientation_stop
+    saccades['duration'] = time_stop - time_start
+    # mamarama data
+    i = starts
+    for k, field in enumerate(['x', 'y', 'z']):
+        saccades['position'][:, k] = rows[field][i]
+    for k, field in enumerate(['xvel', 'yvel', 'zvel']):
+        saccades['linear_velocity_world'][:, k] = rows[field][i]
+    saccades['frame'] = rows['frame'][i]
+    saccades['obj_id'] = rows['obj_id'][i]
+    
+    # TODO: who should be setting this?
+    saccades['species'] = UNKNOWN
+    saccades['stimulus'] = UNKNOWN
+    saccades['sample'] = UNKNOWN
+    saccades['sample_num'] = -1  # will be filled in by someone else
+    saccades['processed'] = UNKNOWN 
+    return saccades
+
+
+def slice_angvel_results(rows, data, max_chunk_size):
+    ''' 
+        Splits the rows, and the result of angvel_saccade_detect() on 
+        them, in chunks of at most max_chunk_size consecutive rows.
+        Yields tuples (rows_i, data_i); the arrays are views, and
+        data_i contains all the saccades (not cut) that overlap the 
+        time interval of the chunk.
+        
+        As in the detection, the time of the rows is 
+        ``frame / frame_rate``, not their timestamp.
+    '''
+    timestamp = rows['frame'] / data['frame_rate']
+    saccades = data['saccades']
+    for begin in range(0, len(rows), max_chunk_size):
+        chunk = slice(begin, min(begin + max_chunk_size, len(rows)))
+        T = timestamp[chunk]
+        overlap = ((saccades['time_stop'] >= T.min()) & 
+                   (saccades['time_start'] <= T.max()))
+        data_i = dict(data)
+        data_i['angular_velocity_deg'] = data['angular_velocity_deg'][chunk]
+        data_i['fast_enough'] = data['fast_enough'][chunk]
+        data_i['saccades'] = saccades[overlap]
+        yield rows[chunk], data_i
+
+
+def plot_angvel_saccade_detect_results(rows, data=None):
+    ''' 
+        Return a Report. data is the result of angvel_saccade_detect() 
+        on the rows (computed if not given).
+    '''
+    # (imported here so that the detector does not need reprep)
+    from reprep import Report
+    from reprep.plot_utils.axes import y_axis_set, x_axis_set
+    
     r = Report()
     
-    data = angvel_saccade_detect(rows)
-    timestamp = rows['timestamp']
+    if data is None:
+        data = angvel_saccade_detect(rows)
+    # same time as the saccades
+    timestamp = rows['frame'] / data['frame_rate']
     orientation_deg = np.degrees(rows['reduced_angular_orientation'])
 
     T = timestamp 
@@ -203,6 +326,94 @@ def find_sequences(x):
             j += 1            
         yield i, j
         i = j + 1
+
+
+def find_runs(x):
+    ''' 
+        Vectorized version of find_sequences(): returns two arrays
+        with the first and one-past-the-last index of each True 
+        subsequence in x.
+    '''
+    x = np.asarray(x, dtype='bool').astype('int8')
+    edges = np.diff(np.concatenate(([0], x, [0])))
+    starts, = np.nonzero(edges == 1)
+    stops, = np.nonzero(edges == -1)
+    return starts.astype('int64'), stops.astype('int64')
+
+
+def find_nested_runs(level, num_levels):
+    '''
+        Finds the subsequences where level > k, for each k in
+        0..num_levels-1, with a single pass over level.
+
+        Returns three arrays: k, first and one-past-the-last index of
+        each subsequence, sorted by k and then by position; for each
+        k, they are the same as find_runs(level > k).
+    '''
+    padded = np.concatenate(([0], level, [0])).astype('int64')
+    change = np.diff(padded)
+    # where the level goes from a to b > a, the subsequences for
+    # the levels in [a, b) start; vice versa, they stop
+    up, = np.nonzero(change > 0)
+    down, = np.nonzero(change < 0)
+    start_k = _expand(padded[up], change[up])
+    starts = np.repeat(up, change[up])
+    stop_k = _expand(padded[down + 1], -change[down])
+    stops = np.repeat(down, -change[down])
+    assert np.all(stop_k < num_levels)
+
+    by_start = np.lexsort((starts, start_k))
+    by_stop = np.lexsort((stops, stop_k))
+    return start_k[by_start], starts[by_start], stops[by_stop]
+
+
+def _expand(first, counts):
+    ''' Concatenation of the ranges first[i] .. first[i] + counts[i]. '''
+    offsets = np.cumsum(counts) - counts
+    return (np.repeat(first - offsets, counts) +
+            np.arange(np.sum(counts), dtype='int64'))
+
+
+def find_regular(timestamp, max_so_far=None):
+    ''' 
+        True for the timestamps larger than all the previous ones
+        (and than max_so_far, if given).
+    '''
+    previous_max = np.empty(len(timestamp))
+    if len(timestamp) > 0:
+        previous_max[0] = (timestamp[0] - 1 if max_so_far is None 
+                           else max_so_far)
+        np.maximum.accumulate(timestamp[:-1], out=previous_max[1:])
+        np.maximum(previous_max, previous_max[0], out=previous_max)
+    return timestamp > previous_max
+
+
+def find_peaks(values, starts, stops):
+    ''' 
+        For each interval [start, stop), returns the index of the 
+        first maximum of values (nonnegative, no NaNs) in it. As for
+        np.argmax() of values zeroed outside the interval, the index
+        is 0 if the interval is empty or the maximum is 0.
+    '''
+    peaks = np.zeros(len(starts), dtype='int64')
+    nonempty = stops > starts
+    starts = starts[nonempty]
+    lengths = stops[nonempty] - starts
+    if len(starts) == 0:
+        return peaks
+    
+    # the values of all the intervals, concatenated
+    offsets = np.cumsum(lengths) - lengths
+    index = (np.repeat(starts - offsets, lengths) + 
+             np.arange(offsets[-1] + lengths[-1]))
+    inside = values[index]
+    
+    maxima = np.maximum.reduceat(inside, offsets)
+    is_max = inside == np.repeat(maxima, lengths)
+    position = np.where(is_max, np.arange(len(inside)), len(inside))
+    first = index[np.minimum.reduceat(position, offsets)]
+    peaks[nonempty] = np.where(maxima > 0, first, 0)
+    return peaks
     
     
     
@@ -0,0 +1,59 @@
+from geometric_saccade_detector.angvel.angvel_detect import (find_sequences,
+    find_runs, find_regular, find_peaks, angvel_saccade_detect,
+    slice_angvel_results)
+from geometric_saccade_detector.benchmark import synthetic_rows
+from numpy.testing import assert_allclose
+from . import np
+import warnings
+
+
+def find_runs_test():
+    rng = np.random.RandomState(0)
+    for n in [0, 1, 2, 10, 100]:
+        x = rng.uniform(size=n) > 0.4
+        starts, stops = find_runs(x)
+        expected = list(find_sequences(x))
+        assert_allclose(expected, list(zip(starts, stops)),
+                        err_msg='Failure for %s' % x)
+
+
+def find_regular_test():
+    timestamp = np.array([1, 2, 2, 3, 1.5, 2.5, 4, 5, 4, 6])
+    expected = [1, 1, 0, 1, 0, 0, 1, 1, 0, 1]
+    assert_allclose(find_regular(timestamp), expected)
+
+
+def find_peaks_test():
+    rng = np.random.RandomState(1)
+    values = np.abs(np.round(rng.normal(size=50), 1))
+    values[10:13] = 0
+    starts = np.array([0, 3, 10, 20, 30, 45, 49])
+    stops = np.array([3, 3, 13, 21, 38, 49, 50])
+    peaks = find_peaks(values, starts, stops)
+    for start, stop, peak in zip(starts, stops, peaks):
+        zeroed = values.copy()
+        zeroed[:start] = 0
+        zeroed[stop:] = 0
+        assert peak == np.argmax(zeroed), (start, stop, peak)
+
+
+def slice_angvel_results_test():
+    rows, _ = synthetic_rows(1000, seed=1)
+    # the saccade times are frame / frame_rate, not the timestamps
+    rows['timestamp'] = rows['frame'] / 60.0 + 1000
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        data = angvel_saccade_detect(rows)
+    assert len(data['saccades']) > 0
+    chunks = list(slice_angvel_results(rows, data, 300))
+    assert [len(r) for r, _ in chunks] == [300, 300, 300, 100]
+    found = set()
+    for rows_i, data_i in chunks:
+        assert np.shares_memory(rows_i, rows)
+        assert len(data_i['angular_velocity_deg']) == len(rows_i)
+        T = rows_i['frame'] / 60.0
+        for saccade in data_i['saccades']:
+            assert saccade['time_stop'] >= T[0]
+            assert saccade['time_start'] <= T[-1]
+            found.add(saccade['frame'])
+    assert found == set(data['saccades']['frame'])
@@ -0,0 +1,260 @@
+from . import np, logger
+from .angvel_detect import (find_runs, find_regular, find_peaks,
+    make_angvel_saccades)
+from ..streaming import link_saccades, _in_conflict
+from ..structures import saccade_dtype
+import bisect
+import heapq
+
+
+class StreamingAngvelDetector(object):
+    '''
+        Online version of angvel_saccade_detect().
+
+        The rows are given in chunks of any size using push(), which
+        returns the saccades that have been finalized so far; finish()
+        must be called at the end of the data to obtain the rest::
+
+            detector = StreamingAngvelDetector(minimum_interval_sec=0.1)
+            for rows in chunks:
+                saccades = detector.push(rows)
+                ...
+            saccades = detector.finish()
+
+        As in the batch function, the sequences of samples above the
+        threshold are found in the order in which the rows are given,
+        so a sequence can continue across chunks, and the sequences
+        whose first and last sample have different obj_id are
+        discarded. A saccade is decided when its sequence ends; if
+        ``minimum_interval_sec`` is given, once no later sequence
+        can suppress it. Only the first, last and fastest sample of
+        the open sequence are kept, and the saccades that can still
+        be suppressed, so the memory used does not depend on the
+        length of the data.
+
+        The number of samples with irregular timestamps (which are
+        ignored, as in the batch function) is kept in
+        ``num_irregular``, and logged by finish().
+
+        The concatenation of the returned saccades is the same array
+        returned by angvel_saccade_detect() on the concatenated rows.
+    '''
+
+    def __init__(self, angular_velocity_threshold_deg=300,
+                 min_dt=1 / 60.0,
+                 max_dt=1,
+                 minimum_interval_sec=None,
+                 frame_rate=60.0):
+        self.angular_velocity_threshold_deg = angular_velocity_threshold_deg
+        self.min_dt = min_dt
+        self.max_dt = max_dt
+        self.minimum_interval_sec = minimum_interval_sec
+        self.frame_rate = frame_rate
+
+        # number of rows seen so far
+        self.num_rows = 0
+        # number of samples with irregular timestamps
+        self.num_irregular = 0
+        # largest timestamp seen so far
+        self.max_so_far = None
+        # the first row; used (as np.argmax() does) for the sequences
+        # without a sample faster than 0
+        self.first_row = None
+        # the open sequence (a _Run), if any
+        self.run = None
+        # candidates that can still be suppressed, as tuples
+        # (priority, time_middle, time_start, saccade)
+        self.pending = []
+        # sorted times of the recently accepted candidates
+        self.accepted_times = []
+        # accepted saccades not returned yet, as a heap of tuples
+        # (time_start, count, saccade)
+        self.waiting = []
+        self.num_accepted = 0
+        # the last saccade returned (needed for time_passed)
+        self.previous = None
+
+    def push(self, rows):
+        '''
+            Processes a new chunk of rows; returns an array (with
+            saccade_dtype) containing the saccades finalized so far.
+        '''
+        if len(rows) == 0:
+            return np.zeros(dtype=saccade_dtype, shape=(0,))
+        if self.first_row is None:
+            self.first_row = rows[:1].copy()
+
+        n = len(rows)
+        timestamp = rows['frame'] / self.frame_rate
+        regular = find_regular(timestamp, self.max_so_far)
+        self.num_irregular += n - np.count_nonzero(regular)
+        if self.max_so_far is None:
+            self.max_so_far = timestamp.max()
+        else:
+            self.max_so_far = max(self.max_so_far, timestamp.max())
+
+        avel = np.abs(np.rad2deg(rows['reduced_angular_velocity']))
+        fast_enough = avel >= self.angular_velocity_threshold_deg
+        starts, stops = find_runs(np.logical_and(fast_enough, regular))
+        # fastest sample of each sequence, not considering the last
+        peaks = find_peaks(avel, starts, stops - 1)
+        peak_values = avel[peaks]
+        # find_peaks() returns 0 if there is no sample faster than 0
+        peak_values[(peaks < starts) | (peaks >= stops - 1)] = 0
+
+        if self.run is not None and (len(starts) == 0 or starts[0] > 0):
+            self._close_run()
+
+        for k in range(len(starts)):
+            start, stop = starts[k], stops[k]
+            peak = _Point(rows[peaks[k]:peaks[k] + 1], peak_values[k])
+            last = rows[stop - 1:stop]
+            if start == 0 and self.run is not None:
+                self.run.extend(peak, last)
+            else:
+                self.run = _Run(rows[start:start + 1], self.num_rows + start,
+                                peak, last)
+            if stop < n:
+                self._close_run()
+
+        self.num_rows += n
+        if self.run is not None:
+            # the next saccades start at or after this time
+            horizon = self._timestamp(self.run.start)[0]
+        else:
+            horizon = self.max_so_far
+        self._suppress(horizon)
+        return self._emit(horizon)
+
+    def finish(self):
+        '''
+            Signals the end of the data; returns an array with the
+            remaining saccades.
+        '''
+        if self.num_irregular:
+            logger.warning('Ignored %d samples with irregular timestamps '
+                           '(of %d).' % (self.num_irregular, self.num_rows))
+        if self.run is not None:
+            self._close_run()
+        self._suppress(None)
+        return self._emit(None)
+
+    def _timestamp(self, rows):
+        return rows['frame'] / self.frame_rate
+
+    def _close_run(self):
+        ''' Filters the open sequence and adds it to the candidates. '''
+        run = self.run
+        self.run = None
+        # Do not consider joining multiple tracks
+        if run.start['obj_id'][0] != run.last['obj_id'][0]:
+            return
+        duration = (self._timestamp(run.last) - self._timestamp(run.start))[0]
+        if duration < self.min_dt or duration > self.max_dt:
+            return
+
+        middle = run.peak.row if run.peak.value > 0 else self.first_row
+        points = np.concatenate((run.start, run.last, middle))
+        timestamp = self._timestamp(points)
+        angular_velocity_deg = np.rad2deg(points['reduced_angular_velocity'])
+        orientation_deg = np.degrees(points['reduced_angular_orientation'])
+        saccade = make_angvel_saccades(points, timestamp, angular_velocity_deg,
+                                       orientation_deg, [0], [1], [2])[0]
+        # same order as suppress_non_maxima()
+        priority = (-np.abs(angular_velocity_deg[2]), run.index)
+        self.pending.append((priority, timestamp[2], timestamp[0], saccade))
+
+    def _suppress(self, horizon):
+        '''
+            Incremental version of suppress_non_maxima(), as in
+            StreamingSaccadeDetector: a candidate is accepted once
+            the candidates with higher preference in conflict with it
+            are decided, and no future candidate (after horizon) can
+            be in conflict.
+        '''
+        interval = self.minimum_interval_sec
+        if interval is None:
+            for _, _, _, saccade in self.pending:
+                self._accept(saccade)
+            self.pending = []
+            return
+
+        accepted_times = self.accepted_times
+        self.pending.sort(key=lambda x: x[0])
+        pending = []
+        # times of the undecided candidates with higher preference
+        pending_times = []
+        for candidate in self.pending:
+            _, t, _, saccade = candidate
+            if _in_conflict(accepted_times, t, interval):
+                continue
+            if ((horizon is None or t < horizon - interval) and
+                not _in_conflict(pending_times, t, interval)):
+                bisect.insort(accepted_times, t)
+                self._accept(saccade)
+            else:
+                bisect.insort(pending_times, t)
+                pending.append(candidate)
+        self.pending = pending
+
+        # forget the accepted times that cannot be in conflict anymore
+        if horizon is not None:
+            oldest = min([horizon] + pending_times)
+            k = 0
+            while (k < len(accepted_times) and
+                   accepted_times[k] + interval < oldest):
+                k += 1
+            del accepted_times[:k]
+
+    def _accept(self, saccade):
+        heapq.heappush(self.waiting, (saccade['time_start'].item(),
+                                      self.num_accepted, saccade))
+        self.num_accepted += 1
+
+    def _emit(self, horizon):
+        ''' Returns the waiting saccades that start before all the
+            undecided ones (all if horizon is None). '''
+        if horizon is not None:
+            frontier = min([horizon] + [t for _, _, t, _ in self.pending])
+        saccades = []
+        while self.waiting and (horizon is None or
+                                self.waiting[0][0] < frontier):
+            saccades.append(heapq.heappop(self.waiting)[-1])
+        saccades, self.previous = link_saccades(saccades, self.previous)
+        return saccades
+
+
+class _Point(object):
+    ''' A sample (an array with one row) and its absolute angular
+        velocity (0 if there is no sample). '''
+
+    def __init__(self, row, value):
+        self.row = row.copy()
+        self.value = value
+
+
+class _Run(object):
+    ''' The first, last and fastest sample of an open sequence. '''
+
+    def __init__(self, start, index, peak, last):
+        self.start = start.copy()
+        # position of the first row in the stream (used for ordering)
+        self.index = index
+        # fastest sample, not considering the last
+        self.peak = peak
+        self.last = last.copy()
+
+    def extend(self, peak, last):
+        ''' Continues the sequence with more samples, of which peak is
+            the fastest (not considering the new last one). '''
+        # the old last sample can now be the fastest; ties are
+        # resolved in favor of the first, like np.argmax()
+        old_last = _Point(self.last, _abs_angvel(self.last))
+        for point in [old_last, peak]:
+            if point.value > self.peak.value:
+                self.peak = point
+        self.last = last.copy()
+
+
+def _abs_angvel(row):
+    return np.abs(np.rad2deg(row['reduced_angular_velocity']))[0]
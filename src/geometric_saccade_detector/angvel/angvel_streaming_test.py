@@ -0,0 +1,58 @@
+from . import np
+from .angvel_detect import angvel_saccade_detect
+from .angvel_streaming import StreamingAngvelDetector
+from ..benchmark import synthetic_rows
+from ..profiling import StageProfile
+from numpy.testing import assert_allclose
+import warnings
+
+
+def stream(rows, chunk_sizes, detector=None, **params):
+    if detector is None:
+        detector = StreamingAngvelDetector(**params)
+    saccades = []
+    start = 0
+    for size in chunk_sizes:
+        saccades.append(detector.push(rows[start:start + size]))
+        start += size
+    saccades.append(detector.push(rows[start:]))
+    saccades.append(detector.finish())
+    return np.concatenate(saccades)
+
+
+def angvel_streaming_test():
+    rows, _ = synthetic_rows(3000, num_obj_ids=3, seed=1)
+    # a few repeated frames, which are not considered
+    rows['frame'][1000:1003] = rows['frame'][999]
+
+    rng = np.random.RandomState(0)
+    for params in [dict(),
+                   dict(minimum_interval_sec=0.2),
+                   dict(angular_velocity_threshold_deg=100, max_dt=0.1,
+                        minimum_interval_sec=0.05)]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            expected = angvel_saccade_detect(rows, **params)['saccades']
+        for chunk_sizes in [[1] * 50, rng.randint(1, 40, size=100),
+                            [len(rows)]]:
+            saccades = stream(rows, chunk_sizes, **params)
+            assert len(saccades) == len(expected), \
+                (params, len(saccades), len(expected))
+            for field in expected.dtype.names:
+                if expected.dtype[field].kind == 'f':
+                    assert_allclose(saccades[field], expected[field],
+                                    atol=1e-10)
+                else:
+                    assert np.all(saccades[field] == expected[field]), field
+
+
+def angvel_streaming_irregular_test():
+    rows, _ = synthetic_rows(500, num_obj_ids=1, seed=2)
+    rows['frame'][100:103] = rows['frame'][99]
+    profile = StageProfile()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        angvel_saccade_detect(rows, profile=profile)
+    detector = StreamingAngvelDetector()
+    stream(rows, [101, 1, 50], detector=detector)
+    assert detector.num_irregular == profile.counters['irregular'] == 3
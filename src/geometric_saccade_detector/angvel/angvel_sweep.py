@@ -0,0 +1,72 @@
+from . import np
+from .angvel_detect import (get_regular_timestamps, get_threshold_levels,
+    find_angvel_sequences, suppress_sequences, make_angvel_saccades)
+from ..algorithm import assemble_saccades
+
+
+def angvel_saccade_detect_sweep(rows, thresholds,
+                                min_dt=1 / 60.0,
+                                max_dt=1,
+                                minimum_interval_sec=None,
+                                frame_rate=60.0):
+    '''
+        Runs angvel_saccade_detect() on the same rows for each of the
+        values of ``angular_velocity_threshold_deg`` in thresholds,
+        in a single pass.
+
+        The sequences over a threshold are nested in those over the
+        lower thresholds: the sequences for all of them are found from
+        the number of thresholds that each sample exceeds, and the
+        fastest point of all of them is found at once, with the same
+        find_angvel_sequences() used by angvel_saccade_detect(). Only
+        the non-maximum suppression is done for each threshold.
+        The result is the same as calling angvel_saccade_detect()
+        for each threshold.
+
+        Returns a list with a dict for each threshold (in the order
+        given), with the fields:
+
+        - ``angular_velocity_threshold_deg``;
+        - ``saccades``: the saccade table;
+        - ``sequences``: number of sequences over the threshold;
+        - ``rejected_obj_id``, ``rejected_duration``: number of
+          sequences spanning two obj_id, or too short or too long;
+        - ``candidates``: number of remaining sequences;
+        - ``accepted``: number of those left after the suppression.
+    '''
+    thresholds = np.asarray(thresholds, dtype='float64')
+    order = np.argsort(thresholds, kind='mergesort')
+
+    angular_velocity_deg = np.rad2deg(rows['reduced_angular_velocity'])
+    orientation_deg = np.degrees(rows['reduced_angular_orientation'])
+    avel = np.abs(angular_velocity_deg)
+
+    timestamp, regular = get_regular_timestamps(rows, frame_rate)
+    # number of thresholds that each sample exceeds
+    level = get_threshold_levels(avel, regular, thresholds[order])
+    sequences = find_angvel_sequences(level, len(thresholds), rows['obj_id'],
+                                      timestamp, avel, min_dt, max_dt)
+
+    results = [None] * len(thresholds)
+    for r, k in enumerate(order):
+        select = sequences['rank'] == r
+        s = sequences['starts'][select]
+        e = sequences['stops'][select]
+        m = sequences['middles'][select]
+        candidates = len(s)
+
+        if minimum_interval_sec is not None:
+            s, e, m = suppress_sequences(timestamp, avel, s, e, m,
+                                         minimum_interval_sec)
+
+        saccades = make_angvel_saccades(rows, timestamp, angular_velocity_deg,
+                                        orientation_deg, s, e, m)
+        results[k] = dict(
+            angular_velocity_threshold_deg=thresholds[k],
+            saccades=assemble_saccades(saccades),
+            sequences=int(sequences['sequences'][r]),
+            rejected_obj_id=int(sequences['rejected_obj_id'][r]),
+            rejected_duration=int(sequences['rejected_duration'][r]),
+            candidates=candidates,
+            accepted=len(s))
+    return results
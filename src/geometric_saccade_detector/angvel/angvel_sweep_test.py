@@ -0,0 +1,40 @@
+from . import np
+from .angvel_detect import angvel_saccade_detect, find_runs, find_nested_runs
+from .angvel_sweep import angvel_saccade_detect_sweep
+from ..benchmark import synthetic_rows
+from numpy.testing import assert_allclose
+import warnings
+
+
+def find_nested_runs_test():
+    rng = np.random.RandomState(0)
+    level = rng.randint(0, 4, size=200)
+    level[:5] = 3
+    k, starts, stops = find_nested_runs(level, 4)
+    for i in range(4):
+        expected = find_runs(level > i)
+        assert_allclose(starts[k == i], expected[0])
+        assert_allclose(stops[k == i], expected[1])
+
+
+def angvel_sweep_test():
+    rows, _ = synthetic_rows(3000, num_obj_ids=3, seed=2)
+    rows['frame'][1000:1003] = rows['frame'][999]
+    thresholds = [400, 100, 250, 250, 1000]
+    for params in [dict(), dict(minimum_interval_sec=0.1, max_dt=0.2)]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results = angvel_saccade_detect_sweep(rows, thresholds, **params)
+            assert len(results) == len(thresholds)
+            for threshold, result in zip(thresholds, results):
+                expected = angvel_saccade_detect(rows,
+                    angular_velocity_threshold_deg=threshold,
+                    **params)['saccades']
+                saccades = result['saccades']
+                assert result['angular_velocity_threshold_deg'] == threshold
+                assert result['accepted'] == len(expected) + 1
+                assert len(saccades) == len(expected)
+                for field in ['time_start', 'time_middle', 'time_stop',
+                              'time_passed', 'amplitude', 'top_velocity',
+                              'frame', 'obj_id']:
+                    assert_allclose(saccades[field], expected[field])
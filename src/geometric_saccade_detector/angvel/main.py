@@ -5,10 +5,13 @@ from ..utils import (LenientOptionParser, wrap_script_entry_point,
 from flydra_db import safe_flydra_db_open
 from flydra_db.constants import NamingConventions
 from geometric_saccade_detector.angvel.angvel_detect import (
-    angvel_saccade_detect, plot_angvel_saccade_detect_results)
-from geometric_saccade_detector.well_formed_saccade import (
-    check_saccade_is_well_formed)
+    angvel_saccade_detect, plot_angvel_saccade_detect_results,
+    slice_angvel_results)
+from geometric_saccade_detector.angvel.angvel_sweep import (
+    angvel_saccade_detect_sweep)
+from geometric_saccade_detector.well_formed_saccade import validate_saccades
 from reprep import Report
+import multiprocessing
 import os
 import warnings
 
@@ -39,6 +42,17 @@ def detect_angvel(argv):
 
     parser.add_option("--out", help="Output directory for graphic representation.")
 
+    parser.add_option("--jobs", default=1, type='int',
+                      help="Number of processes used to plot the results "
+                      "with --out [= %default]")
+
+    parser.add_option("--thresholds", default=None,
+                      help="Comma-separated angular velocity thresholds "
+                      "(deg/s); detects the saccades for all of them in one "
+                      "pass, and writes one table for each, with version "
+                      "<saccades_table_version>_<threshold>. Cannot be used "
+                      "with --nocache or --out.")
+
     # detection parameters
     dt = 1.0 / 60  # XXX: read from file
     warnings.warn('Using fixed dt = %s.' % dt)
@@ -80,6 +94,15 @@ def detect_angvel(argv):
     # annotations_table_name = 'annotated'
     saccades_table_version = options.saccades_table_version
 
+    if options.thresholds is not None:
+        if options.nocache or options.out is not None:
+            raise Exception('--nocache and --out cannot be used with '
+                            '--thresholds.')
+        thresholds = [float(x) for x in options.thresholds.split(',')]
+        with safe_flydra_db_open(options.db) as db:
+            detect_angvel_sweep(db, thresholds, options, processed)
+        return
+
     with safe_flydra_db_open(options.db) as db:
         samples = db.list_samples()
 
@@ -108,8 +131,7 @@ def detect_angvel(argv):
                 data = angvel_saccade_detect(rows, **params)
                 saccades = data['saccades'] 
                 
-                for saccade in saccades:
-                    check_saccade_is_well_formed(saccade)
+                validate_saccades(saccades, strict=True)
         
                 DT = rows['timestamp'][-1] - rows['timestamp'][0]  
                 logger.info("%4d/%d %s: %6d saccades for %6d rows (%6g saccades/s)" % 
@@ -133,28 +155,81 @@ def detect_angvel(argv):
                     resources = os.path.join(outdir, 'images')
                     filename = os.path.join(outdir, '%s.html' % sample)
                  
-                    r = Report()
-                    
-                    chunks = enumerate_chunks(len(rows), max_chunk_size=300)
-                    for i, select in enumerate(chunks):
-                        rows_i = rows[select]
-                    
-                        ri = plot_angvel_saccade_detect_results(rows_i)
-                        ri.nid = 'chunk_%s' % i
-                        r.add_child(ri)
+                    r = plot_angvel_report(rows, data, jobs=options.jobs)
                     
                     logger.info('Writing to %r.' % filename)
                     r.to_html(filename, resources_dir=resources)
                     #sys.exit(0)
     
                 
-def enumerate_chunks(N, max_chunk_size):
-    nchunks = int(np.ceil(N * 1.0 / max_chunk_size))
-    
-    for i in range(nchunks):
-        begin = i * max_chunk_size
-        end = min(begin + max_chunk_size, N)
-        yield range(begin, end)
+def detect_angvel_sweep(db, thresholds, options, processed):
+    ''' Writes a saccades table for each threshold; the rows of each
+        sample are read once. '''
+    rows_table_name = NamingConventions.ROWS_TABLE
+    saccades_table_name = NamingConventions.SACCADES_TABLE
+    samples = db.list_samples()
+    totals = dict((threshold, dict(saccades=0, sequences=0))
+                  for threshold in thresholds)
+    for i, sample in enumerate(samples):
+        if not db.has_table(sample, rows_table_name, options.version):
+            msg = ('Sample %r does not have table %s:%s.' % 
+                   (sample, rows_table_name, options.version))
+            raise Exception(msg)
+
+        with db.safe_get_table(sample, rows_table_name,
+                               options.version) as rows:
+            rows = np.array(rows[:])
+
+        results = angvel_saccade_detect_sweep(rows, thresholds)
+        for threshold, result in zip(thresholds, results):
+            saccades = result['saccades']
+            validate_saccades(saccades, strict=True)
+            version = '%s_%g' % (options.saccades_table_version, threshold)
+            db.set_table(sample=sample, table=saccades_table_name,
+                         data=saccades, version=version)
+            db.set_attr(sample, 'saccades_%s_processed' % version, processed)
+            totals[threshold]['saccades'] += len(saccades)
+            totals[threshold]['sequences'] += result['sequences']
+
+        logger.info("%4d/%d %s: %s saccades for %6d rows" % 
+                    (i, len(samples), sample,
+                     '/'.join(str(len(r['saccades'])) for r in results),
+                     len(rows)))
+
+    for threshold in thresholds:
+        logger.info('threshold %8g deg/s: %6d sequences, %6d saccades' % 
+                    (threshold, totals[threshold]['sequences'],
+                     totals[threshold]['saccades']))
+
+
+def plot_angvel_report(rows, data, max_chunk_size=300, jobs=1):
+    ''' 
+        Returns a Report with the results (data) of angvel_saccade_detect()
+        on the rows, plotted in chunks of max_chunk_size rows, using
+        a pool of ``jobs`` processes.
+    '''
+    chunks = list(slice_angvel_results(rows, data, max_chunk_size))
+    if jobs == 1 or len(chunks) <= 1:
+        reports = [_plot_chunk(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(processes=jobs)
+        try:
+            # results are returned in the same order as the chunks
+            reports = pool.map(_plot_chunk, chunks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    r = Report()
+    for i, ri in enumerate(reports):
+        ri.nid = 'chunk_%s' % i
+        r.add_child(ri)
+    return r
+
+
+def _plot_chunk(args):
+    rows, data = args
+    return plot_angvel_saccade_detect_results(rows, data)
 
 
 def main():
@@ -0,0 +1,221 @@
+from . import np
+from .algorithm import (geometric_saccade_detect, compute_kinematics,
+    get_considered, get_center_geometry, get_candidates,
+    get_kinematic_candidates, make_saccades)
+from .geometry import (find_branch_windows, DEFAULT_DISPERSION_ESTIMATOR,
+    WINDOW_TOLERANCE_SEC)
+from .profiling import StageProfile, get_profile
+from .suppression import suppress_non_maxima
+
+# Default step of the coarse pass.
+DEFAULT_COARSE_STEP = 4
+
+
+def geometric_saccade_detect_approx(rows, params,
+                                    step=DEFAULT_COARSE_STEP,
+                                    tolerance_deg=None,
+                                    margin_sec=None):
+    '''
+        Runs geometric_saccade_detect() in the approximate mode
+        (see detect_in_segment_approx()) with the given ``coarse_step``,
+        ``coarse_tolerance_deg`` and ``refinement_margin_sec``,
+        meant for exploratory passes over large amounts of data.
+
+        Returns a tuple (saccades, report), where report is a dict
+        with the fields:
+
+        - ``considered``: number of points that the exact detector
+          would evaluate;
+        - ``coarse``: number of points evaluated in the coarse pass;
+        - ``flagged``: number of coarse intervals near the thresholds;
+        - ``refinements``: number of separate regions refined;
+        - ``refined``: number of points evaluated at full resolution.
+    '''
+    params = dict(params)
+    params['coarse_step'] = step
+    params['coarse_tolerance_deg'] = tolerance_deg
+    params['refinement_margin_sec'] = margin_sec
+    profile = StageProfile()
+    saccades, _ = geometric_saccade_detect(rows, params, annotate=False,
+                                           profile=profile)
+    counters = profile.counters
+    report = dict(considered=counters.get('prefiltered', 0))
+    for name in ['coarse', 'flagged', 'refinements', 'refined']:
+        report[name] = counters.get(name, 0)
+    return saccades, report
+
+
+def detect_in_segment_approx(rows, params, profile=None):
+    '''
+        Approximate version of detect_in_segment(), used by
+        geometric_saccade_detect() if ``coarse_step`` is in params.
+
+        Only the points that satisfy the criteria on the kinematics
+        can be candidates, and the geometry is computed at full
+        resolution only for some of them (the "refined" ones).
+        Which ones depends on ``coarse_tolerance_deg``:
+
+        - None (default): every interval of ``coarse_step`` samples
+          that contains one of these points is flagged, and all of
+          them are refined. The saccades found are the same as those
+          of the exact detector; the report only tells how the
+          candidates are clustered.
+        - a number: the geometry is first computed only at every
+          ``coarse_step``-th sample; the samples where it is within
+          ``coarse_tolerance_deg`` of the thresholds on amplitude and
+          dispersion are flagged, and the points within
+          ``refinement_margin_sec`` (default: ``minimum_interval_sec``)
+          of a flagged sample are refined. This is faster, but a turn
+          that is near the thresholds only between two coarse samples
+          is missed.
+
+        In both cases, the refined regions are then grown to cover
+        ``minimum_interval_sec`` around every candidate found, until
+        nothing changes, so that all the candidates that could
+        suppress each other are evaluated. Therefore every saccade
+        found is also found by the exact detector, and with the
+        default tolerance the result is the same.
+
+        The counts of the coarse pass and of the refinement are
+        recorded in profile.
+    '''
+    profile = get_profile(profile)
+    timestamp = rows['timestamp']
+
+    deltaT_inner_sec = params['deltaT_inner_sec']
+    deltaT_outer_sec = params['deltaT_outer_sec']
+    minimum_interval_sec = params['minimum_interval_sec']
+    step = params['coarse_step']
+    tolerance_deg = params.get('coarse_tolerance_deg', None)
+    margin_sec = params.get('refinement_margin_sec', None)
+    if margin_sec is None:
+        margin_sec = minimum_interval_sec
+    estimator = params.get('dispersion_estimator',
+                           DEFAULT_DISPERSION_ESTIMATOR)
+
+    assert deltaT_inner_sec < deltaT_outer_sec
+    if step < 1:
+        raise ValueError('Invalid coarse_step %r.' % step)
+
+    kinematics = compute_kinematics(timestamp, rows['xvel'], rows['yvel'],
+                                    profile=profile)
+
+    with profile.stage('windows'):
+        enough_log = np.logical_and(
+                        timestamp - timestamp[0] >= deltaT_outer_sec,
+                        timestamp[-1] - timestamp >= deltaT_inner_sec)
+        windows = find_branch_windows(timestamp, rows['frame'],
+                        deltaT_inner_sec, deltaT_outer_sec,
+                        uniform_fast_path=params.get('uniform_fast_path', True))
+        considered = np.logical_and(enough_log,
+                                    get_considered(kinematics, windows))
+        c, = np.nonzero(considered)
+    profile.count('considered', len(c))
+
+    # only the points that satisfy the cheap criteria can be candidates
+    with profile.stage('prefilter'):
+        prefiltered = c[get_kinematic_candidates(kinematics, c, params)]
+    profile.count('prefiltered', len(prefiltered))
+
+    if tolerance_deg is None:
+        profile.count('flagged', len(np.unique(prefiltered // step)))
+        refined = prefiltered
+    else:
+        with profile.stage('coarse'):
+            refined = coarse_pass(rows, windows, c, prefiltered, params,
+                                  step, tolerance_deg, margin_sec, estimator,
+                                  profile)
+
+    # A candidate can only be suppressed by another one within
+    # minimum_interval_sec (a bit more, so that the rounding of the
+    # comparisons does not matter).
+    reach = minimum_interval_sec + WINDOW_TOLERANCE_SEC
+    with profile.stage('refinement'):
+        evaluated = np.zeros(len(rows), dtype='bool')
+        parts = []
+        while True:
+            evaluated[refined] = True
+            geometry = get_center_geometry(rows, windows, refined, estimator)
+            candidate = get_candidates(kinematics, geometry, refined, params)
+            parts.append((refined, geometry, candidate))
+
+            # (the times are sorted because refined is)
+            found = timestamp[refined[candidate]]
+            remaining = prefiltered[~evaluated[prefiltered]]
+            refined = remaining[_within(timestamp[remaining], found, reach)]
+            if len(refined) == 0:
+                break
+            profile.count('expansions')
+
+        centers, geometry, candidate = _merge_parts(parts)
+    profile.count('refined', len(centers))
+    if len(centers) > 0:
+        # regions are separated by more than 2 * margin_sec
+        profile.count('refinements', 1 + np.count_nonzero(
+                      np.diff(timestamp[centers]) > 2 * margin_sec))
+    profile.count('candidates', np.count_nonzero(candidate))
+
+    # the candidates are in the same order as in the exact detector,
+    # so that the ties are broken in the same way
+    with profile.stage('suppression'):
+        accepted = suppress_non_maxima(timestamp[centers],
+                                       geometry['preference'],
+                                       np.nonzero(candidate)[0],
+                                       minimum_interval_sec)
+    profile.count('accepted', len(accepted))
+
+    with profile.stage('saccades'):
+        return make_saccades(rows, kinematics, geometry, centers, accepted,
+                             deltaT_outer_sec)
+
+
+def coarse_pass(rows, windows, considered, prefiltered, params, step,
+                tolerance_deg, margin_sec, estimator, profile):
+    '''
+        Computes the geometry at every step-th considered point
+        (only near the prefiltered ones), and returns the prefiltered
+        points within margin_sec of the samples within tolerance_deg
+        of the thresholds.
+    '''
+    timestamp = rows['timestamp']
+    min_amplitude_deg = params['min_amplitude_deg']
+    max_orientation_dispersion_deg = params['max_orientation_dispersion_deg']
+
+    # the coarse samples far from the prefiltered points are not needed
+    coarse = considered[considered % step == 0]
+    coarse = coarse[_within(timestamp[coarse], timestamp[prefiltered],
+                            margin_sec)]
+    profile.count('coarse', len(coarse))
+
+    geometry = get_center_geometry(rows, windows, coarse, estimator)
+    max_dispersion = np.radians(max_orientation_dispersion_deg + tolerance_deg)
+    near = ((geometry['amplitude'] >=
+             np.radians(min_amplitude_deg - tolerance_deg)) &
+            (geometry['before_dispersion'] <= max_dispersion) &
+            (geometry['after_dispersion'] <= max_dispersion))
+    flagged = timestamp[coarse[near]]
+    profile.count('flagged', len(flagged))
+
+    return prefiltered[_within(timestamp[prefiltered], flagged, margin_sec)]
+
+
+def _merge_parts(parts):
+    ''' Concatenates the (centers, geometry, candidate) evaluated in
+        several rounds, sorted by center. '''
+    centers = np.concatenate([p[0] for p in parts])
+    order = np.argsort(centers, kind='mergesort')
+    geometry = {}
+    for field in parts[0][1]:
+        geometry[field] = np.concatenate([p[1][field] for p in parts])[order]
+    candidate = np.concatenate([p[2] for p in parts])[order]
+    return centers[order], geometry, candidate
+
+
+def _within(t, reference, margin):
+    ''' Returns a boolean array that is true for the elements of t
+        within margin of an element of reference (sorted). '''
+    k = np.searchsorted(reference, t - margin)
+    within = np.zeros(len(t), dtype='bool')
+    inside = k < len(reference)
+    within[inside] = reference[k[inside]] <= t[inside] + margin
+    return within
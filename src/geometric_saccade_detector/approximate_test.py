@@ -0,0 +1,46 @@
+from .algorithm import geometric_saccade_detect
+from .approximate import geometric_saccade_detect_approx
+from .streaming_test import synthetic_track, params
+from . import np
+
+
+def approximate_test():
+    rows = np.concatenate([synthetic_track(1500, 1, 0, 1),
+                           synthetic_track(1000, 2, 0, 2)])
+    exact, _ = geometric_saccade_detect(rows, params, annotate=False)
+    assert len(exact) > 10
+
+    # with the default (conservative) coarse test, the result is exact
+    interval = params['minimum_interval_sec']
+    for step in [1, 4, 20]:
+        for margin_sec in [None, interval, 3 * interval]:
+            saccades, report = geometric_saccade_detect_approx(rows, params,
+                                            step=step, margin_sec=margin_sec)
+            assert np.array_equal(saccades, exact), (step, margin_sec)
+            assert 0 < report['refinements'] <= report['flagged']
+            assert report['refined'] == report['considered']
+
+    # the same mode, through geometric_saccade_detect()
+    approximate = dict(params, coarse_step=4)
+    saccades, _ = geometric_saccade_detect(rows, approximate, annotate=False)
+    assert np.array_equal(saccades, exact)
+    try:
+        geometric_saccade_detect(rows, approximate)
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError with the annotations.')
+
+    # with a tolerance and a very coarse step, some are missed, but
+    # all the saccades found are exact (time_passed depends on the
+    # previous saccade, so only the other fields are compared)
+    saccades, report = geometric_saccade_detect_approx(rows, params,
+                                            step=20, tolerance_deg=0)
+    assert 0 < len(saccades) < len(exact)
+    assert report['refined'] < report['considered']
+    found = dict(((s['obj_id'], s['frame']), s) for s in exact)
+    for saccade in saccades:
+        s = found[(saccade['obj_id'], saccade['frame'])]
+        for field in ['time_middle', 'amplitude', 'orientation_start',
+                      'orientation_stop']:
+            assert saccade[field] == s[field], field
@@ -0,0 +1,306 @@
+from . import logger, np, __version__
+from .algorithm import geometric_saccade_detect
+from .angvel.angvel_detect import angvel_saccade_detect
+from .profiling import StageProfile
+from .utils import (LenientOptionParser, wrap_script_entry_point, UserError,
+    check_no_spurious)
+import json
+import platform
+import time
+import warnings
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# Fields of the synthetic rows (those needed by both detectors).
+benchmark_dtype = [('timestamp', 'float64'), ('obj_id', 'int64'),
+                   ('frame', 'int64'),
+                   ('x', 'float32'), ('y', 'float32'), ('z', 'float32'),
+                   ('xvel', 'float32'), ('yvel', 'float32'),
+                   ('zvel', 'float32'),
+                   ('reduced_angular_velocity', 'float64'),
+                   ('reduced_angular_orientation', 'float64')]
+
+# Parameters of the geometric detector (the defaults of geo_sac_detect).
+GEOMETRIC_PARAMS = {
+    'deltaT_inner_sec': 4 / 60.0,
+    'deltaT_outer_sec': 10 / 60.0,
+    'min_amplitude_deg': 25,
+    'max_orientation_dispersion_deg': 15,
+    'min_linear_velocity': 0.1,
+    'max_linear_acceleration': 20,
+    'max_angular_velocity': 8000,
+    'minimum_interval_sec': 10 / 60.0
+}
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# A planted saccade is found if a saccade has time_middle within this.
+MATCH_TOLERANCE_SEC = 0.1
+
+
+def synthetic_rows(n, num_obj_ids=1, saccade_rate_hz=1.0, seed=0,
+                   dt=1 / 60.0):
+    '''
+        Generates n rows of synthetic fly trajectories: straight flight
+        at about 0.3 m/s with small heading noise, and saccades (turns
+        of 40-120 deg lasting about 0.1 s) planted at random times.
+        The rows are split in ``num_obj_ids`` consecutive tracks.
+
+        Returns a tuple (rows, planted), where planted is the array
+        of the timestamps of the middle of the planted saccades.
+    '''
+    rng = np.random.RandomState(seed)
+    rows = np.zeros(n, dtype=benchmark_dtype)
+    rows['frame'] = np.arange(n)
+    rows['timestamp'] = rows['frame'] * dt
+    bounds = np.linspace(0, n, num_obj_ids + 1).astype('int64')
+    rows['obj_id'] = np.repeat(np.arange(1, num_obj_ids + 1),
+                               np.diff(bounds))
+
+    num_saccades = rng.poisson(saccade_rate_hz * n * dt)
+    centers = np.unique(rng.randint(0, n, size=num_saccades))
+    amplitude = (np.radians(rng.uniform(40, 120, size=len(centers))) *
+                 rng.choice([-1, 1], size=len(centers)))
+    impulses = np.zeros(n)
+    impulses[centers] = amplitude
+    kernel = np.hanning(9)[1:-1]
+    turn = (np.convolve(impulses, kernel / kernel.sum(), mode='same') +
+            rng.normal(0, 0.002, size=n))
+    heading = np.cumsum(turn)
+
+    speed = 0.3 * (1 + 0.01 * rng.normal(size=n))
+    rows['xvel'] = speed * np.cos(heading)
+    rows['yvel'] = speed * np.sin(heading)
+    rows['x'] = np.cumsum(rows['xvel']) * dt
+    rows['y'] = np.cumsum(rows['yvel']) * dt
+    rows['z'] = 0.2
+    rows['reduced_angular_velocity'] = turn / dt
+    rows['reduced_angular_orientation'] = heading
+    return rows, rows['timestamp'][centers]
+
+
+def detect_geometric(rows, profile=None):
+    saccades, _ = geometric_saccade_detect(rows, GEOMETRIC_PARAMS,
+                                           annotate=False, profile=profile)
+    return saccades
+
+
+def detect_angvel(rows, profile=None):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return angvel_saccade_detect(rows, profile=profile)['saccades']
+
+
+DETECTORS = {
+    'geometric': detect_geometric,
+    'angvel': detect_angvel,
+}
+
+
+def benchmark_detector(detector, rows, planted, repeat=3,
+                       measure_memory=True):
+    '''
+        Runs one of the DETECTORS ``repeat`` times on the rows, and
+        returns a dict with the best time, the stage times and counters
+        of the best run, the peak memory (bytes, measured in a separate
+        run; None if not available), and the number of saccades found
+        and of planted ones that were found.
+    '''
+    function = DETECTORS[detector]
+    best_time, best_profile = None, None
+    for _ in range(repeat):
+        profile = StageProfile()
+        t0 = time.time()
+        saccades = function(rows, profile)
+        t = time.time() - t0
+        if best_time is None or t < best_time:
+            best_time, best_profile = t, profile
+
+    peak_memory = None
+    if measure_memory and tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function(rows)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    profile = best_profile.as_dict()
+    return dict(detector=detector,
+                rows=len(rows),
+                obj_ids=len(np.unique(rows['obj_id'])),
+                time=best_time,
+                stages=dict((s['name'], s['time']) for s in profile['stages']),
+                counters=profile['counters'],
+                peak_memory=peak_memory,
+                saccades=len(saccades),
+                planted=len(planted),
+                found=count_found(planted, saccades['time_middle']))
+
+
+def count_found(planted, detected):
+    ''' Number of planted times within MATCH_TOLERANCE_SEC of
+        one of the detected times. '''
+    detected = np.sort(detected)
+    if len(detected) == 0:
+        return 0
+    k = np.searchsorted(detected, planted)
+    before = detected[np.maximum(k - 1, 0)]
+    after = detected[np.minimum(k, len(detected) - 1)]
+    distance = np.minimum(np.abs(before - planted), np.abs(after - planted))
+    return int(np.count_nonzero(distance <= MATCH_TOLERANCE_SEC))
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, num_obj_ids=1,
+                   detectors=('geometric', 'angvel'), repeat=3,
+                   measure_memory=True, seed=0):
+    '''
+        Runs the benchmark for each size and detector; returns a dict
+        with a description of the environment and the list of results
+        (see benchmark_detector()), which can be written as JSON.
+    '''
+    results = []
+    for n in sizes:
+        rows, planted = synthetic_rows(int(n), num_obj_ids=num_obj_ids,
+                                       seed=seed)
+        for detector in detectors:
+            logger.info('Benchmarking %s on %d rows (%d obj_ids).' %
+                        (detector, n, num_obj_ids))
+            results.append(benchmark_detector(detector, rows, planted,
+                                              repeat=repeat,
+                                              measure_memory=measure_memory))
+    return dict(version=__version__,
+                python=platform.python_version(),
+                numpy=np.__version__,
+                machine=platform.machine(),
+                results=results)
+
+
+def compare_with_baseline(benchmark, baseline, tolerance=0.25):
+    '''
+        Compares the results with those in baseline (both as returned
+        by run_benchmarks()) for the same detector, number of rows and
+        of obj_ids. Returns a list of dicts, one for each pair, with
+        the fields ``detector``, ``rows``, ``obj_ids``, ``time``,
+        ``baseline_time``, ``time_ratio``, ``time_regression`` (true if
+        the time increased by more than ``tolerance``, relative), and
+        the same for ``peak_memory``.
+    '''
+    def key(r):
+        return (r['detector'], r['rows'], r['obj_ids'])
+
+    reference = dict((key(r), r) for r in baseline['results'])
+    comparison = []
+    for r in benchmark['results']:
+        b = reference.get(key(r), None)
+        if b is None:
+            continue
+        c = dict(detector=r['detector'], rows=r['rows'],
+                 obj_ids=r['obj_ids'])
+        for field in ['time', 'peak_memory']:
+            if r[field] is None or not b[field]:
+                continue
+            c[field] = r[field]
+            c['baseline_' + field] = b[field]
+            c[field + '_ratio'] = r[field] * 1.0 / b[field]
+            c[field + '_regression'] = c[field + '_ratio'] > 1 + tolerance
+        comparison.append(c)
+    return comparison
+
+
+def format_results(benchmark, comparison=None):
+    ''' Returns a text table with the results. '''
+    lines = ['%-10s %9s %7s %9s %10s %9s %9s' %
+             ('detector', 'rows', 'obj_ids', 'time (s)', 'memory(MB)',
+              'saccades', 'found')]
+    for r in benchmark['results']:
+        memory = ('%.1f' % (r['peak_memory'] / 1e6)
+                  if r['peak_memory'] is not None else '-')
+        lines.append('%-10s %9d %7d %9.3f %10s %9d %5d/%d' %
+                     (r['detector'], r['rows'], r['obj_ids'], r['time'],
+                      memory, r['saccades'], r['found'], r['planted']))
+    if comparison:
+        lines.append('')
+        lines.append('Compared with the baseline:')
+        for c in comparison:
+            s = '%-10s %9d %7d' % (c['detector'], c['rows'], c['obj_ids'])
+            for field in ['time', 'peak_memory']:
+                if field + '_ratio' in c:
+                    s += '  %s x%.2f%s' % (field, c[field + '_ratio'],
+                         ' REGRESSION' if c[field + '_regression'] else '')
+            lines.append(s)
+    return '\n'.join(lines)
+
+
+usage = '''
+
+    %prog [--sizes 1000,10000,...] [--obj_ids N] [--output results.json]
+          [--baseline baseline.json]
+
+'''
+
+
+def benchmark_main(argv):
+    parser = LenientOptionParser(usage=usage)
+    parser.add_option("--sizes", default=','.join(map(str, DEFAULT_SIZES)),
+                      help="Comma-separated numbers of rows [= %default]")
+    parser.add_option("--obj_ids", default=1, type='int',
+                      help="Number of tracks [= %default]")
+    parser.add_option("--detectors", default='geometric,angvel',
+                      help="Comma-separated detectors [= %default]")
+    parser.add_option("--repeat", default=3, type='int',
+                      help="Number of runs; the best time is kept "
+                      "[= %default]")
+    parser.add_option("--no_memory", default=False, action='store_true',
+                      help="Does not measure the peak memory.")
+    parser.add_option("--output", default=None,
+                      help="Writes the results to this JSON file.")
+    parser.add_option("--baseline", default=None,
+                      help="Compares the results with this JSON file "
+                      "(written by --output); fails if slower.")
+    parser.add_option("--tolerance", default=0.25, type='float',
+                      help="Relative increase considered a regression "
+                      "[= %default]")
+    (options, args) = parser.parse_args(argv)
+    check_no_spurious(args)
+
+    sizes = [int(float(s)) for s in options.sizes.split(',')]
+    detectors = options.detectors.split(',')
+    for detector in detectors:
+        if not detector in DETECTORS:
+            raise UserError('Unknown detector %r (expected one of %s).' %
+                            (detector, ', '.join(sorted(DETECTORS))))
+
+    benchmark = run_benchmarks(sizes, num_obj_ids=options.obj_ids,
+                               detectors=detectors, repeat=options.repeat,
+                               measure_memory=not options.no_memory)
+
+    comparison = None
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare_with_baseline(benchmark, baseline,
+                                           tolerance=options.tolerance)
+
+    print(format_results(benchmark, comparison))
+
+    if options.output is not None:
+        with open(options.output, 'w') as f:
+            json.dump(benchmark, f, indent=2, sort_keys=True)
+        logger.info('Results written to %s' % options.output)
+
+    if comparison and any(c.get('time_regression', False) or
+                          c.get('peak_memory_regression', False)
+                          for c in comparison):
+        raise UserError('Performance regressions found.')
+
+
+def main():
+    wrap_script_entry_point(benchmark_main, logger)
+
+
+if __name__ == '__main__':
+    main()
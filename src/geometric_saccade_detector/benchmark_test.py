@@ -0,0 +1,40 @@
+from .benchmark import (synthetic_rows, run_benchmarks, compare_with_baseline,
+    count_found)
+from . import np
+import copy
+
+
+def synthetic_rows_test():
+    rows, planted = synthetic_rows(3000, num_obj_ids=3, seed=1)
+    assert len(rows) == 3000
+    assert list(np.unique(rows['obj_id'])) == [1, 2, 3]
+    assert np.all(np.diff(rows['timestamp']) > 0)
+    assert len(planted) > 20
+
+
+def count_found_test():
+    planted = np.array([1.0, 2.0, 3.0])
+    assert count_found(planted, np.array([])) == 0
+    assert count_found(planted, np.array([2.05])) == 1
+    assert count_found(planted, np.array([0.95, 3.0, 10])) == 2
+
+
+def run_benchmarks_test():
+    benchmark = run_benchmarks(sizes=[2000], num_obj_ids=2, repeat=1)
+    assert len(benchmark['results']) == 2
+    for r in benchmark['results']:
+        assert r['rows'] == 2000 and r['obj_ids'] == 2
+        assert r['time'] > 0
+        assert 'assembly' in r['stages']
+        # most planted saccades are found
+        assert r['found'] >= 0.8 * r['planted']
+
+    comparison = compare_with_baseline(benchmark, benchmark)
+    assert len(comparison) == 2
+    assert not any(c['time_regression'] for c in comparison)
+
+    slower = copy.deepcopy(benchmark)
+    for r in slower['results']:
+        r['time'] *= 2
+    comparison = compare_with_baseline(slower, benchmark, tolerance=0.5)
+    assert all(c['time_regression'] for c in comparison)
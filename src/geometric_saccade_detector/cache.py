@@ -0,0 +1,153 @@
+from . import np
+import hashlib
+import os
+import tempfile
+
+# Changing this invalidates the files written by previous versions.
+CACHE_FORMAT_VERSION = '1'
+
+# Default size cap (bytes) for the cache directory.
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# When the cache is full, files are deleted until its size is this
+# fraction of the cap, so that the directory is not scanned again
+# at every write.
+EVICTION_TARGET = 0.9
+
+
+class StageCache(object):
+    '''
+        On-disk memoization of the intermediate stages of the detector.
+
+        The output of each stage is a dict of arrays of the same length,
+        stored as a structured array in a ``.npy`` file whose name is
+        a hash of the stage name, the input arrays and the parameters
+        the stage depends on; so changing only the thresholds reuses
+        the kinematics and the geometry.
+
+        When the size of the directory exceeds ``max_size`` bytes,
+        the least recently used files are deleted. The size is scanned
+        when the cache is opened, and then updated with the files
+        written; the directory is scanned again only when this estimate
+        exceeds ``max_size`` (so the files written by other processes
+        are counted at that point).
+
+        The cache can be shared by several processes.
+    '''
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by somebody else in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        # estimated size of the directory
+        self.size = 0
+        self.evict()
+
+    def key(self, stage, arrays, params):
+        ''' Returns the hash of the stage name, the arrays, and the
+            params (a dict), as a hex string. '''
+        h = hashlib.sha1()
+        h.update(('%s %s' % (CACHE_FORMAT_VERSION, stage)).encode('utf-8'))
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            h.update(('%s %s' % (a.dtype.str, a.shape)).encode('utf-8'))
+            h.update(a.tobytes())
+        h.update(repr(sorted(params.items())).encode('utf-8'))
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        ''' Returns the stored dict of arrays, or None. '''
+        filename = self.filename(key)
+        try:
+            table = np.load(filename)
+            # mark as recently used
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return dict((field, table[field]) for field in table.dtype.names)
+
+    def put(self, key, values):
+        ''' Stores a dict of arrays of the same length. '''
+        fields = sorted(values.keys())
+        n = len(values[fields[0]])
+        table = np.zeros(shape=(n,), dtype=[(field, values[field].dtype)
+                                           for field in fields])
+        for field in fields:
+            table[field] = values[field]
+
+        # write to a temporary file and rename it, so that the other
+        # processes never see an incomplete file
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, table)
+        filename = self.filename(key)
+        self.size -= _file_size(filename)
+        os.rename(tmp, filename)
+        self.size += _file_size(filename)
+
+        if self.max_size is not None and self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        ''' Scans the directory; if its size is more than max_size,
+            deletes the least recently used files until it is at most
+            EVICTION_TARGET * max_size. '''
+        if self.max_size is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                s = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((s.st_mtime, s.st_size, filename))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            for _, size, filename in sorted(entries):
+                if total <= EVICTION_TARGET * self.max_size:
+                    break
+                try:
+                    os.remove(filename)
+                except OSError:
+                    # already removed by somebody else
+                    pass
+                total -= size
+        self.size = total
+
+    def cached(self, stage, arrays, params, compute):
+        ''' Returns the output of compute(), a dict of arrays,
+            reusing the stored one if available. '''
+        key = self.key(stage, arrays, params)
+        values = self.get(key)
+        if values is None:
+            values = compute()
+            self.put(key, values)
+        return values
+
+
+def _file_size(filename):
+    ''' Size of the file, or 0 if it does not exist. '''
+    try:
+        return os.stat(filename).st_size
+    except OSError:
+        return 0
+
+
+def cached_stage(cache, stage, arrays, params, compute):
+    ''' Same as cache.cached(...), but cache can be None. '''
+    if cache is None:
+        return compute()
+    return cache.cached(stage, arrays, params, compute)
@@ -0,0 +1,80 @@
+from .algorithm import geometric_saccade_detect
+from .cache import StageCache
+from .streaming_test import params, synthetic_track
+from . import np
+import os
+import shutil
+import tempfile
+
+
+def stage_cache_test():
+    rows = np.concatenate([synthetic_track(500, 1, 0, 1),
+                           synthetic_track(400, 2, 0, 2)])
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StageCache(directory)
+        expected, expected_annotated = geometric_saccade_detect(rows, params)
+        # first time: computed; second time: loaded
+        for _ in range(2):
+            saccades, annotated = geometric_saccade_detect(rows, params,
+                                                           cache=cache)
+            assert np.all(saccades['time_start'] == expected['time_start'])
+            assert np.all(annotated['preference'] == 
+                          expected_annotated['preference'])
+        # kinematics and geometry of each of the 2 segments
+        assert len(os.listdir(directory)) == 4
+
+        # changing only the thresholds reuses the same files
+        p = dict(params)
+        p['min_amplitude_deg'] = 40
+        geometric_saccade_detect(rows, p, cache=cache)
+        assert len(os.listdir(directory)) == 4
+
+        # the windows change the geometry but not the kinematics
+        p['deltaT_inner_sec'] = 3 / 60.0
+        geometric_saccade_detect(rows, p, cache=cache)
+        assert len(os.listdir(directory)) == 6
+    finally:
+        shutil.rmtree(directory)
+
+
+def stage_cache_eviction_test():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StageCache(directory, max_size=3000)
+        for i in range(10):
+            values = {'a': np.ones(100) * i}
+            assert cache.cached('stage', [np.array([i])], {}, 
+                                lambda: values) is values
+        assert len(os.listdir(directory)) < 10
+        # the last one is still there
+        values = cache.get(cache.key('stage', [np.array([9])], {}))
+        assert np.all(values['a'] == 9)
+    finally:
+        shutil.rmtree(directory)
+
+
+def stage_cache_size_test():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StageCache(directory, max_size=10000)
+        for i in range(8):
+            cache.put(cache.key('stage', [np.array([i])], {}),
+                      {'a': np.ones(100) * i})
+            # the size is tracked without scanning the directory
+            total = sum(os.path.getsize(os.path.join(directory, name))
+                        for name in os.listdir(directory))
+            assert cache.size == total
+        assert len(os.listdir(directory)) == 8
+
+        # past the cap, the directory is reduced to the target
+        for i in range(8, 20):
+            cache.put(cache.key('stage', [np.array([i])], {}),
+                      {'a': np.ones(100) * i})
+            assert cache.size <= 10000
+        assert len(os.listdir(directory)) < 12
+
+        # a new instance scans the size on opening
+        assert StageCache(directory, max_size=10000).size == cache.size
+    finally:
+        shutil.rmtree(directory)
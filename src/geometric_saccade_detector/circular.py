@@ -0,0 +1,99 @@
+from . import np
+
+# All functions work on arrays of any shape; the statistics are computed
+# along ``axis``. If ``valid`` (a boolean array like theta) is given,
+# only the valid entries are considered; for empty sets the mean of the
+# unit vectors is taken as (0, 0).
+
+
+def wrap(a, period=2 * np.pi):
+    '''
+        Wraps the angles a in the interval [-period/2, period/2].
+        Angles already in the interval are returned unchanged.
+    '''
+    return a - period * np.round(a / period)
+
+
+def wrap_pi(a):
+    ''' Wraps angles in radians in [-pi, pi]. '''
+    return wrap(a, 2 * np.pi)
+
+
+def wrap_180(d):
+    ''' Wraps angles in degrees in [-180, 180]. '''
+    return wrap(d, 360.0)
+
+
+def resultant(theta, axis=-1, valid=None):
+    ''' Returns the mean (C, S) of the unit vectors (cos, sin). '''
+    if valid is None:
+        return np.cos(theta).mean(axis=axis), np.sin(theta).mean(axis=axis)
+    n = np.maximum(valid.sum(axis=axis), 1)
+    C = np.where(valid, np.cos(theta), 0).sum(axis=axis) / n
+    S = np.where(valid, np.sin(theta), 0).sum(axis=axis) / n
+    return C, S
+
+
+def vector_resultant(x, y, axis=-1, valid=None):
+    '''
+        Same as resultant(np.arctan2(y, x)), computed without the angles;
+        zero vectors count as angle 0.
+    '''
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    r = np.hypot(x, y)
+    nonzero = r > 0
+    if valid is not None:
+        nonzero = np.logical_and(nonzero, valid)
+    C = np.divide(x, r, out=np.zeros(r.shape), where=nonzero)
+    S = np.divide(y, r, out=np.zeros(r.shape), where=nonzero)
+    C[np.logical_not(nonzero)] = 1
+    if valid is None:
+        return C.mean(axis=axis), S.mean(axis=axis)
+    C[np.logical_not(valid)] = 0
+    n = np.maximum(valid.sum(axis=axis), 1)
+    return C.sum(axis=axis) / n, S.sum(axis=axis) / n
+
+
+def circular_mean(theta, axis=-1, valid=None):
+    ''' Direction of the mean of the unit vectors. '''
+    C, S = resultant(theta, axis=axis, valid=valid)
+    return np.arctan2(S, C)
+
+
+def resultant_length(theta, axis=-1, valid=None):
+    ''' Length R of the mean of the unit vectors (1: all the same). '''
+    C, S = resultant(theta, axis=axis, valid=valid)
+    return np.hypot(C, S)
+
+
+def circular_std(theta, axis=-1, valid=None):
+    ''' Circular standard deviation sqrt(-2 log R). '''
+    R = resultant_length(theta, axis=axis, valid=valid)
+    return circular_std_from_length(R)
+
+
+def circular_std_from_length(R):
+    ''' Circular standard deviation given the resultant length. '''
+    # R can be slightly larger than 1 because of rounding, and
+    # the deviation is infinite for R = 0
+    R = np.clip(R, np.finfo('float64').tiny, 1)
+    return np.sqrt(-2 * np.log(R))
+
+
+def wrapped_std(theta, mean=None, axis=-1, valid=None):
+    '''
+        Standard deviation of the differences between the angles and
+        their mean direction (by default, the circular mean), wrapped
+        in [-pi, pi]. This is the dispersion used by the detector.
+    '''
+    if mean is None:
+        mean = circular_mean(theta, axis=axis, valid=valid)
+    error = wrap_pi(theta - np.expand_dims(mean, axis))
+    if valid is None:
+        return error.std(axis=axis)
+    n = np.maximum(valid.sum(axis=axis), 1)
+    error = np.where(valid, error, 0)
+    error_mean = error.sum(axis=axis) / n
+    deviation = np.where(valid, error - np.expand_dims(error_mean, axis), 0)
+    return np.sqrt((deviation ** 2).sum(axis=axis) / n)
@@ -0,0 +1,40 @@
+from .circular import (wrap_pi, wrap_180, circular_mean, resultant_length,
+    circular_std, wrapped_std)
+from .math_utils import angle_mean_and_std
+from . import np
+from numpy.testing import assert_allclose
+
+
+def wrap_test():
+    a = np.linspace(-20, 20, 1001)
+    assert_allclose(wrap_pi(a), np.arctan2(np.sin(a), np.cos(a)), atol=1e-12)
+    assert np.all(np.abs(wrap_pi(a)) <= np.pi)
+    d = np.linspace(-1000, 1000, 1001)
+    assert_allclose(np.radians(wrap_180(d)), wrap_pi(np.radians(d)),
+                    atol=1e-12)
+    # angles in the interval are not changed
+    b = np.linspace(-np.pi, np.pi, 101)
+    assert np.all(wrap_pi(b) == b)
+
+
+def windows_test():
+    rng = np.random.RandomState(0)
+    theta = rng.normal(2.5, 0.3, size=(50, 20))
+    valid = rng.rand(50, 20) < 0.7
+    valid[0] = False
+
+    mean = circular_mean(theta, valid=valid)
+    std = wrapped_std(theta, mean, valid=valid)
+    R = resultant_length(theta, valid=valid)
+    assert mean[0] == 0 and std[0] == 0 and R[0] == 0
+    for i in range(1, 50):
+        m, s = angle_mean_and_std(theta[i][valid[i]])
+        assert_allclose([mean[i], std[i]], [m, s], atol=1e-12)
+
+    # same along the other axis
+    assert_allclose(circular_mean(theta.T, axis=0), circular_mean(theta))
+    assert_allclose(wrapped_std(theta.T, axis=0), wrapped_std(theta))
+
+    # concentrated distributions: the estimators agree
+    assert_allclose(circular_std(theta), wrapped_std(theta), rtol=0.1)
+    assert np.all(R <= 1)
@@ -1,11 +1,13 @@
 from . import logger, __version__, np  # XXX: make this coherent
-from .algorithm import geometric_saccade_detect
+from .parallel import geometric_saccade_detect_tracks
+from .cache import StageCache
+from .profiling import StageProfile
 from .debug_output import write_debug_output
 from .flydra_db_utils import (get_good_smoothed_tracks, get_good_files,
     timestamp_string_from_filename)
 from .io import saccades_write_all
 from .utils import get_user
-from .well_formed_saccade import check_saccade_is_well_formed
+from .well_formed_saccade import validate_saccades
 from datetime import datetime
 from optparse import OptionParser
 import os
@@ -36,7 +38,9 @@ def main():
                       help="Smoothing dynamical model [default: %default]",
                       default="mamarama, units: mm")
     
-    parser.add_option("--debug_output", help="Creates debug figures.",
+    parser.add_option("--debug_output", help="Creates debug figures. "
+                      "Without it, the annotated rows are not computed "
+                      "(as with --lean in flydra_db_detect).",
                       default=False, action="store_true")
 
     parser.add_option("--nocache", help="Ignores already computed results.",
@@ -45,6 +49,23 @@ def main():
     parser.add_option("--smoothing", help="Uses Kalman-smoothed data.",
                       default=False, action="store_true")
 
+    parser.add_option("--jobs", default=1, type='int',
+                      help="Number of processes used to detect the saccades "
+                      "of the tracks in each file [= %default]")
+
+    parser.add_option("--cache_dir", default=None,
+                      help="If given, directory used to store the "
+                      "intermediate results (kinematics and geometry), which "
+                      "are reused when only the thresholds change.")
+
+    parser.add_option("--cache_size_mb", default=1024, type='float',
+                      help="Maximum size of the cache directory (MB) "
+                      "[= %default]")
+
+    parser.add_option("--profile", default=False, action='store_true',
+                      help="Logs the time spent in each stage of the "
+                      "detection, and some counters.")
+
     # detection parameters
     dt = 1.0 / 60
     parser.add_option("--deltaT_inner_sec", default=4 * dt, type='float',
@@ -67,6 +88,10 @@ def main():
                       help="Maximum dispersion (deg) [= %default]")
     parser.add_option("--minimum_interval_sec", default=10 * dt, type='float',
                       help="Minimum interval between saccades. [= %default]")
+    parser.add_option("--dispersion_estimator", default='wrapped_std',
+                      type='choice', choices=['wrapped_std', 'circular_std'],
+                      help="Dispersion estimator: wrapped_std or the faster "
+                      "circular_std [= %default]")
     
     (options, args) = parser.parse_args()
     
@@ -81,6 +106,12 @@ def main():
         
     if not os.path.exists(options.output_dir):
         os.makedirs(options.output_dir)
+        
+    if options.cache_dir is not None:
+        cache = StageCache(options.cache_dir,
+                           max_size=int(options.cache_size_mb * 1024 * 1024))
+    else:
+        cache = None
 
     good_files = get_good_files(where=args, pattern="*.kh5",
                                 confirm_problems=options.confirm_problems)
@@ -110,20 +141,14 @@ def main():
             logger.info("File %d/%d %s %s %s " % 
                         (i, n, str(filename), str(obj_ids), stim_fname))
             
-            # concatenate all in one track
-            all_data = None
-    
-            for _, rows in get_good_smoothed_tracks(
+            tracks = [rows for _, rows in get_good_smoothed_tracks(
                     filename=filename,
                     obj_ids=obj_ids,
                     min_frames_per_track=options.min_frames_per_track,
                     dynamic_model_name=options.dynamic_model_name,
-                    use_smoothing=options.smoothing):
-    
-                all_data = rows.copy() if all_data is None \
-                            else np.concatenate((all_data, rows))                
+                    use_smoothing=options.smoothing)]
             
-            if all_data is None:
+            if not tracks:
                 logger.info('Not enough data found for %s; skipping.' % 
                             filename)
                 continue
@@ -138,12 +163,18 @@ def main():
               'max_linear_acceleration': options.max_linear_acceleration,
               'min_linear_velocity': options.min_linear_velocity,
               'max_angular_velocity': options.max_angular_velocity,
+              'dispersion_estimator': options.dispersion_estimator,
             }
-            saccades, annotated_data = geometric_saccade_detect(all_data,
-                                                                params)
+            profile = StageProfile() if options.profile else None
+            saccades, annotated_data = geometric_saccade_detect_tracks(
+                                            tracks, params,
+                                            jobs=options.jobs,
+                                            annotate=options.debug_output,
+                                            cache=cache, profile=profile)
+            if profile is not None:
+                profile.log()
     
-            for saccade in saccades:
-                check_saccade_is_well_formed(saccade)
+            validate_saccades(saccades, strict=True)
                 
             # other fields used for managing different samples, 
             # used in the analysis
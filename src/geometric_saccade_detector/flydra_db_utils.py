@@ -1,5 +1,7 @@
 from . import logger, np
 from .structures import rows_dtype
+from .tracks import (concatenate_tracks, check_increasing_frames,
+    extract_interesting_fields)
 from .utils import locate_roots
 from flydra.a2 import xml_stimulus  # @UnresolvedImport
 import flydra.a2.core_analysis as core_analysis  # @UnresolvedImport
@@ -111,100 +113,105 @@ def get_good_smoothed_tracks(filename, obj_ids,
                              use_smoothing,
                              dynamic_model_name):
     ''' Yields (obj_id, rows) for each track in obj_ids in the file
-        that has the given minimum number of frames. '''
-            
+        that has the given minimum number of frames. The rows are views
+        of the array returned by load_good_tracks(). '''
+    good_obj_ids, rows, bounds = load_good_tracks(filename, obj_ids,
+                                                  min_frames_per_track,
+                                                  use_smoothing,
+                                                  dynamic_model_name)
+    for k, obj_id in enumerate(good_obj_ids):
+        yield obj_id, rows[bounds[k]:bounds[k + 1]]
+
+
+def load_good_tracks(filename, obj_ids,
+                     min_frames_per_track,
+                     use_smoothing,
+                     dynamic_model_name):
+    ''' 
+        Loads the tracks in obj_ids in the file that have the given
+        minimum number of frames.
+        
+        Returns a tuple (good_obj_ids, rows, bounds): rows is a single 
+        array (with rows_dtype) containing all the tracks, and the 
+        rows of the track good_obj_ids[k] are rows[bounds[k]:bounds[k+1]].
+        The data is copied from flydra's arrays only once. 
+    '''
     frames_per_second = 60.0
     dt = 1 / frames_per_second
 
     ca = core_analysis.get_global_CachingAnalyzer()  
-        
-    warned = False
     
-    #obj_ids, unique_obj_ids, is_mat_file, data_file, extra = \
-    #     ca.initial_file_load(filename)
     data_file = filename
     
-    for obj_id in obj_ids:
-        try:
-            frows = ca.load_data(obj_id, data_file, use_kalman_smoothing=False)
-
+    # The number of frames of each obj_id is known from the obj_id
+    # of all the rows (which flydra reads anyway and caches), so that
+    # the tracks that are too small are never read.
+    (all_obj_ids, _, _, _, _) = ca.initial_file_load(data_file)
+    unique_obj_ids, inverse = np.unique(all_obj_ids, return_inverse=True)
+    num_frames = dict(zip(unique_obj_ids, np.bincount(inverse)))
+    
+    good = [obj_id for obj_id in obj_ids 
             # don't consider tracks too small
-            if len(frows) < min_frames_per_track:
-                continue
-
-            # write timestamp entry
-            
-            # The 'timestamp' field returned by flydra is the time
-            # when the computation was made, not the actual data timestamp.
-            # For computing the actual timestamp, use the frame number
-            # and multiply by dt
-            
-            global warned_fixed_dt
-            if not warned_fixed_dt:
-                warned_fixed_dt = True
-                logger.info('Warning: We are assuming that the data is ' \
-                      'equally spaced, and fps = %s.' % frames_per_second)
-
-            for i in range(len(frows)):
-                frows['timestamp'][i] = frows['frame'][i] * dt
-                
-            for i in range(len(frows) - 1):
-                if frows['obj_id'][i] == frows['obj_id'][i + 1]:
-                    assert frows['timestamp'][i] < frows['timestamp'][i + 1]
-                
-            # return raw data if smoothing is not requested
-            if not use_smoothing:
-                yield (obj_id,
-                       extract_interesting_fields(frows,
-                                                  np.dtype(rows_dtype)))
-                continue
-
-            # otherwise, run the smoothing
-            srows = ca.load_data(obj_id, data_file, use_kalman_smoothing=True,
-                     frames_per_second=frames_per_second,
-                     dynamic_model_name=dynamic_model_name)
-                     
-            # make a copy, just in case
-            srows = srows.copy()
-
-            for i in range(len(srows)):
-                srows['timestamp'][i] = srows['frame'][i] * dt
-            
-            # From Andrew:
-            # I'm pretty sure there is an inconsistency in some of this 
-            # unit stuff. Basically, I used to do the camera calibrations 
-            # all in mm (so that the 3D coords would come out in mm). Then,
-            # I started doing analyses in meters... And I think some of
-            # the calibration and dynamic model stuff got defaulted to meters.
-            # And basically there are inconsistencies in there.
-            # Anyhow, I think the extent of the issue is that you'll be off 
-            # by 1000, so hopefully you can just determine that by looking 
-            # at the data.
-            # quick fix
-            if dynamic_model_name == "mamarama, units: mm" and not warned:
-                warned = True
-                logger.info("Warning: Implementing simple workaround"
-                            " for flydra's " 
-                            "units inconsistencies "
-                            "(multiplying xvel,yvel by 1000).")
-                srows['xvel'] *= 1000
-                srows['yvel'] *= 1000
-                
-            yield obj_id, extract_interesting_fields(srows,
-                                                     np.dtype(rows_dtype))
-            
-        except core_analysis.NotEnoughDataToSmoothError:
-            #logger.warning('not enough data to 
-            # smooth obj_id %d, skipping.'%(obj_id,))
-            continue 
+            if num_frames.get(obj_id, 0) >= min_frames_per_track]
+    
+    def load_tracks():
+        for obj_id in good:
+            try:
+                if use_smoothing:
+                    frows = ca.load_data(obj_id, data_file,
+                                     use_kalman_smoothing=True,
+                                     frames_per_second=frames_per_second,
+                                     dynamic_model_name=dynamic_model_name)
+                else:
+                    frows = ca.load_data(obj_id, data_file,
+                                         use_kalman_smoothing=False)
+            except core_analysis.NotEnoughDataToSmoothError:
+                #logger.warning('not enough data to 
+                # smooth obj_id %d, skipping.'%(obj_id,))
+                continue 
+    
+            check_increasing_frames(frows)
+            yield obj_id, frows
+    
+    # The buffer is allocated from the number of frames of the tracks
+    # (exact without smoothing), and each track is copied as soon as
+    # it is loaded, so flydra's arrays are not kept.
+    capacity = sum(num_frames[obj_id] for obj_id in good)
+    good_obj_ids, rows, bounds = concatenate_tracks(load_tracks(), rows_dtype,
+                                                    capacity)
         
+    # The 'timestamp' field returned by flydra is the time
+    # when the computation was made, not the actual data timestamp.
+    # For computing the actual timestamp, use the frame number
+    # and multiply by dt
+    global warned_fixed_dt
+    if good_obj_ids and not warned_fixed_dt:
+        warned_fixed_dt = True
+        logger.info('Warning: We are assuming that the data is ' \
+              'equally spaced, and fps = %s.' % frames_per_second)
+    np.multiply(rows['frame'], dt, out=rows['timestamp'])
+
+    # From Andrew:
+    # I'm pretty sure there is an inconsistency in some of this 
+    # unit stuff. Basically, I used to do the camera calibrations 
+    # all in mm (so that the 3D coords would come out in mm). Then,
+    # I started doing analyses in meters... And I think some of
+    # the calibration and dynamic model stuff got defaulted to meters.
+    # And basically there are inconsistencies in there.
+    # Anyhow, I think the extent of the issue is that you'll be off 
+    # by 1000, so hopefully you can just determine that by looking 
+    # at the data.
+    # quick fix (applied, as it always has been, to the first track only)
+    if (use_smoothing and good_obj_ids and 
+        dynamic_model_name == "mamarama, units: mm"):
+        logger.info("Warning: Implementing simple workaround"
+                    " for flydra's " 
+                    "units inconsistencies "
+                    "(multiplying xvel,yvel by 1000).")
+        first = rows[bounds[0]:bounds[1]]
+        first['xvel'] *= 1000
+        first['yvel'] *= 1000
+            
     ca.close()
+    return good_obj_ids, rows, bounds
 
-
-def extract_interesting_fields(a, dtype):
-    ''' Returns a copy of a with only the fields in dtype. '''
-    res = np.ndarray(shape=a.shape, dtype=dtype)
-    for field in dtype.fields:
-        res[field] = a[field]
-    
-    return res
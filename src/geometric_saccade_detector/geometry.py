@@ -0,0 +1,417 @@
+from . import np
+from .math_utils import find_window_bounds, is_sorted
+from .circular import (circular_mean, wrapped_std, vector_resultant,
+    circular_std_from_length)
+
+try:
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # numpy < 1.20
+    from numpy.lib.stride_tricks import as_strided
+
+    def sliding_window_view(x, window_shape):
+        x = np.asarray(x)
+        shape = (len(x) - window_shape + 1, window_shape)
+        strides = (x.strides[0], x.strides[0])
+        return as_strided(x, shape=shape, strides=strides, writeable=False)
+
+# Maximum number of (center, neighbour) pairs processed at once
+# by get_orientation_and_dispersion_batch. Each pair needs a handful
+# of float64 temporaries, so this keeps the memory used bounded
+# to some tens of MB regardless of the length of the track.
+DEFAULT_CHUNK_ELEMENTS = 2 ** 18
+
+# The window bounds are extended by this (in seconds), so that the
+# points at exactly deltaT from the center are included in the window
+# regardless of the rounding of the timestamps (for example, with
+# timestamp = frame * dt, timestamp[i] - 4 * dt is sometimes larger 
+# than timestamp[i - 4], sometimes not).
+WINDOW_TOLERANCE_SEC = 1e-6
+
+# In the uniform path, if fewer than this fraction of the points in the
+# range of the requested centers are requested, only those are computed.
+SPARSE_CENTERS_FRACTION = 0.5
+
+# Estimators of the dispersion of a branch (parameter 
+# ``dispersion_estimator``):
+# - 'wrapped_std': std of the angles minus their circular mean, 
+#   wrapped in [-pi, pi] (the original metric);
+# - 'circular_std': the circular standard deviation sqrt(-2 log R), 
+#   computed in one pass from the sums of the unit vectors.
+DISPERSION_ESTIMATORS = ['wrapped_std', 'circular_std']
+DEFAULT_DISPERSION_ESTIMATOR = 'wrapped_std'
+
+
+def find_branch_windows(timestamp, frame, deltaT_inner_sec, deltaT_outer_sec,
+                        uniform_fast_path=True):
+    ''' 
+        Finds the "before" and "after" windows for all points.
+        
+        For the i-th point, the before window contains the points j with
+        
+            timestamp[i] - deltaT_outer_sec <= timestamp[j] 
+                                            <= timestamp[i] - deltaT_inner_sec
+                                            
+        and symmetrically for the after window (up to 
+        WINDOW_TOLERANCE_SEC).
+        
+        Returns a dict with fields:
+        
+        - ``num_points``: the number of points;
+        - ``order``: either a slice or the permutation that sorts 
+          the timestamps;
+        - ``dt``: the sampling interval if the data is uniformly sampled,
+          the windows are constant offsets, and ``uniform_fast_path`` is
+          true; None otherwise;
+        - ``k_inner``, ``k_outer``: if dt is not None, the window 
+          bounds as number of samples: the before window of the i-th
+          point is  i - k_outer .. i - k_inner  and the after window 
+          i + k_inner .. i + k_outer (cut at the ends of the data);
+        - ``before_start``, ``before_stop``, ``after_start``, ``after_stop``:
+          if dt is None, the window of the i-th point is  
+          slice(start[i], stop[i]) in the arrays ordered by ``order``.
+          
+        Use get_window_bounds() to obtain the windows of some points
+        in both cases.
+    '''
+    n = len(timestamp)
+    inner = deltaT_inner_sec - WINDOW_TOLERANCE_SEC
+    outer = deltaT_outer_sec + WINDOW_TOLERANCE_SEC
+    dt = None
+    if uniform_fast_path:
+        dt = get_uniform_sampling_interval(frame, timestamp)
+
+    if dt is not None:
+        # The windows should be constant offsets; this is checked 
+        # with the same comparisons as the generic path (the jitter 
+        # can move a point across a bound), and the generic path is 
+        # used if they are not.
+        k_inner = int(np.ceil(inner / dt))
+        k_outer = int(np.floor(outer / dt))
+        if (1 <= k_inner <= k_outer < n - 1 and
+            constant_offsets_exact(timestamp, k_inner, k_outer,
+                                   inner, outer)):
+            return dict(num_points=n, order=slice(None), dt=dt,
+                        k_inner=k_inner, k_outer=k_outer)
+
+    # Each window is a contiguous slice of the rows sorted by timestamp.
+    if is_sorted(timestamp):
+        order = slice(None)
+    else:
+        order = np.argsort(timestamp, kind='mergesort')
+    sorted_timestamp = timestamp[order]
+    before_start, before_stop = find_window_bounds(sorted_timestamp,
+                lower_offset=-outer, upper_offset=-inner, t_center=timestamp)
+    after_start, after_stop = find_window_bounds(sorted_timestamp,
+                lower_offset=+inner, upper_offset=+outer, t_center=timestamp)
+    return dict(num_points=n, order=order, dt=None, k_inner=None,
+                k_outer=None,
+                before_start=before_start, before_stop=before_stop,
+                after_start=after_start, after_stop=after_stop)
+
+
+def constant_offsets_exact(timestamp, k_inner, k_outer, inner, outer):
+    ''' 
+        Returns true if, for all points i, the windows of the points j
+        with  inner <= |timestamp[j] - timestamp[i]| <= outer  are 
+        exactly  i - k_outer .. i - k_inner  and  i + k_inner .. i + k_outer
+        (cut at the ends of the data). The timestamps must be strictly 
+        increasing, and  1 <= k_inner <= k_outer < len(timestamp) - 1.
+    '''
+    n = len(timestamp)
+    
+    def later(k):
+        return timestamp[k:]
+    
+    def earlier(k):
+        return timestamp[:n - k]
+    
+    # For each bound, the point at the bound is inside the window and
+    # its neighbour outside; the comparisons are those of 
+    # find_window_bounds() (t_center + offset against t).
+    checks = [
+        lambda: later(k_inner) >= earlier(k_inner) + inner,
+        lambda: earlier(k_inner) <= later(k_inner) - inner,
+        lambda: later(k_inner - 1) < earlier(k_inner - 1) + inner,
+        lambda: earlier(k_inner - 1) > later(k_inner - 1) - inner,
+        lambda: later(k_outer) <= earlier(k_outer) + outer,
+        lambda: earlier(k_outer) >= later(k_outer) - outer,
+        lambda: later(k_outer + 1) > earlier(k_outer + 1) + outer,
+        lambda: earlier(k_outer + 1) < later(k_outer + 1) - outer,
+    ]
+    return all(np.all(check()) for check in checks)
+
+
+def get_window_bounds(windows, centers):
+    ''' 
+        Returns the windows (returned by find_branch_windows()) of the
+        given centers, as 4 arrays:
+        
+            before_start, before_stop, after_start, after_stop
+            
+        (the windows are slices of the arrays ordered by 
+        windows['order']).
+    '''
+    if windows['dt'] is None:
+        return tuple(windows[field][centers] for field in 
+                     ['before_start', 'before_stop', 
+                      'after_start', 'after_stop'])
+    centers = np.asarray(centers, dtype='int64')
+    n = windows['num_points']
+    k_inner, k_outer = windows['k_inner'], windows['k_outer']
+    return (np.clip(centers - k_outer, 0, n),
+            np.clip(centers - k_inner + 1, 0, n),
+            np.clip(centers + k_inner, 0, n),
+            np.clip(centers + k_outer + 1, 0, n))
+
+
+def has_enough_points(windows, min_points=2):
+    ''' 
+        Returns a boolean array that is true for the points whose 
+        windows both contain at least min_points points.
+    '''
+    n = windows['num_points']
+    if windows['dt'] is None:
+        num_before = windows['before_stop'] - windows['before_start']
+        num_after = windows['after_stop'] - windows['after_start']
+        return (num_before >= min_points) & (num_after >= min_points)
+    
+    # The before window grows with i (until it is complete) and the
+    # after window shrinks near the end; so the points are a range.
+    k_inner, k_outer = windows['k_inner'], windows['k_outer']
+    enough = np.zeros(n, dtype='bool')
+    if k_outer - k_inner + 1 >= min_points:
+        first = k_inner + min_points - 1
+        stop = n - k_inner - min_points + 1
+        enough[first:max(first, stop)] = True
+    return enough
+
+
+def get_branch_geometry(windows, x, y, centers,
+                        chunk_elements=DEFAULT_CHUNK_ELEMENTS,
+                        estimator=DEFAULT_DISPERSION_ESTIMATOR):
+    ''' 
+        Computes orientation and dispersion of the before and after 
+        branches for the given centers, using the windows returned 
+        by find_branch_windows(). 
+        
+        Returns a tuple of 4 arrays (in radians): 
+        
+            before_orientation, before_dispersion, 
+            after_orientation, after_dispersion 
+            
+        The dispersion is computed with the given estimator
+        (one of DISPERSION_ESTIMATORS).
+    '''
+    check_dispersion_estimator(estimator)
+    centers = np.asarray(centers, dtype='int64')
+    if len(centers) == 0:
+        return tuple(np.zeros(0) for _ in range(4))
+
+    if windows['dt'] is None:
+        before_start, before_stop, after_start, after_stop = \
+            get_window_bounds(windows, centers)
+        order = windows['order']
+        sorted_x = x[order]
+        sorted_y = y[order]
+        x0 = x[centers]
+        y0 = y[centers]
+        before = get_orientation_and_dispersion_batch(sorted_x, sorted_y,
+                        x0, y0, before_start, before_stop, chunk_elements,
+                        estimator)
+        after = get_orientation_and_dispersion_batch(sorted_x, sorted_y,
+                        x0, y0, after_start, after_stop, chunk_elements,
+                        estimator)
+        return before + after
+
+    # Uniform sampling: use strided views for all centers whose 
+    # windows are inside the data, and the generic batch 
+    # only for those near the ends.
+    k_inner = windows['k_inner']
+    k_outer = windows['k_outer']
+    length = k_outer - k_inner + 1
+    n = len(x)
+    inside = np.logical_and(centers - k_outer >= 0, 
+                            centers + k_outer <= n - 1)
+    results = [np.zeros(len(centers)) for _ in range(4)]
+
+    full = centers[inside]
+    if len(full) > 0:
+        # The points with complete windows are a contiguous range.
+        # If most of them are requested, we compute all of them and 
+        # select the requested ones; otherwise, only the requested ones.
+        first, stop = full.min(), full.max() + 1
+        if len(full) >= SPARSE_CENTERS_FRACTION * (stop - first):
+            subset, select = None, full - first
+        else:
+            subset, select = full, slice(None)
+        before = get_orientation_and_dispersion_strided(x, y,
+                            offset=-k_outer, length=length,
+                            first=first, stop=stop,
+                            chunk_elements=chunk_elements,
+                            estimator=estimator, centers=subset)
+        after = get_orientation_and_dispersion_strided(x, y,
+                            offset=+k_inner, length=length,
+                            first=first, stop=stop,
+                            chunk_elements=chunk_elements,
+                            estimator=estimator, centers=subset)
+        for r, values in zip(results, before + after):
+            r[inside] = values[select]
+
+    outside = np.logical_not(inside)
+    if np.any(outside):
+        before_start, before_stop, after_start, after_stop = \
+            get_window_bounds(windows, centers[outside])
+        x0 = x[centers[outside]]
+        y0 = y[centers[outside]]
+        before = get_orientation_and_dispersion_batch(x, y, x0, y0,
+                    before_start, before_stop, chunk_elements, estimator)
+        after = get_orientation_and_dispersion_batch(x, y, x0, y0,
+                    after_start, after_stop, chunk_elements, estimator)
+        for r, values in zip(results, before + after):
+            r[outside] = values
+
+    return tuple(results)
+
+
+def check_dispersion_estimator(estimator):
+    if not estimator in DISPERSION_ESTIMATORS:
+        raise ValueError('Unknown dispersion estimator %r (expected one of %s).'
+                         % (estimator, ', '.join(DISPERSION_ESTIMATORS)))
+
+
+def get_uniform_sampling_interval(frame, timestamp):
+    ''' 
+        Returns the average sampling interval if the frames are 
+        consecutive and the timestamps increasing; otherwise, returns 
+        None. (Whether the timestamps are evenly spaced enough is 
+        checked by constant_offsets_exact().)
+    '''
+    n = len(frame)
+    if n < 2 or frame[-1] - frame[0] != n - 1 or not is_sorted(frame):
+        return None
+    if not is_sorted(timestamp):
+        return None
+    return (timestamp[-1] - timestamp[0]) / (n - 1)
+
+
+def get_orientation_and_dispersion_batch(x, y, x0, y0, start, stop,
+                                chunk_elements=DEFAULT_CHUNK_ELEMENTS,
+                                estimator=DEFAULT_DISPERSION_ESTIMATOR):
+    '''
+        Batched version of get_orientation_and_dispersion.
+
+        x, y: coordinates of all the points.
+        x0, y0: coordinates of the K centers.
+        start, stop: arrays of K elements; the window for the k-th center
+            is given by the points  slice(start[k], stop[k]). Each window
+            must contain at least 2 points.
+
+        Returns two arrays (orientation, dispersion) of K elements,
+        in radians.
+
+        The centers are processed in chunks, so that the displacement
+        matrices (K x window) never have more than ``chunk_elements``
+        elements. The dispersion is computed with ``estimator``.
+    '''
+    start = np.asarray(start, dtype='int64')
+    stop = np.asarray(stop, dtype='int64')
+    K = len(start)
+    orientation = np.zeros(K)
+    dispersion = np.zeros(K)
+    if K == 0:
+        return orientation, dispersion
+
+    length = stop - start
+    assert np.all(length >= 2)
+
+    max_length = length.max()
+    chunk_size = max(1, int(chunk_elements // max_length))
+
+    offsets = np.arange(max_length)
+    for a in range(0, K, chunk_size):
+        b = min(K, a + chunk_size)
+        W = length[a:b].max()
+        # valid[k, w] is true if the w-th element of the k-th window exists
+        valid = offsets[np.newaxis, :W] < length[a:b, np.newaxis]
+        # indices of the neighbours; invalid entries point to the start
+        indices = start[a:b, np.newaxis] + np.where(valid, offsets[:W], 0)
+        dx = x[indices] - x0[a:b, np.newaxis]
+        dy = y[indices] - y0[a:b, np.newaxis]
+        orientation[a:b], dispersion[a:b] = \
+            _orientation_and_dispersion(dx, dy, valid, estimator)
+
+    assert not np.any(np.isnan(orientation))
+    assert not np.any(np.isnan(dispersion))
+
+    return orientation, dispersion
+
+
+def get_orientation_and_dispersion_strided(x, y, offset, length, first, stop,
+                                chunk_elements=DEFAULT_CHUNK_ELEMENTS,
+                                estimator=DEFAULT_DISPERSION_ESTIMATOR,
+                                centers=None):
+    '''
+        Computes orientation and dispersion for the centers 
+        in  range(first, stop), using as the window of the i-th center 
+        the points  slice(i + offset, i + offset + length).
+        
+        The windows are zero-copy strided views of x and y; all windows
+        must be inside the arrays. 
+        
+        If ``centers`` (indices in range(first, stop)) is given,
+        only those centers are computed. 
+        
+        Returns two arrays (orientation, dispersion), in radians,
+        with one element per center;
+        the dispersion is computed with ``estimator``.
+    '''
+    assert first + offset >= 0
+    assert stop + offset + length - 1 <= len(x)
+    x_windows = sliding_window_view(x, length)
+    y_windows = sliding_window_view(y, length)
+
+    K = stop - first if centers is None else len(centers)
+    orientation = np.zeros(K)
+    dispersion = np.zeros(K)
+    chunk_size = max(1, int(chunk_elements // length))
+    for a in range(0, K, chunk_size):
+        b = min(K, a + chunk_size)
+        if centers is None:
+            # (slices, so that nothing is copied)
+            i = slice(first + a, first + b)
+            windows = slice(first + a + offset, first + b + offset)
+        else:
+            i = centers[a:b]
+            windows = i + offset
+        dx = x_windows[windows] - x[i, np.newaxis]
+        dy = y_windows[windows] - y[i, np.newaxis]
+        orientation[a:b], dispersion[a:b] = \
+            _orientation_and_dispersion(dx, dy, None, estimator)
+
+    assert not np.any(np.isnan(orientation))
+    assert not np.any(np.isnan(dispersion))
+
+    return orientation, dispersion
+
+
+def _orientation_and_dispersion(dx, dy, valid=None,
+                                estimator=DEFAULT_DISPERSION_ESTIMATOR):
+    ''' 
+        Computes orientation and dispersion of the displacements (dx, dy)
+        along the last axis. If given, only the entries where ``valid``
+        is true are considered.
+    '''
+    # (empty windows give orientation 0 instead of NaN)
+    if estimator == 'circular_std':
+        # the unit vectors are enough; no need for the angles
+        C, S = vector_resultant(dx, dy, valid=valid)
+        return np.arctan2(S, C), circular_std_from_length(np.hypot(C, S))
+
+    # angle of each neighbour with respect to the center
+    # (computed with the same precision as the coordinates)
+    theta = np.array(np.arctan2(dy, dx), dtype='float64')
+
+    mean = circular_mean(theta, valid=valid)
+    std = wrapped_std(theta, mean, valid=valid)
+
+    return mean, std
@@ -0,0 +1,133 @@
+from .geometry import (get_orientation_and_dispersion_batch,
+    get_orientation_and_dispersion_strided, find_branch_windows,
+    get_branch_geometry, get_window_bounds, has_enough_points)
+from .math_utils import get_orientation_and_dispersion
+from . import np
+from numpy.testing import assert_allclose
+
+
+def random_rows(n, seed=0):
+    rng = np.random.RandomState(seed)
+    rows = np.zeros(n, dtype=[('x', 'float32'), ('y', 'float32')])
+    rows['x'] = np.cumsum(rng.randn(n))
+    rows['y'] = np.cumsum(rng.randn(n))
+    return rows
+
+
+def orientation_and_dispersion_batch_test():
+    n = 200
+    rows = random_rows(n)
+    rng = np.random.RandomState(1)
+    centers = rng.randint(0, n, size=50)
+    start = rng.randint(0, n - 12, size=50)
+    stop = start + rng.randint(2, 12, size=50)
+
+    # use small chunks to exercise the chunking logic
+    for chunk_elements, estimator in [(1, 'wrapped_std'),
+                                      (30, 'wrapped_std'),
+                                      (10000, 'wrapped_std'),
+                                      (30, 'circular_std')]:
+        orientation, dispersion = get_orientation_and_dispersion_batch(
+                    rows['x'], rows['y'],
+                    rows['x'][centers], rows['y'][centers],
+                    start, stop, chunk_elements=chunk_elements,
+                    estimator=estimator)
+
+        # (the angles are computed in single precision by the reference)
+        atol = 1e-10 if estimator == 'wrapped_std' else 1e-6
+        for k in range(len(centers)):
+            expected = get_orientation_and_dispersion(rows, center=centers[k],
+                                        indices=slice(start[k], stop[k]),
+                                        estimator=estimator)
+            assert_allclose(orientation[k], expected[0], atol=atol)
+            assert_allclose(dispersion[k], expected[1], atol=atol)
+
+
+def orientation_and_dispersion_strided_test():
+    n = 100
+    rows = random_rows(n, seed=2)
+    x, y = rows['x'], rows['y']
+    first, stop, offset, length = 10, 85, -10, 7
+    centers = np.arange(first, stop)
+
+    orientation, dispersion = get_orientation_and_dispersion_strided(x, y,
+                        offset=offset, length=length, first=first, stop=stop,
+                        chunk_elements=50)
+    expected = get_orientation_and_dispersion_batch(x, y,
+                        x[centers], y[centers],
+                        centers + offset, centers + offset + length)
+    assert_allclose(orientation, expected[0], atol=1e-10)
+    assert_allclose(dispersion, expected[1], atol=1e-10)
+
+    # only some of the centers: same values
+    subset = centers[::4]
+    sparse = get_orientation_and_dispersion_strided(x, y,
+                        offset=offset, length=length, first=first, stop=stop,
+                        chunk_elements=50, centers=subset)
+    assert np.array_equal(sparse[0], orientation[subset - first])
+    assert np.array_equal(sparse[1], dispersion[subset - first])
+
+
+def check_same_windows(generic, windows):
+    n = generic['num_points']
+    i = np.arange(n)
+    for a, b in zip(get_window_bounds(generic, i),
+                    get_window_bounds(windows, i)):
+        assert np.array_equal(a, b)
+    for min_points in [1, 2, 3, 10]:
+        assert np.array_equal(has_enough_points(generic, min_points),
+                              has_enough_points(windows, min_points))
+
+
+def uniform_windows_test():
+    ''' The uniform fast path gives the same windows as the generic one. '''
+    dt = 1.0 / 60
+    frame = np.arange(123456, 123456 + 500)
+    timestamp = frame * dt
+    for inner, outer in [(4, 10), (1, 1), (1, 3), (3.5, 7.2)]:
+        generic = find_branch_windows(timestamp, frame, inner * dt,
+                                      outer * dt, uniform_fast_path=False)
+        uniform = find_branch_windows(timestamp, frame, inner * dt,
+                                      outer * dt)
+        assert generic['dt'] is None
+        assert uniform['dt'] is not None
+        # no arrays with one element per point
+        assert not 'before_start' in uniform
+        check_same_windows(generic, uniform)
+
+    # with a gap in the frames, we use the generic path
+    frame[250:] += 1
+    assert find_branch_windows(frame * dt, frame, 4 * dt, 10 * dt)['dt'] is None
+
+
+def uniform_windows_jitter_test():
+    ''' With jittered timestamps, the fast path is used only if the 
+        windows are exactly constant offsets; the results are the same
+        in any case. '''
+    dt = 1.0 / 60
+    n = 3000
+    frame = np.arange(1000, 1000 + n)
+    rng = np.random.RandomState(3)
+    jitter = rng.uniform(-0.0009, 0.0009, size=n)
+    # (the grid is estimated from the first and last timestamps)
+    jitter[0] = jitter[-1] = 0
+    timestamp = frame * dt + jitter * dt
+    rows = random_rows(n)
+    centers = np.arange(0, n)
+    paths = set()
+    for inner, outer in [(4, 9.9995), (4, 9.99999), (3.9999, 10),
+                         (4.0004, 10.0004), (3.5, 9.5)]:
+        generic = find_branch_windows(timestamp, frame, inner * dt,
+                                      outer * dt, uniform_fast_path=False)
+        windows = find_branch_windows(timestamp, frame, inner * dt,
+                                      outer * dt)
+        paths.add(windows['dt'] is not None)
+        check_same_windows(generic, windows)
+        expected = get_branch_geometry(generic, rows['x'], rows['y'],
+                                       centers[15:-15])
+        result = get_branch_geometry(windows, rows['x'], rows['y'],
+                                     centers[15:-15])
+        for a, b in zip(expected, result):
+            assert_allclose(a, b, atol=1e-10)
+    # both paths are exercised
+    assert paths == set([True, False])
@@ -3,8 +3,7 @@ from .algorithm import geometric_saccade_detect
 from .debug_output import write_debug_output
 from .utils import (LenientOptionParser, wrap_script_entry_point,
     get_computed_string)
-from .well_formed_saccade import check_saccade_is_well_formed
-from flydra_db import safe_flydra_db_open
+from .well_formed_saccade import validate_saccades
 import os
 import warnings
 
@@ -30,6 +29,10 @@ def flydra_db_detect(args):
     parser.add_option("--nocache", help="Ignores already computed results.",
                       default=False, action="store_true")
 
+    parser.add_option("--lean", help="Does not compute (and write) the "
+                      "table of annotated rows; uses less memory.",
+                      default=False, action="store_true")
+
     # detection parameters
     dt = 1.0 / 60 # XXX: read from file
     warnings.warn('Using fixed dt = %s.' % dt)
@@ -49,6 +52,10 @@ def flydra_db_detect(args):
                       help="Maximum dispersion (deg) [= %default]")
     parser.add_option("--minimum_interval_sec", default=10 * dt, type='float',
                       help="Minimum interval between saccades. [= %default]")
+    parser.add_option("--dispersion_estimator", default='wrapped_std',
+                      type='choice', choices=['wrapped_std', 'circular_std'],
+                      help="Dispersion estimator: wrapped_std or the faster "
+                      "circular_std [= %default]")
     
     (options, args) = parser.parse_args(args)
     
@@ -58,6 +65,13 @@ def flydra_db_detect(args):
     if args:
         raise Exception('Spurious arguments')
     
+    if options.lean and options.debug_output:
+        raise Exception('--debug_output needs the annotated rows; '
+                        'cannot use it with --lean.')
+
+    # (imported here so that the options can be checked without flydra_db)
+    from flydra_db import safe_flydra_db_open
+    
         
     # Create processed string
     processed = get_computed_string('geometric_saccade_detector', __version__)
@@ -101,13 +115,14 @@ def flydra_db_detect(args):
                   'max_linear_acceleration':  options.max_linear_acceleration,
                   'min_linear_velocity': options.min_linear_velocity,
                   'max_angular_velocity': options.max_angular_velocity,
+                  'dispersion_estimator': options.dispersion_estimator,
                 }
                 
                 rows = np.array(rows[:])
-                saccades, annotated = geometric_saccade_detect(rows, params)
+                saccades, annotated = geometric_saccade_detect(rows, params,
+                                            annotate=not options.lean)
         
-                for saccade in saccades:
-                    check_saccade_is_well_formed(saccade)
+                validate_saccades(saccades, strict=True)
         
                 dt = 1.0 / 60
                 logger.info("%4d/%d %s: %d saccades for %d rows (%g saccades/s)" % 
@@ -120,10 +135,11 @@ def flydra_db_detect(args):
                              data=saccades,
                              version=saccades_table_version)
                 
-                db.set_table(sample=sample,
-                             table=annotations_table_name,
-                             data=annotated,
-                             version=saccades_table_version)
+                if annotated is not None:
+                    db.set_table(sample=sample,
+                                 table=annotations_table_name,
+                                 data=annotated,
+                                 version=saccades_table_version)
             
                 db.set_attr(sample,
                             'saccades_%s_processed' % saccades_table_version,
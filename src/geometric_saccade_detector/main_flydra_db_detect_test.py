@@ -0,0 +1,14 @@
+from .main_flydra_db_detect import flydra_db_detect
+import warnings
+
+
+def lean_debug_output_test():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            flydra_db_detect(['--db', 'nonexistent', '--lean',
+                              '--debug_output'])
+        except Exception as e:
+            assert '--lean' in str(e), e
+        else:
+            raise Exception('Expected an error.')
@@ -1,5 +1,7 @@
 import scipy.signal
 from . import np, contract
+from .circular import (wrap_pi, wrap_180, circular_mean, wrapped_std,
+    circular_std)
 
 
 def merge_fields(a, b, ignore_duplicates=False):
@@ -38,6 +40,49 @@ def merge_fields(a, b, ignore_duplicates=False):
     return c
 
 
+def merged_array(a, dtype, ignore_duplicates=False):
+    ''' 
+        Allocates an array with the fields of a (copied) followed by 
+        the fields of dtype (set to zero); this is like merge_fields(), 
+        but the new fields can be written directly without creating 
+        another array.
+        
+        Returns a tuple (c, view) where view is a view of c that
+        has only the fields of dtype.
+        
+        If a field of dtype is also in a, a ValueError is raised, 
+        unless ignore_duplicates is True; in that case, the field of a
+        is not copied.
+    '''
+    dtype = np.dtype(dtype)
+    if not ignore_duplicates:
+        for f in dtype.names:
+            if f in a.dtype.fields:
+                msg = ('Field %r is in both datatypes.\n%r\n%r' % 
+                       (f, a.dtype, dtype))
+                raise ValueError(msg)
+    
+    copied = [f for f in a.dtype.names if not f in dtype.fields]
+    new_dtype = np.dtype([(f, a.dtype[f]) for f in copied] + 
+                         [(f, dtype[f]) for f in dtype.names])
+    c = np.zeros(shape=a.shape, dtype=new_dtype)
+    for f in copied:
+        c[f] = a[f]
+    return c, fields_view(c, dtype.names)
+
+
+def fields_view(a, fields):
+    ''' 
+        Returns a view of the structured array a with only the given
+        fields (no data is copied, unlike a[fields] in old numpy).
+    '''
+    view_dtype = np.dtype({'names': list(fields),
+                           'formats': [a.dtype.fields[f][0] for f in fields],
+                           'offsets': [a.dtype.fields[f][1] for f in fields],
+                           'itemsize': a.dtype.itemsize})
+    return a.view(view_dtype)
+
+
 def find_closest_index(t, value):
     ''' Finds the index i such that t[i] is closest to value. '''
     indices = find_indices_in_bounds(t, value, t[-1])
@@ -58,27 +103,54 @@ def find_indices_in_bounds(t, lower_bound, upper_bound):
     return indices        
 
 
-def get_orientation_and_dispersion(rows, center, indices):
+def find_window_bounds(t, lower_offset, upper_offset, t_center=None):
+    ''' 
+        Vectorized version of find_indices_in_bounds for all the
+        points at once. The array t must be sorted. 
+        
+        Returns two arrays (start, stop) such that, for each i, 
+        the indices j with  
+        
+            t_center[i] + lower_offset <= t[j] <= t_center[i] + upper_offset 
+            
+        are exactly those in  slice(start[i], stop[i]).
+        If not given, t_center defaults to t.
+    '''
+    if t_center is None:
+        t_center = t
+    start = np.searchsorted(t, t_center + lower_offset, side='left')
+    stop = np.searchsorted(t, t_center + upper_offset, side='right')
+    return start, stop
+
+
+def is_sorted(t):
+    ''' Returns true if t is strictly increasing. '''
+    return bool(np.all(t[1:] > t[:-1]))
+
+
+def get_orientation_and_dispersion(rows, center, indices,
+                                   estimator='wrapped_std'):
     ''' Rows: np array with 'x','y' fields.
         center: index of point to be considered the reference.
-        indices: indices of points.
+        indices: indices of points (either an array or a slice).
+        estimator: 'wrapped_std' (std of the wrapped errors) or 
+          'circular_std' (sqrt(-2 log R)).
         
         Returns (orientation, dispersion) in radians.
     '''
-    # central point
-    p0 = np.array([rows['x'][center], rows['y'][center]])
-    
-    N = len(indices)
+    x = rows['x']
+    y = rows['y']
     # compute the angle of each point with respect to the center
-    theta = np.ndarray((N,))
-    for i in range(len(indices)):
-        j = indices[i]
-        p = np.array([rows['x'][j], rows['y'][j]])
-        diff = p - p0
-        theta[i] = np.arctan2(diff[1], diff[0])
+    theta = np.array(np.arctan2(y[indices] - y[center],
+                                x[indices] - x[center]), dtype='float64')
     
     # compute statistics of this angle distribution
-    mean, std = angle_mean_and_std(theta)
+    if estimator == 'wrapped_std':
+        mean, std = angle_mean_and_std(theta)
+    elif estimator == 'circular_std':
+        mean, std = circular_mean(theta), circular_std(theta)
+    else:
+        raise ValueError('Unknown dispersion estimator %r.' % estimator)
 
     assert not np.isnan(mean)
     assert not np.isnan(std)
@@ -94,20 +166,15 @@ def angle_mean_and_std(theta):
     '''
     assert len(theta) >= 2
     
-    C = np.cos(theta)
-    S = np.sin(theta)
-    
-    mean = np.arctan2(S.mean(), C.mean())
-    
-    error = np.array(map(normalize_pi, theta - mean))
-    std = error.std()
+    mean = circular_mean(theta)
+    std = wrapped_std(theta, mean)
     
     return mean, std
 
 
 def normalize_pi(a):
     ''' Normalizes an angle in [-pi, pi] '''
-    return np.arctan2(np.sin(a), np.cos(a))
+    return wrap_pi(a)
     
     
 def normalize_180(d):
@@ -115,12 +182,15 @@ def normalize_180(d):
         Normalizes an angle, expressed in degrees, in the [-180,180] 
         interval. 
     '''
-    return np.degrees(normalize_pi(np.radians(d)))
+    return wrap_180(d)
     
 
 @contract(x='array[K]', timestamp='array[K]', returns='array[K]')
-def compute_derivative(x, timestamp):
-    dt = timestamp[1] - timestamp[0]
+def compute_derivative(x, timestamp, dt=None):
+    ''' Derivative assuming constant sampling interval dt 
+        (by default, the first interval of timestamp). '''
+    if dt is None:
+        dt = timestamp[1] - timestamp[0]
     deriv_filter = np.array([0.5, 0, -0.5] / dt)
     if scipy.version.short_version == '0.8.0':
         d = scipy.signal.convolve(x, deriv_filter, mode='same',
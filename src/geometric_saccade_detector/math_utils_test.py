@@ -1,4 +1,5 @@
-from .math_utils import compute_derivative, merge_fields
+from .math_utils import (compute_derivative, merge_fields, merged_array,
+    find_indices_in_bounds, find_window_bounds)
 from . import np
 import unittest
 
@@ -21,6 +22,20 @@ class UtilsTest(unittest.TestCase):
         b = np.ndarray(shape=shape, dtype=[('field1', 'float64')])
         self.assertRaises(ValueError, merge_fields, a, b)
         
+    def merged_array_test(self):
+        a = np.zeros(shape=(5,), dtype=[('field1', 'uint8'), ('x', 'int32')])
+        a['x'] = np.arange(5)
+        c, view = merged_array(a, [('field2', 'float64'), ('x', 'float32')],
+                               ignore_duplicates=True)
+        self.assertEqual(['field1', 'field2', 'x'], list(c.dtype.names))
+        self.assertTrue((c['x'] == 0).all())
+        # writing to the view writes to c
+        view['field2'][2] = 3.5
+        view[1:3]['x'] = 1
+        self.assertEqual(c['field2'][2], 3.5)
+        self.assertEqual(list(c['x']), [0, 1, 1, 0, 0])
+        self.assertRaises(ValueError, merged_array, a, [('x', 'float32')])
+
     def derivative_test(self):
         
         t = np.linspace(1, 10, 20)
@@ -31,3 +46,11 @@ class UtilsTest(unittest.TestCase):
         
         self.assertTrue((dx >= 0).all())
         self.assertTrue((ddx >= 0).all())
+
+    def window_bounds_test(self):
+        t = np.cumsum(np.random.rand(100) + 0.01)
+        start, stop = find_window_bounds(t, -0.7, -0.2)
+        for i in range(len(t)):
+            indices = find_indices_in_bounds(t, t[i] - 0.7, t[i] - 0.2)
+            expected = np.arange(start[i], stop[i])
+            self.assertEqual(list(indices), list(expected))
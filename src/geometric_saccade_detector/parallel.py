@@ -0,0 +1,91 @@
+from . import np
+from .algorithm import geometric_saccade_detect_raw, assemble_saccades
+from .math_utils import merged_array
+from .structures import annotation_dtype, saccade_dtype
+from .profiling import StageProfile, get_profile
+import multiprocessing
+
+
+def geometric_saccade_detect_tracks(tracks, params, jobs=1, annotate=False,
+                                    cache=None, profile=None):
+    ''' 
+        Detects saccades in a list of tracks (for example, the rows
+        for each obj_id returned by get_good_smoothed_tracks()), 
+        using a pool of ``jobs`` processes.
+        
+        The saccades of all tracks are merged in the same array that 
+        geometric_saccade_detect() would return on the concatenation 
+        of the tracks; the result does not depend on the number of jobs.
+        
+        Returns a tuple (saccades, annotated_rows). If ``annotate`` is 
+        false, annotated_rows is None; otherwise, it is the concatenation
+        of the annotated rows of all tracks.
+        
+        The cache (a StageCache) is optional, and it can be shared 
+        by the processes. If profile (a StageProfile) is given, the 
+        times and counters of all the processes are added to it 
+        (the times are the sum over the processes).
+    '''
+    if len(tracks) == 0:
+        annotated_rows = (np.zeros(dtype=annotation_dtype, shape=(0,)) 
+                          if annotate else None)
+        return np.zeros(dtype=saccade_dtype, shape=(0,)), annotated_rows
+
+    if annotate:
+        # Allocate the result once; the annotations of each track are 
+        # written (or copied, when using a pool) directly into its fields.
+        annotated_rows, annotations = merged_array(np.concatenate(tracks),
+                                                   annotation_dtype,
+                                                   ignore_duplicates=True)
+        bounds = np.cumsum([0] + [len(rows) for rows in tracks])
+    else:
+        annotated_rows = None
+    
+    saccades = [np.zeros(dtype=saccade_dtype, shape=(0,))]
+    if jobs == 1 or len(tracks) <= 1:
+        for k, rows in enumerate(tracks):
+            if annotate:
+                track_annotations = annotations[bounds[k]:bounds[k + 1]]
+            else:
+                track_annotations = None
+            track_saccades, _ = geometric_saccade_detect_raw(rows, params,
+                                            cache=cache, annotate=annotate,
+                                            annotations=track_annotations,
+                                            profile=profile)
+            saccades.append(track_saccades)
+    else:
+        enabled = get_profile(profile).enabled
+        work = [(rows, params, annotate, cache, enabled) for rows in tracks]
+        pool = multiprocessing.Pool(processes=jobs)
+        try:
+            # results are returned in the same order as the tracks
+            results = pool.map(_detect_track, work, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        
+        for k, (track_saccades, track_annotations, track_profile) in \
+                enumerate(results):
+            saccades.append(track_saccades)
+            if annotate:
+                annotations[bounds[k]:bounds[k + 1]] = track_annotations
+            if enabled:
+                profile.merge(track_profile)
+        
+    with get_profile(profile).stage('assembly'):
+        saccades = assemble_saccades(np.concatenate(saccades))
+    return saccades, annotated_rows
+
+
+def _detect_track(args):
+    ''' Worker function: returns the saccades of one track, 
+        optionally the annotations, and the profile as a dict 
+        (or None). '''
+    rows, params, annotate, cache, enabled = args
+    profile = StageProfile() if enabled else None
+    saccades, annotations = geometric_saccade_detect_raw(rows, params,
+                                        cache=cache, annotate=annotate,
+                                        profile=profile)
+    if enabled:
+        return saccades, annotations, profile.as_dict()
+    return saccades, annotations, None
@@ -0,0 +1,35 @@
+from .algorithm import geometric_saccade_detect
+from .parallel import geometric_saccade_detect_tracks
+from .streaming_test import synthetic_track, params
+from . import np
+
+
+def parallel_test():
+    tracks = [synthetic_track(800, 1, 0, 1),
+              synthetic_track(600, 2, 0, 2),
+              synthetic_track(400, 3, 100, 3)]
+    expected, expected_annotated = geometric_saccade_detect(
+                                np.concatenate(tracks), params, annotate=True)
+    assert len(expected) > 10
+
+    for jobs in [1, 2]:
+        saccades, annotated = geometric_saccade_detect_tracks(tracks, params,
+                                                              jobs=jobs)
+        assert annotated is None
+        assert np.array_equal(saccades, expected)
+
+        saccades, annotated = geometric_saccade_detect_tracks(tracks, params,
+                                                jobs=jobs, annotate=True)
+        assert np.array_equal(saccades, expected)
+        assert annotated.dtype == expected_annotated.dtype
+        for field in expected_annotated.dtype.names:
+            assert np.array_equal(annotated[field], expected_annotated[field],
+                                  equal_nan=True), (jobs, field)
+
+
+def parallel_empty_test():
+    for annotate in [False, True]:
+        saccades, annotated = geometric_saccade_detect_tracks([], params,
+                                            jobs=2, annotate=annotate)
+        assert len(saccades) == 0
+        assert (annotated is not None) == annotate
@@ -0,0 +1,139 @@
+from . import logger
+import time
+
+
+class StageProfile(object):
+    '''
+        Records the wall time spent in each stage of a detector, and
+        some counters (points evaluated, candidates, rejections for
+        each criterion, ...). Pass it to the detectors as ``profile``::
+
+            profile = StageProfile()
+            geometric_saccade_detect(rows, params, profile=profile)
+            profile.log()
+            results = profile.as_dict()
+
+        The same profile can be used for several calls; the times and
+        the counters are accumulated.
+
+        The stages are disjoint: if a stage is entered while another
+        one is running, its time is not counted in the outer one, so
+        the times of all stages add up to the time spent in them.
+    '''
+
+    enabled = True
+
+    def __init__(self):
+        # stage -> [total time (s), number of calls]
+        self.stages = {}
+        # stage names in order of first appearance
+        self.order = []
+        self.counters = {}
+        # the running stages (_StageTimer), innermost last
+        self.running = []
+
+    def stage(self, name):
+        ''' Returns a context manager that times the stage ``name``. '''
+        return _StageTimer(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        if not name in self.stages:
+            self.stages[name] = [0.0, 0]
+            self.order.append(name)
+        self.stages[name][0] += seconds
+        self.stages[name][1] += calls
+
+    def count(self, name, n=1):
+        ''' Adds n to the counter ``name``. '''
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def as_dict(self):
+        '''
+            Returns a dict with the fields ``stages`` (a list of dicts
+            with fields ``name``, ``time``, ``calls``, in order of
+            first appearance) and ``counters`` (a dict).
+        '''
+        stages = [dict(name=name, time=self.stages[name][0],
+                       calls=self.stages[name][1]) for name in self.order]
+        return dict(stages=stages, counters=dict(self.counters))
+
+    def merge(self, d):
+        ''' Adds the values in a dict returned by as_dict(). '''
+        for stage in d['stages']:
+            self.add_time(stage['name'], stage['time'], stage['calls'])
+        for name, n in d['counters'].items():
+            self.count(name, n)
+
+    def log(self, log=None):
+        ''' Writes a summary using the given logger. '''
+        if log is None:
+            log = logger
+        log.info(str(self))
+
+    def __str__(self):
+        lines = ['Time by stage:']
+        total = sum(t for t, _ in self.stages.values())
+        for name in self.order:
+            t, calls = self.stages[name]
+            lines.append('  %-20s %9.4f s  %5.1f%%  (%d calls)' %
+                         (name, t, 100.0 * t / total if total else 0, calls))
+        lines.append('Counters:')
+        for name in sorted(self.counters):
+            lines.append('  %-30s %d' % (name, self.counters[name]))
+        return '\n'.join(lines)
+
+
+class NullProfile(object):
+    ''' A profile that records nothing; used when profiling is disabled. '''
+
+    enabled = False
+
+    def stage(self, name):
+        return _null_timer
+
+    def add_time(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+class _StageTimer(object):
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.time()
+        # time spent in the stages nested in this one
+        self.nested = 0.0
+        self.profile.running.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.time() - self.t0
+        self.profile.running.pop()
+        if self.profile.running:
+            self.profile.running[-1].nested += elapsed
+        self.profile.add_time(self.name, elapsed - self.nested)
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_timer = _NullTimer()
+
+NULL_PROFILE = NullProfile()
+
+
+def get_profile(profile):
+    ''' Returns profile, or NULL_PROFILE if it is None. '''
+    return NULL_PROFILE if profile is None else profile
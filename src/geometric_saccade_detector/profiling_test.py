@@ -0,0 +1,54 @@
+from .algorithm import geometric_saccade_detect
+from .parallel import geometric_saccade_detect_tracks
+from .profiling import StageProfile
+from .streaming_test import synthetic_track, params
+from . import np
+import time
+
+
+def profiling_test():
+    rows = np.concatenate([synthetic_track(800, 1, 0, 1),
+                           synthetic_track(600, 2, 0, 2)])
+    expected, _ = geometric_saccade_detect(rows, params, annotate=False)
+
+    profile = StageProfile()
+    saccades, _ = geometric_saccade_detect(rows, params, annotate=False,
+                                           profile=profile)
+    assert np.all(saccades['time_start'] == expected['time_start'])
+
+    d = profile.as_dict()
+    names = [stage['name'] for stage in d['stages']]
+    for name in ['validation', 'derivatives', 'smoothing', 'windows',
+                 'geometry', 'candidates', 'suppression', 'saccades',
+                 'assembly']:
+        assert name in names, name
+    counters = d['counters']
+    assert counters['rows'] == len(rows)
+    assert counters['segments'] == 2
+    # the first saccade is discarded by the assembly
+    assert counters['accepted'] == len(saccades) + 1
+    assert counters['accepted'] <= counters['candidates']
+    # each point evaluated is either a candidate or rejected by something
+    evaluated = counters['windows_evaluated'] // 2
+    assert counters['candidates'] <= evaluated <= counters['considered']
+    assert counters['rejected_min_angular_velocity'] > 0
+
+    # the workers' profiles are merged
+    tracks = [synthetic_track(800, 1, 0, 1), synthetic_track(600, 2, 0, 2)]
+    profile2 = StageProfile()
+    geometric_saccade_detect_tracks(tracks, params, jobs=2, profile=profile2)
+    assert profile2.as_dict()['counters'] == counters
+    assert str(profile2)
+
+
+def nested_stages_test():
+    profile = StageProfile()
+    with profile.stage('outer'):
+        time.sleep(0.02)
+        with profile.stage('inner'):
+            time.sleep(0.05)
+    stages = dict((s['name'], s['time']) for s in profile.as_dict()['stages'])
+    # the time of the inner stage is not counted in the outer one
+    assert 0.05 <= stages['inner']
+    assert 0.02 <= stages['outer'] < 0.05
+    assert not profile.running
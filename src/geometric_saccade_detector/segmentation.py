@@ -0,0 +1,66 @@
+from . import np
+
+
+def find_segments(obj_id, timestamp, max_gap_sec, maximum_dt_allowed=60):
+    ''' 
+        Splits the rows in contiguous segments that have the same 
+        obj_id and no gaps in the timestamps larger than ``max_gap_sec``.
+        
+        Returns a list of tuples (start, stop), such that each segment is
+        given by  slice(start, stop).
+        
+        The rows of each segment must be consecutive. Raises ValueError
+        if they are not (an obj_id appears again after the rows of 
+        another one, less than ``max_gap_sec`` after its previous row),
+        if the timestamps are not strictly increasing
+        within the same obj_id, or if there are gaps larger than 
+        ``maximum_dt_allowed`` (we allow "missing" parts from the data, 
+        but it should be at most a few seconds).
+    '''
+    n = len(timestamp)
+    if n == 0:
+        return []
+    
+    same_obj_id = obj_id[1:] == obj_id[:-1]
+    dt = np.diff(timestamp)
+    
+    # An obj_id can appear again after other ones only if a new 
+    # segment would start anyway; otherwise, the rows are interleaved.
+    first_rows = np.concatenate(([0], np.nonzero(~same_obj_id)[0] + 1))
+    last_rows = np.concatenate((first_rows[1:] - 1, [n - 1]))
+    order = np.argsort(obj_id[first_rows], kind='mergesort')
+    again = obj_id[first_rows[order[1:]]] == obj_id[first_rows[order[:-1]]]
+    previous = last_rows[order[:-1]][again]
+    following = first_rows[order[1:]][again]
+    continued = np.logical_not(timestamp[following] - timestamp[previous] > 
+                               max_gap_sec)
+    if np.any(continued):
+        i = np.min(following[continued])
+        msg = ('The rows of obj_id %s are interleaved with those of other '
+               'obj_ids (it continues at index %d/%d); group the rows by '
+               'obj_id, for example with np.argsort(obj_id, kind="mergesort").'
+               % (obj_id[i], i, n))
+        raise ValueError(msg)
+    
+    # check each consecutive pair of rows that have the same obj_id
+    # (note that this also catches NaNs)
+    invalid, = np.nonzero(np.logical_and(same_obj_id,
+                                         np.logical_not(dt > 0)))
+    if len(invalid) > 0:
+        i = invalid[0]
+        msg = ('Invalid timestamp sequence %.3f %.3f at index %d/%d '
+               '(%d invalid pairs).' % 
+               (timestamp[i], timestamp[i + 1], i, n, len(invalid)))
+        raise ValueError(msg)
+    
+    too_large, = np.nonzero(np.logical_and(same_obj_id,
+                                           dt > maximum_dt_allowed))
+    if len(too_large) > 0:
+        i = too_large[0]
+        raise ValueError('Detected dt %.3f > %.3f at index %d/%d' % 
+                         (dt[i], maximum_dt_allowed, i, n))
+    
+    breaks, = np.nonzero(np.logical_or(np.logical_not(same_obj_id),
+                                       dt > max_gap_sec))
+    bounds = np.concatenate(([0], breaks + 1, [n]))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,39 @@
+from .segmentation import find_segments
+from . import np
+
+
+def find_segments_test():
+    obj_id = np.array([1, 1, 1, 1, 2, 2, 2, 3])
+    timestamp = np.array([0, 1, 2, 5, 3, 4, 5, 0], dtype='float64')
+    segments = find_segments(obj_id, timestamp, max_gap_sec=2)
+    assert segments == [(0, 3), (3, 4), (4, 7), (7, 8)]
+
+    segments = find_segments(obj_id, timestamp, max_gap_sec=10)
+    assert segments == [(0, 4), (4, 7), (7, 8)]
+
+
+def find_segments_invalid_test():
+    obj_id = np.array([1, 1, 1, 2])
+    timestamp = np.array([0, 1, 1, 0], dtype='float64')
+    try:
+        find_segments(obj_id, timestamp, max_gap_sec=1)
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
+
+
+def find_segments_interleaved_test():
+    obj_id = np.array([1, 1, 2, 2, 1, 1])
+    timestamp = np.array([0, 1, 0, 1, 2, 3], dtype='float64')
+    try:
+        find_segments(obj_id, timestamp, max_gap_sec=1)
+    except ValueError as e:
+        assert 'index 4/6' in str(e), e
+    else:
+        raise Exception('Expected ValueError')
+
+    # after a gap, the rows of the obj_id are a new segment
+    timestamp[4:] += 5
+    segments = find_segments(obj_id, timestamp, max_gap_sec=1)
+    assert segments == [(0, 2), (2, 4), (4, 6)]
@@ -0,0 +1,362 @@
+from . import np
+from .algorithm import (check_rows, compute_kinematics, get_considered,
+    evaluate_centers, make_saccades, get_kinematic_candidates,
+    MINIMUM_SEGMENT_LENGTH)
+from .geometry import find_branch_windows, WINDOW_TOLERANCE_SEC
+from .segmentation import find_segments
+from .structures import saccade_dtype, saccade_description
+from .math_utils import normalize_180
+from .well_formed_saccade import validate_saccades
+import bisect
+import heapq
+
+# The smoothed kinematics of the rows closer than this to the ends of
+# the buffer are not the same as those computed on the whole segment.
+KINEMATICS_MARGIN = 4
+
+
+class StreamingSaccadeDetector(object):
+    '''
+        Online version of geometric_saccade_detect().
+
+        The rows are given in chunks of any size using push(), which
+        returns the saccades that have been finalized so far; finish()
+        must be called at the end of the data to obtain the rest::
+
+            detector = StreamingSaccadeDetector(params)
+            for rows in chunks:
+                saccades = detector.push(rows)
+                ...
+            saccades = detector.finish()
+
+        The rows must be in chronological order (several obj_id can be
+        interleaved, as in the flydra output). For each obj_id, only
+        the rows of the last ``deltaT_outer_sec`` (plus a few samples
+        for the smoothing) are kept, together with the candidates that
+        are still within ``minimum_interval_sec`` of undecided ones,
+        so the memory used does not depend on the length of the data.
+        A saccade is returned once no later data can change it; the
+        latency is about ``deltaT_outer_sec + minimum_interval_sec``.
+
+        The concatenation of the returned saccades is the same array
+        returned by geometric_saccade_detect() on the same rows
+        grouped by segment (same obj_id and no gaps larger than
+        ``max_gap_sec``), in the order in which the segments start;
+        for flydra data, this is the same as grouping the rows by obj_id.
+        The annotated rows are not computed.
+    '''
+
+    def __init__(self, params):
+        self.params = params
+        self.deltaT_inner_sec = params['deltaT_inner_sec']
+        self.deltaT_outer_sec = params['deltaT_outer_sec']
+        self.minimum_interval_sec = params['minimum_interval_sec']
+        self.uniform_fast_path = params.get('uniform_fast_path', True)
+        self.max_gap_sec = params.get('max_gap_sec', self.deltaT_outer_sec)
+        self.lazy_geometry = params.get('lazy_geometry', True)
+
+        assert self.deltaT_inner_sec < self.deltaT_outer_sec
+
+        # open segments, indexed by obj_id
+        self.segments = {}
+        # number of rows seen so far
+        self.num_rows = 0
+        # timestamp of the last row
+        self.latest = None
+        # accepted saccades not returned yet, as a heap of tuples
+        # (time_start, segment seq, count, saccade)
+        self.waiting = []
+        self.num_accepted = 0
+        # the last saccade returned (needed for time_passed)
+        self.previous = None
+
+    def push(self, rows):
+        '''
+            Processes a new chunk of rows; returns an array (with
+            saccade_dtype) containing the saccades finalized so far.
+        '''
+        check_rows(rows)
+        if len(rows) == 0:
+            return np.zeros(dtype=saccade_dtype, shape=(0,))
+
+        timestamp = rows['timestamp']
+        if ((self.latest is not None and timestamp[0] < self.latest) or
+            np.any(np.diff(timestamp) < 0)):
+            raise ValueError('The rows must be given in chronological order.')
+
+        # process the rows of each obj_id, in order of appearance
+        obj_id = rows['obj_id']
+        ids, first = np.unique(obj_id, return_index=True)
+        for k in np.argsort(first):
+            indices, = np.nonzero(obj_id == ids[k])
+            self._append(ids[k], rows[indices], self.num_rows + indices)
+
+        self.num_rows += len(rows)
+        self.latest = timestamp[-1]
+
+        # A segment is over if any further row of its obj_id would be
+        # separated by a gap larger than max_gap_sec.
+        for key in list(self.segments.keys()):
+            if self.latest - self.segments[key].t_last > self.max_gap_sec:
+                self._close(key)
+
+        for segment in self.segments.values():
+            self._update(segment)
+
+        return self._emit(self._frontier())
+
+    def finish(self):
+        '''
+            Signals the end of the data; returns an array with the
+            remaining saccades.
+        '''
+        for key in list(self.segments.keys()):
+            self._close(key)
+        return self._emit(None)
+
+    def _append(self, obj_id, rows, numbers):
+        ''' Adds the rows of one obj_id; numbers are their positions
+            in the whole stream. '''
+        timestamp = rows['timestamp']
+        segment = self.segments.get(obj_id, None)
+        # include the last row of the open segment to check continuity
+        if segment is not None:
+            timestamp = np.concatenate(([segment.t_last], timestamp))
+        pieces = find_segments(np.zeros(len(timestamp)), timestamp,
+                               self.max_gap_sec)
+        if segment is not None:
+            pieces = [(max(a - 1, 0), b - 1) for a, b in pieces]
+            start, stop = pieces.pop(0)
+            segment.append(rows[start:stop])
+            if pieces:
+                self._close(obj_id)
+        for start, stop in pieces:
+            if obj_id in self.segments:
+                self._close(obj_id)
+            self.segments[obj_id] = _Segment(seq=numbers[start],
+                                             rows=rows[start:stop])
+
+    def _close(self, obj_id):
+        segment = self.segments.pop(obj_id)
+        segment.closed = True
+        self._update(segment)
+
+    def _update(self, segment):
+        ''' Evaluates the centers of segment that are ready,
+            decides the candidates, and trims the buffer. '''
+        self._evaluate(segment)
+
+        rows = segment.rows
+        timestamp = rows['timestamp']
+        next_center = segment.next_center - segment.first
+        # all future candidates are after this time
+        if segment.closed:
+            horizon = None
+        elif next_center < len(rows):
+            horizon = timestamp[next_center]
+        else:
+            horizon = segment.t_last
+        self._suppress(segment, horizon)
+
+        if not segment.closed:
+            # Future centers cannot use the rows before
+            # timestamp[next_center] - deltaT_outer_sec.
+            keep = np.searchsorted(timestamp,
+                        timestamp[next_center] - self.deltaT_outer_sec
+                        - WINDOW_TOLERANCE_SEC)
+            keep = max(0, min(keep, next_center - KINEMATICS_MARGIN))
+            segment.rows = rows[keep:]
+            segment.first += keep
+
+    def _evaluate(self, segment):
+        rows = segment.rows
+        n = len(rows)
+        if segment.first + n < MINIMUM_SEGMENT_LENGTH:
+            return
+        timestamp = rows['timestamp']
+        outer = self.deltaT_outer_sec
+        inner = self.deltaT_inner_sec
+
+        start = segment.next_center - segment.first
+        if segment.closed:
+            stop = n
+        else:
+            # the "after" window must be complete, and the
+            # kinematics must not depend on the end of the buffer
+            stop = np.count_nonzero(timestamp + outer + WINDOW_TOLERANCE_SEC
+                                    < timestamp[-1])
+            stop = min(stop, n - KINEMATICS_MARGIN)
+        if stop <= start:
+            return
+
+        kinematics = compute_kinematics(timestamp, rows['xvel'], rows['yvel'],
+                                        dt=segment.dt)
+        # If the segment is not over, the real end is later, but this
+        # does not change the result for the centers we consider.
+        enough_log = np.logical_and(timestamp - segment.t0 >= outer,
+                                    timestamp[-1] - timestamp >= inner)
+        windows = find_branch_windows(timestamp, rows['frame'], inner, outer,
+                                      uniform_fast_path=self.uniform_fast_path)
+        considered = np.logical_and(enough_log,
+                                    get_considered(kinematics, windows))
+        considered[:start] = False
+        considered[stop:] = False
+        c, = np.nonzero(considered)
+        if self.lazy_geometry:
+            c = c[get_kinematic_candidates(kinematics, c, self.params)]
+
+        evaluation = evaluate_centers(rows, kinematics, windows, c,
+                                      self.params)
+        selected, = np.nonzero(evaluation['candidate'])
+        saccades = make_saccades(rows, kinematics, evaluation, c, selected,
+                                 outer)
+        for k, saccade in zip(selected, saccades):
+            # same order as suppress_non_maxima()
+            priority = (-evaluation['preference'][k], segment.first + c[k])
+            segment.pending.append((priority, timestamp[c[k]], saccade))
+
+        segment.next_center = segment.first + stop
+
+    def _suppress(self, segment, horizon):
+        '''
+            Incremental version of suppress_non_maxima(): a candidate is
+            accepted if no candidate with higher preference in conflict
+            with it is accepted. We decide it once all those are decided,
+            and no future candidate (after horizon) can be in conflict.
+        '''
+        interval = self.minimum_interval_sec
+        accepted_times = segment.accepted_times
+        segment.pending.sort(key=lambda x: x[0])
+        pending = []
+        # times of the undecided candidates with higher preference
+        pending_times = []
+        for candidate in segment.pending:
+            _, t, saccade = candidate
+            if _in_conflict(accepted_times, t, interval):
+                continue
+            if ((horizon is None or t < horizon - interval) and
+                not _in_conflict(pending_times, t, interval)):
+                bisect.insort(accepted_times, t)
+                heapq.heappush(self.waiting,
+                               (saccade['time_start'].item(), segment.seq,
+                                self.num_accepted, saccade))
+                self.num_accepted += 1
+            else:
+                bisect.insort(pending_times, t)
+                pending.append(candidate)
+        segment.pending = pending
+
+        # forget the accepted times that cannot be in conflict anymore
+        if horizon is not None:
+            oldest = min([horizon] + pending_times)
+            k = 0
+            while (k < len(accepted_times) and
+                   accepted_times[k] + interval < oldest):
+                k += 1
+            del accepted_times[:k]
+
+    def _frontier(self):
+        ''' Returns a time such that all the saccades not found yet
+            will have time_middle >= this time. '''
+        frontier = self.latest
+        for segment in self.segments.values():
+            times = [t for _, t, _ in segment.pending]
+            next_center = segment.next_center - segment.first
+            if next_center < len(segment.rows):
+                times.append(segment.rows['timestamp'][next_center])
+            frontier = min([frontier] + times)
+        return frontier
+
+    def _emit(self, frontier):
+        ''' Returns the waiting saccades with
+            time_start < frontier - deltaT_outer_sec (all if None). '''
+        saccades = []
+        while self.waiting and (frontier is None or self.waiting[0][0] <
+                                frontier - self.deltaT_outer_sec):
+            saccades.append(heapq.heappop(self.waiting)[-1])
+        saccades, self.previous = link_saccades(saccades, self.previous)
+        return saccades
+
+
+def link_saccades(saccades, previous):
+    '''
+        Computes time_passed and smooth_displacement for a list of
+        saccades in chronological order, which follow the saccade
+        previous (None at the beginning of the data, in which case
+        the first saccade is discarded, as in assemble_saccades()).
+
+        Returns a tuple (array, last), where array has saccade_dtype
+        and last is the saccade to use as previous next time.
+    '''
+    linked = []
+    for saccade in saccades:
+        if previous is None:
+            previous = saccade
+            continue
+        time_passed = saccade['time_start'] - previous['time_start']
+        same_track = saccade['obj_id'] == previous['obj_id']
+        if time_passed < 0 or (time_passed == 0 and same_track):
+            msg = ('Invalid value of time_passed computed.\n%s\n%s'
+                   % (saccade_description(previous),
+                      saccade_description(saccade)))
+            raise Exception(msg)
+        saccade['time_passed'] = time_passed
+        saccade['smooth_displacement'] = \
+            normalize_180(saccade['orientation_start'] -
+                          previous['orientation_stop'])
+        linked.append(saccade)
+        previous = saccade
+
+    saccades_array = np.zeros(dtype=saccade_dtype, shape=(len(linked),))
+    for i, saccade in enumerate(linked):
+        saccades_array[i] = saccade
+    validate_saccades(saccades_array, strict=True)
+    return saccades_array, previous
+
+
+class _Segment(object):
+    ''' State of the detection for a segment of one obj_id. '''
+
+    def __init__(self, seq, rows):
+        # position of the first row in the stream (used for ordering)
+        self.seq = seq
+        # buffer with the last rows of the segment
+        self.rows = rows
+        # index in the segment of rows[0]
+        self.first = 0
+        # index in the segment of the next center to evaluate
+        self.next_center = 0
+        self.t0 = rows['timestamp'][0]
+        self.t_last = rows['timestamp'][-1]
+        # sampling interval used for the derivatives
+        self.dt = None
+        self._set_dt()
+        self.closed = False
+        # undecided candidates, as tuples (priority, time, saccade)
+        self.pending = []
+        # sorted times of the recently accepted candidates
+        self.accepted_times = []
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return
+        self.rows = np.concatenate((self.rows, rows))
+        self.t_last = rows['timestamp'][-1]
+        self._set_dt()
+
+    def _set_dt(self):
+        # like compute_derivative(), use the first interval of the segment
+        if self.dt is None and len(self.rows) >= 2:
+            assert self.first == 0
+            self.dt = self.rows['timestamp'][1] - self.rows['timestamp'][0]
+
+
+def _in_conflict(times, t, interval):
+    ''' Same test as suppress_non_maxima(): checks whether t is within
+        interval of one of the (sorted) times. '''
+    k = bisect.bisect_left(times, t)
+    if k > 0 and t <= times[k - 1] + interval:
+        return True
+    if k < len(times) and t >= times[k] - interval:
+        return True
+    return False
@@ -0,0 +1,69 @@
+from .algorithm import geometric_saccade_detect
+from .streaming import StreamingSaccadeDetector
+from . import np
+from numpy.testing import assert_allclose
+
+params = {
+    'deltaT_inner_sec': 4 / 60.0,
+    'deltaT_outer_sec': 10 / 60.0,
+    'min_amplitude_deg': 25,
+    'max_orientation_dispersion_deg': 15,
+    'min_linear_velocity': 0.1,
+    'max_linear_acceleration': 20,
+    'max_angular_velocity': 8000,
+    'minimum_interval_sec': 10 / 60.0
+}
+
+rows_dtype = [('timestamp', 'float64'), ('obj_id', 'int'), ('frame', 'int'),
+              ('x', 'float32'), ('y', 'float32'), ('z', 'float32'),
+              ('xvel', 'float32'), ('yvel', 'float32'), ('zvel', 'float32')]
+
+
+def synthetic_track(n, obj_id, frame0, seed, dt=1 / 60.0):
+    ''' A random walk in heading, with sudden turns. '''
+    rng = np.random.RandomState(seed)
+    turns = np.zeros(n)
+    for k in np.nonzero(rng.rand(n) < 0.02)[0]:
+        turns[k:k + 5] += np.radians(rng.uniform(40, 120) / 5 *
+                                     rng.choice([-1, 1]))
+    heading = np.cumsum(turns + rng.normal(0, 0.01, n))
+    velocity = 0.3 * (1 + 0.1 * rng.normal(size=n))
+    rows = np.zeros(n, dtype=rows_dtype)
+    rows['frame'] = frame0 + np.arange(n)
+    rows['timestamp'] = rows['frame'] * dt
+    rows['obj_id'] = obj_id
+    rows['xvel'] = velocity * np.cos(heading)
+    rows['yvel'] = velocity * np.sin(heading)
+    rows['x'] = np.cumsum(rows['xvel']) * dt
+    rows['y'] = np.cumsum(rows['yvel']) * dt
+    return rows
+
+
+def streaming_test():
+    tracks = [synthetic_track(800, 1, 0, 1),
+              synthetic_track(700, 2, 100, 2),
+              synthetic_track(300, 3, 850, 3)]
+    # the batch detector sees the rows grouped by obj_id
+    expected, _ = geometric_saccade_detect(np.concatenate(tracks), params)
+    assert len(expected) > 10
+
+    # the stream has the rows in chronological order
+    stream = np.concatenate(tracks)
+    stream = stream[np.argsort(stream['timestamp'], kind='mergesort')]
+
+    for chunk in [3, 50, len(stream)]:
+        detector = StreamingSaccadeDetector(params)
+        results = []
+        for i in range(0, len(stream), chunk):
+            results.append(detector.push(stream[i:i + chunk]))
+            # only a short history is kept
+            for segment in detector.segments.values():
+                assert len(segment.rows) < 30
+        results.append(detector.finish())
+        saccades = np.concatenate(results)
+
+        assert len(saccades) == len(expected)
+        for field in ['time_start', 'time_passed', 'amplitude', 'sign',
+                      'orientation_start', 'smooth_displacement', 'frame',
+                      'obj_id']:
+            assert_allclose(saccades[field], expected[field], atol=1e-8)
@@ -0,0 +1,69 @@
+from . import np
+import bisect
+
+
+def suppress_non_maxima(timestamp, preference, candidates, minimum_interval):
+    ''' 
+        Greedy non-maximum suppression.
+        
+        Visits the candidates in order of decreasing preference, and
+        accepts each one unless it is within ``minimum_interval`` of
+        a point already accepted; that is, the candidate j is discarded 
+        if there is an accepted i such that
+        
+            timestamp[i] - minimum_interval <= timestamp[j] 
+                                            <= timestamp[i] + minimum_interval
+        
+        timestamp, preference: arrays with one element per point.
+        candidates: indices of the points to consider.
+        
+        Returns the indices of the accepted points, in order of preference.
+        Ties are broken by index, so the result is deterministic.
+        
+        Only the candidates are sorted, and each conflict check is a 
+        bisection over the accepted times, so the cost is O(S log S)
+        for S candidates, independently of the number of points.
+    '''
+    candidates = np.asarray(candidates, dtype='int64')
+    order = np.argsort(-preference[candidates], kind='mergesort')
+    
+    accepted = []
+    # times of the accepted points, kept sorted
+    accepted_times = []
+    for j in candidates[order]:
+        t = timestamp[j]
+        k = bisect.bisect_left(accepted_times, t)
+        # the closest accepted points before and after are the only
+        # ones that can be in conflict
+        if k > 0 and t <= accepted_times[k - 1] + minimum_interval:
+            continue
+        if (k < len(accepted_times) and 
+            t >= accepted_times[k] - minimum_interval):
+            continue
+        accepted_times.insert(k, t)
+        accepted.append(j)
+        
+    return np.array(accepted, dtype='int64')
+
+
+def count_nearby(timestamp, centers, interval):
+    ''' 
+        For each point j, counts the number of centers i such that 
+        
+            timestamp[i] - interval <= timestamp[j] 
+                                    <= timestamp[i] + interval
+         
+        (this is the "marked_as_used" annotation of the detector.)
+    '''
+    n = len(timestamp)
+    order = np.argsort(timestamp, kind='mergesort')
+    sorted_timestamp = timestamp[order]
+    t = timestamp[np.asarray(centers, dtype='int64')]
+    lower = np.searchsorted(sorted_timestamp, t - interval, side='left')
+    upper = np.searchsorted(sorted_timestamp, t + interval, side='right')
+    delta = np.zeros(n + 1, dtype='int64')
+    np.add.at(delta, lower, 1)
+    np.add.at(delta, upper, -1)
+    counts = np.empty(n, dtype='int64')
+    counts[order] = np.cumsum(delta[:-1])
+    return counts
@@ -0,0 +1,39 @@
+from .suppression import suppress_non_maxima, count_nearby
+from .math_utils import find_indices_in_bounds
+from . import np
+
+
+def reference_suppression(timestamp, preference, candidates, interval):
+    ''' The original implementation, scanning all the points. '''
+    marked = np.zeros(len(timestamp), dtype='int')
+    accepted = []
+    for i in sorted(candidates, key=lambda i: -preference[i]):
+        if marked[i]:
+            continue
+        accepted.append(i)
+        nearby = find_indices_in_bounds(timestamp, timestamp[i] - interval,
+                                        timestamp[i] + interval)
+        marked[nearby] += 1
+    return accepted, marked
+
+
+def suppression_test():
+    rng = np.random.RandomState(0)
+    n = 500
+    timestamp = np.arange(n) / 60.0
+    preference = rng.rand(n)
+    candidates, = np.nonzero(rng.rand(n) > 0.6)
+    interval = 10 / 60.0
+
+    accepted = suppress_non_maxima(timestamp, preference, candidates, interval)
+    expected, marked = reference_suppression(timestamp, preference,
+                                             candidates, interval)
+    assert list(accepted) == list(expected)
+    assert np.all(count_nearby(timestamp, accepted, interval) == marked)
+
+
+def suppression_empty_test():
+    timestamp = np.arange(10) / 60.0
+    accepted = suppress_non_maxima(timestamp, np.zeros(10), [], 1.0)
+    assert len(accepted) == 0
+    assert np.all(count_nearby(timestamp, accepted, 1.0) == 0)
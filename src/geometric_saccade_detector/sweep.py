@@ -0,0 +1,115 @@
+from . import np
+from .algorithm import (check_rows, compute_kinematics, get_segment_geometry,
+    get_candidates, make_saccades, assemble_saccades,
+    MINIMUM_SEGMENT_LENGTH)
+from .cache import cached_stage
+from .geometry import DEFAULT_DISPERSION_ESTIMATOR
+from .segmentation import find_segments
+from .suppression import suppress_non_maxima
+from .structures import saccade_dtype
+
+# Parameters that are only used as thresholds on the precomputed values.
+THRESHOLD_PARAMS = ['min_amplitude_deg', 'max_orientation_dispersion_deg',
+                    'min_linear_velocity', 'max_linear_acceleration',
+                    'max_angular_velocity']
+
+
+def geometric_saccade_detect_sweep(rows, param_sets, cache=None):
+    '''
+        Runs geometric_saccade_detect() on the same rows for each of
+        the parameter dicts in ``param_sets``, sharing the computation
+        between them; returns the list of the saccade arrays
+        (the annotated rows are not computed).
+
+        The kinematics of each segment are computed only once, the
+        geometry once for each distinct value of
+        (``max_gap_sec``, ``deltaT_inner_sec``, ``deltaT_outer_sec``,
+        ``dispersion_estimator``),
+        and the thresholds are checked for all the sets at once.
+        Only the non-maximum suppression is done for each set.
+        The result is the same as calling geometric_saccade_detect()
+        for each set.
+        
+        If cache (a StageCache) is given, the kinematics and the 
+        geometry are also memoized on disk.
+    '''
+    minimum_acceptable_length = 30
+
+    check_rows(rows)
+    if len(rows) <= minimum_acceptable_length:
+        raise ValueError('I cannot do much with only %s entries.' % len(rows))
+
+    timestamp = rows['timestamp']
+
+    # group the sets that have the same windows
+    groups = {}
+    for k, params in enumerate(param_sets):
+        deltaT_outer_sec = params['deltaT_outer_sec']
+        key = (params.get('max_gap_sec', deltaT_outer_sec),
+               params['deltaT_inner_sec'], deltaT_outer_sec,
+               params.get('uniform_fast_path', True),
+               params.get('dispersion_estimator',
+                          DEFAULT_DISPERSION_ESTIMATOR))
+        groups.setdefault(key, []).append(k)
+
+    # kinematics of each segment, indexed by (start, stop)
+    segment_kinematics = {}
+
+    results = [None] * len(param_sets)
+    for key, members in groups.items():
+        (max_gap_sec, deltaT_inner_sec, deltaT_outer_sec, uniform_fast_path,
+         estimator) = key
+        assert deltaT_inner_sec < deltaT_outer_sec
+
+        # thresholds as arrays of shape (P, 1)
+        thresholds = {}
+        for name in THRESHOLD_PARAMS:
+            values = [param_sets[k][name] for k in members]
+            thresholds[name] = np.array(values, dtype='float64')[:, np.newaxis]
+
+        saccades = dict((k, [np.zeros(dtype=saccade_dtype, shape=(0,))])
+                        for k in members)
+
+        segments = find_segments(rows['obj_id'], timestamp, max_gap_sec)
+        for start, stop in segments:
+            if stop - start < MINIMUM_SEGMENT_LENGTH:
+                continue
+            segment = rows[start:stop]
+            t = segment['timestamp']
+
+            if not (start, stop) in segment_kinematics:
+                segment_kinematics[(start, stop)] = cached_stage(cache,
+                    'kinematics', [t, segment['xvel'], segment['yvel']], {},
+                    lambda: compute_kinematics(t, segment['xvel'],
+                                               segment['yvel']))
+            kinematics = segment_kinematics[(start, stop)]
+
+            geometry = cached_stage(cache, 'geometry',
+                    [t, segment['frame'], segment['x'], segment['y'],
+                     segment['xvel'], segment['yvel']],
+                    {'deltaT_inner_sec': deltaT_inner_sec,
+                     'deltaT_outer_sec': deltaT_outer_sec,
+                     'uniform_fast_path': uniform_fast_path,
+                     'dispersion_estimator': estimator},
+                    lambda: get_segment_geometry(segment, kinematics,
+                                                 deltaT_inner_sec,
+                                                 deltaT_outer_sec,
+                                                 uniform_fast_path,
+                                                 estimator))
+            c = geometry.pop('center')
+
+            # one row for each set
+            candidate = get_candidates(kinematics, geometry, c, thresholds)
+
+            for row, k in enumerate(members):
+                accepted = suppress_non_maxima(t[c], geometry['preference'],
+                            np.nonzero(candidate[row])[0],
+                            param_sets[k]['minimum_interval_sec'])
+                saccades[k].append(make_saccades(segment, kinematics,
+                                                 geometry, c, accepted,
+                                                 deltaT_outer_sec))
+
+        for k in members:
+            results[k] = assemble_saccades(np.concatenate(saccades[k]))
+
+    return results
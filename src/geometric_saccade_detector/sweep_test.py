@@ -0,0 +1,29 @@
+from .algorithm import geometric_saccade_detect
+from .sweep import geometric_saccade_detect_sweep
+from .streaming_test import params, synthetic_track
+from . import np
+from numpy.testing import assert_allclose
+
+
+def sweep_test():
+    rows = np.concatenate([synthetic_track(600, 1, 0, 1),
+                           synthetic_track(400, 2, 0, 2)])
+    param_sets = []
+    for deltaT_inner_sec in [3 / 60.0, 4 / 60.0]:
+        for min_amplitude_deg in [15, 25, 40]:
+            for minimum_interval_sec in [5 / 60.0, 10 / 60.0]:
+                p = dict(params)
+                p['deltaT_inner_sec'] = deltaT_inner_sec
+                p['min_amplitude_deg'] = min_amplitude_deg
+                p['minimum_interval_sec'] = minimum_interval_sec
+                param_sets.append(p)
+    param_sets[-1]['max_gap_sec'] = 0.5
+
+    results = geometric_saccade_detect_sweep(rows, param_sets)
+    assert len(results) == len(param_sets)
+    for p, saccades in zip(param_sets, results):
+        expected, _ = geometric_saccade_detect(rows, p)
+        assert len(saccades) == len(expected)
+        for field in ['time_start', 'time_passed', 'amplitude',
+                      'smooth_displacement', 'frame', 'obj_id']:
+            assert_allclose(saccades[field], expected[field])
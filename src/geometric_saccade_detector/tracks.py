@@ -0,0 +1,51 @@
+from . import np
+
+
+def concatenate_tracks(tracks, dtype, capacity):
+    '''
+        Copies the tracks, given as an iterable of tuples
+        (obj_id, array), in a single array with the given dtype
+        (only its fields are copied). The tracks can be produced
+        one at a time (for example, by a generator loading them):
+        each is copied as soon as it is given, and not kept.
+
+        The result is allocated with ``capacity`` rows (the expected
+        total length); it is enlarged if the tracks turn out to be
+        longer.
+
+        Returns a tuple (obj_ids, rows, bounds): the rows of the track
+        obj_ids[k] are rows[bounds[k]:bounds[k+1]].
+    '''
+    rows = np.empty(shape=(capacity,), dtype=dtype)
+    obj_ids = []
+    bounds = [0]
+    for obj_id, a in tracks:
+        start = bounds[-1]
+        stop = start + len(a)
+        if stop > len(rows):
+            larger = np.empty(shape=(max(stop, len(rows) * 3 // 2),),
+                              dtype=dtype)
+            larger[:start] = rows[:start]
+            rows = larger
+        extract_interesting_fields(a, rows.dtype, out=rows[start:stop])
+        obj_ids.append(obj_id)
+        bounds.append(stop)
+    return obj_ids, rows[:bounds[-1]], np.array(bounds)
+
+
+def check_increasing_frames(frows):
+    ''' Checks that the frames of each obj_id are increasing. '''
+    same = frows['obj_id'][1:] == frows['obj_id'][:-1]
+    frame = frows['frame']
+    assert np.all(frame[1:][same] > frame[:-1][same])
+
+
+def extract_interesting_fields(a, dtype, out=None):
+    ''' Returns a copy of a with only the fields in dtype
+        (written in out, if given). '''
+    if out is None:
+        out = np.ndarray(shape=a.shape, dtype=dtype)
+    for field in dtype.fields:
+        out[field] = a[field]
+
+    return out
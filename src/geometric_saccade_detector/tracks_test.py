@@ -0,0 +1,69 @@
+from .tracks import (concatenate_tracks, check_increasing_frames,
+    extract_interesting_fields)
+from .structures import rows_dtype
+from . import np
+
+
+def flydra_rows(obj_id, n, first_frame=0):
+    ''' An array like the ones returned by flydra, with more fields
+        than rows_dtype. '''
+    dtype = rows_dtype + [('P00', 'float64'), ('timestamp2', 'float64')]
+    a = np.zeros(n, dtype=dtype)
+    a['obj_id'] = obj_id
+    a['frame'] = first_frame + np.arange(n)
+    a['x'] = np.linspace(0, 1, n)
+    a['P00'] = -1
+    return a
+
+
+def check_increasing_frames_test():
+    check_increasing_frames(flydra_rows(1, 10))
+    check_increasing_frames(flydra_rows(1, 0))
+    # the frames can restart for a different obj_id
+    check_increasing_frames(np.concatenate([flydra_rows(1, 10, 100),
+                                            flydra_rows(2, 10, 0)]))
+    for frame in [4, 3]:
+        a = flydra_rows(1, 10)
+        a['frame'][5] = frame
+        try:
+            check_increasing_frames(a)
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Expected failure with frame %d.' % frame)
+
+
+def extract_interesting_fields_test():
+    a = flydra_rows(3, 20)
+    dtype = np.dtype(rows_dtype)
+    copy = extract_interesting_fields(a, dtype)
+    assert copy.dtype == dtype
+    for field in dtype.names:
+        assert np.all(copy[field] == a[field])
+
+    # written in a view of a larger array
+    out = np.zeros(50, dtype=dtype)
+    result = extract_interesting_fields(a, dtype, out=out[10:30])
+    assert np.shares_memory(result, out)
+    assert np.all(out['x'][10:30] == a['x'])
+    assert np.all(out['obj_id'][:10] == 0)
+    assert np.all(out['obj_id'][30:] == 0)
+
+
+def concatenate_tracks_test():
+    tracks = [(1, flydra_rows(1, 10)), (2, flydra_rows(2, 5, 100)),
+              (4, flydra_rows(4, 7))]
+    expected = extract_interesting_fields(
+        np.concatenate([a for _, a in tracks]), np.dtype(rows_dtype))
+    # exact, smaller and larger capacity
+    for capacity in [22, 0, 12, 30]:
+        obj_ids, rows, bounds = concatenate_tracks(iter(tracks), rows_dtype,
+                                                   capacity)
+        assert obj_ids == [1, 2, 4]
+        assert list(bounds) == [0, 10, 15, 22]
+        assert len(rows) == 22
+        for field in rows.dtype.names:
+            assert np.all(rows[field] == expected[field]), field
+
+    obj_ids, rows, bounds = concatenate_tracks([], rows_dtype, 10)
+    assert obj_ids == [] and len(rows) == 0 and list(bounds) == [0]
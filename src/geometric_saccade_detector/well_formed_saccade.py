@@ -1,20 +1,21 @@
 from . import np 
 
+# These fields must have finite values.
+check_not_nan = [
+    'time_start',
+    'time_stop',
+    'orientation_start',
+    'orientation_stop',
+    'time_passed',
+    'sign',
+    'amplitude',
+    'duration',
+    'top_velocity',
+]
+
 
 def check_saccade_is_well_formed(saccade):
     
-    check_not_nan = [
-        'time_start',
-        'time_stop',
-        'orientation_start',
-        'orientation_stop',
-        'time_passed',
-        'sign',
-        'amplitude',
-        'duration',
-        'top_velocity',
-    ]
-    
     try: 
         for x in check_not_nan:
             if not np.isfinite(saccade[x]):
@@ -37,3 +38,42 @@ def check_saccade_is_well_formed(saccade):
         msg = str(e)
         msg += '\n\tDType: %s\n\tvalues: %s' % (saccade.dtype, str(saccade))
         raise Exception(msg)
+
+
+def validate_saccades(saccades, strict=False):
+    ''' 
+        Checks a whole array of saccades at once, using the same rules
+        as check_saccade_is_well_formed().
+        
+        Returns a tuple (valid, report), where valid is a boolean array
+        and report is a dict that maps the name of each rule that 
+        failed to the indices of the saccades that do not satisfy it.
+        
+        If strict is True, the first invalid saccade raises the same 
+        Exception as check_saccade_is_well_formed().
+    '''
+    rules = []
+    for x in check_not_nan:
+        rules.append(('finite_%s' % x, np.isfinite(saccades[x])))
+    rules.append(('time_stop_after_time_start',
+                  saccades['time_stop'] > saccades['time_start']))
+    rules.append(('sign', np.logical_or(saccades['sign'] == -1,
+                                        saccades['sign'] == 1)))
+    rules.append(('finite_position',
+                  np.isfinite(saccades['position']).all(axis=-1)))
+    
+    valid = np.ones(len(saccades), dtype='bool')
+    report = {}
+    for rule, satisfied in rules:
+        valid &= satisfied
+        failed, = np.nonzero(np.logical_not(satisfied))
+        if len(failed) > 0:
+            report[rule] = failed
+    
+    if strict and not np.all(valid):
+        first = np.nonzero(np.logical_not(valid))[0][0]
+        check_saccade_is_well_formed(saccades[first])
+        # the two functions should agree
+        raise Exception('Invalid saccade %d: %s' % (first, sorted(report)))
+    
+    return valid, report
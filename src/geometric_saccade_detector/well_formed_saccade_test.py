@@ -0,0 +1,36 @@
+from .well_formed_saccade import (validate_saccades,
+    check_saccade_is_well_formed)
+from .algorithm_test import random_saccades
+from . import np
+
+
+def validate_saccades_test():
+    saccades = random_saccades(10)
+    valid, report = validate_saccades(saccades)
+    assert np.all(valid) and report == {}
+
+    saccades['amplitude'][2] = np.nan
+    saccades['sign'][5] = 0
+    saccades['position'][5, 1] = np.inf
+    saccades['time_stop'][7] = saccades['time_start'][7]
+    valid, report = validate_saccades(saccades)
+    assert list(np.nonzero(np.logical_not(valid))[0]) == [2, 5, 7]
+    assert list(report['finite_amplitude']) == [2]
+    assert list(report['sign']) == [5]
+    assert list(report['finite_position']) == [5]
+    assert list(report['time_stop_after_time_start']) == [7]
+
+    # same result as checking one at a time
+    for i in range(len(saccades)):
+        try:
+            check_saccade_is_well_formed(saccades[i])
+            assert valid[i]
+        except Exception:
+            assert not valid[i]
+
+    try:
+        validate_saccades(saccades, strict=True)
+    except Exception as e:
+        assert 'amplitude' in str(e)
+    else:
+        raise Exception('Expected an exception in strict mode.')